@@ -0,0 +1,105 @@
+"""
+Who is talking: per-user speaking activity from received Mumble audio.
+
+An ActivityTracker keeps one slot per remote user session in fixed numpy
+arrays: channel, time of the last packet, a peak level that decays between
+packets, and a count of talk spurts. update() runs on pymumble's receive
+thread for every packet and only writes into those arrays; the level decay
+is applied lazily when a snapshot is taken.
+"""
+import math
+import threading
+import numpy as np
+
+SPURT_GAP = 0.3         # seconds of silence that end a talk spurt
+LEVEL_TAU = 0.3         # seconds for the level meter to decay by 1/e
+RECENT    = 30.0        # seconds a user stays listed after their last packet
+
+
+class ActivityTracker:
+    """
+    Speaking activity for up to `capacity` users; when full, the user heard
+    least recently is evicted.
+    """
+    def __init__(self, capacity=256):
+        self._slots   = {}                      # session -> slot index
+        self._free    = list(range(capacity - 1, -1, -1))
+        self.session  = np.full(capacity, -1, dtype=np.int64)
+        self.channel  = np.zeros(capacity, dtype=np.int64)
+        self.last     = np.zeros(capacity, dtype=np.float64)   # last packet time
+        self.start    = np.zeros(capacity, dtype=np.float64)   # current spurt start
+        self.level    = np.zeros(capacity, dtype=np.float32)   # peak, 0..1
+        self.spurts   = np.zeros(capacity, dtype=np.int32)
+        self._lock    = threading.Lock()
+
+    def _claim(self, session):
+        # caller holds _lock
+        if self._free:
+            i = self._free.pop()
+        else:
+            i = int(np.argmin(self.last))
+            del self._slots[int(self.session[i])]
+        self._slots[session] = i
+        self.session[i] = session
+        self.last[i] = self.level[i] = self.spurts[i] = 0
+        return i
+
+    def update(self, session, channel_id, pcm, now):
+        """Record one packet; returns True if it starts a new talk spurt."""
+        x = np.frombuffer(pcm, dtype=np.int16)
+        peak = max(int(x.max()), -int(x.min())) / 32768.0 if len(x) else 0.0
+        with self._lock:
+            i = self._slots.get(session)
+            if i is None:
+                i = self._claim(session)
+            gap = now - float(self.last[i])
+            self.level[i] = max(peak, self.level[i] * math.exp(-gap / LEVEL_TAU))
+            new_spurt = gap > SPURT_GAP
+            if new_spurt:
+                self.spurts[i] += 1
+                self.start[i] = now
+            self.last[i] = now
+            self.channel[i] = channel_id
+        return new_spurt
+
+    def remove(self, session):
+        with self._lock:
+            i = self._slots.pop(session, None)
+            if i is not None:
+                self.session[i] = -1
+                self._free.append(i)
+
+    def clear(self):
+        with self._lock:
+            for i in self._slots.values():
+                self.session[i] = -1
+                self._free.append(i)
+            self._slots.clear()
+
+    def any_recent(self, now, window=SPURT_GAP + LEVEL_TAU):
+        """True if anyone was heard within `window`, i.e. meters still move."""
+        with self._lock:
+            return bool(self._slots) and float(self.last.max()) > now - window
+
+    def snapshot(self, now, window=RECENT):
+        """
+        [{session, channel_id, talking, level, spurts, talk_s}] for every user
+        heard within `window` seconds, loudest first.
+        """
+        with self._lock:
+            rows = []
+            for session, i in self._slots.items():
+                age = now - float(self.last[i])
+                if age > window:
+                    continue
+                talking = age <= SPURT_GAP
+                rows.append({
+                    'session':    session,
+                    'channel_id': int(self.channel[i]),
+                    'talking':    talking,
+                    'level':      float(self.level[i]) * math.exp(-age / LEVEL_TAU),
+                    'spurts':     int(self.spurts[i]),
+                    'talk_s':     now - float(self.start[i]) if talking else 0.0,
+                })
+        rows.sort(key=lambda r: (-r['talking'], -r['level']))
+        return rows
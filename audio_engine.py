@@ -0,0 +1,464 @@
+"""
+Shared audio I/O for every LoopBot hosted in one process.
+
+A single microphone capture stream is fanned out to all bots, and the audio
+each bot receives from Mumble is mixed into a single output stream, so N
+bots never open N PortAudio streams on the same sound card.
+"""
+import math
+import threading
+import time
+import numpy as np
+import sounddevice as sd
+from metrics import Counter, Gauge, Histogram
+
+SAMPLE_RATE = 48000
+FRAME       = 960       # output frame: 20 ms at 48 kHz, the mixer's clock
+CLIP_KNEE   = 0.8       # soft clipping starts at this fraction of full scale
+METER_WINDOW = SAMPLE_RATE // 25   # level meters publish every 40 ms of audio
+DUCK_DB     = -12.0     # default attenuation of lower-priority loops
+DUCK_ON     = 0.003     # envelope (RMS, fraction of full scale) that counts as active, ~-50 dBFS
+DUCK_HOLD   = 0.25      # seconds for the envelope to decay by 1/e once a loop goes quiet
+DUCK_RELEASE = 0.3      # seconds for a ducked loop to come back (1/e); ducking itself takes one block
+
+XRUN_FLAGS = ("input_underflow", "input_overflow", "output_underflow", "output_overflow")
+XRUNS = Counter("audio_xruns_total",
+                "Underflows and overflows PortAudio reported to a callback",
+                ("stream", "kind"))
+CALLBACK_SECONDS = Histogram("audio_callback_seconds",
+                             "Time spent inside an audio callback", ("stream",))
+STREAM_LATENCY = Gauge("audio_stream_latency_seconds",
+                       "Device latency PortAudio reports for a stream", ("stream",))
+
+
+def default_devices():
+    """Return the first (input, output) device indexes PortAudio reports."""
+    devs = sd.query_devices()
+    dev_in  = next(i for i,d in enumerate(devs) if d["max_input_channels"]>0)
+    dev_out = next(i for i,d in enumerate(devs) if d["max_output_channels"]>0)
+    return dev_in, dev_out
+
+
+class LevelMeter:
+    """
+    Decimated peak/RMS of a stream: every `window` samples the running
+    values are published to `level` as fractions of full scale, then reset.
+    """
+    def __init__(self, window=METER_WINDOW):
+        self.window  = window
+        self.level   = (0.0, 0.0)       # (peak, rms) of the last window
+        self.updated = 0.0              # monotonic time `level` was published
+        self._peak = self._sumsq = 0.0
+        self._n    = 0
+        self._f32  = np.zeros(0, dtype=np.float32)
+
+    def add(self, x):
+        """Account one block: int16 PCM bytes, or an array in int16 scale."""
+        if isinstance(x, (bytes, bytearray, memoryview)):
+            x = np.frombuffer(x, dtype=np.int16)
+        n = len(x)
+        if not n:
+            return
+        if x.dtype != np.float32:
+            if n > len(self._f32):
+                self._f32 = np.zeros(n, dtype=np.float32)
+            np.copyto(self._f32[:n], x, casting="unsafe")
+            x = self._f32[:n]
+        self._peak = max(self._peak, float(x.max()), -float(x.min()))
+        self._sumsq += float(np.dot(x, x))
+        self._n += n
+        if self._n >= self.window:
+            self.level = (min(1.0, self._peak / 32768),
+                          math.sqrt(self._sumsq / self._n) / 32768)
+            self.updated = time.monotonic()
+            self._peak = self._sumsq = 0.0
+            self._n = 0
+
+    def read(self, stale=0.2):
+        """The latest (peak, rms); silence once nothing was added for `stale` s."""
+        if time.monotonic() - self.updated > stale:
+            return (0.0, 0.0)
+        return self.level
+
+
+class MixerSource:
+    """
+    One input of the Mixer: a bounded FIFO of received PCM plus its gain.
+    """
+    def __init__(self, gain=1.0, seconds=2.0):
+        self.gain  = gain
+        self.level = (0.0, 0.0)     # (peak, rms) before gain, set by the Mixer
+        self.priority = None        # ducking priority; None is never ducked nor ducks
+        self._buf  = np.zeros(int(SAMPLE_RATE * seconds), dtype=np.float32)
+        self._r    = 0      # total samples read
+        self._w    = 0      # total samples written
+        self._lock = threading.Lock()
+
+    def push(self, pcm):
+        """Append int16 PCM bytes; the oldest audio is overwritten when full."""
+        arr = np.frombuffer(pcm, dtype=np.int16)
+        size = len(self._buf)
+        if len(arr) > size:
+            arr = arr[-size:]
+        with self._lock:
+            pos = self._w % size
+            first = min(len(arr), size - pos)
+            self._buf[pos:pos+first] = arr[:first]
+            self._buf[:len(arr)-first] = arr[first:]
+            self._w += len(arr)
+            if self._w - self._r > size:
+                self._r = self._w - size
+
+    def read_into(self, out):
+        """Fill `out` (float32) with the next samples, zero padding any gap."""
+        size = len(self._buf)
+        with self._lock:
+            n = min(len(out), self._w - self._r)
+            pos = self._r % size
+            first = min(n, size - pos)
+            out[:first] = self._buf[pos:pos+first]
+            out[first:n] = self._buf[:n-first]
+            self._r += n
+        out[n:] = 0.0
+        return n
+
+
+class Mixer:
+    """
+    Sums every MixerSource into one int16 frame: each source is read into a
+    row of a preallocated matrix, weighted by its gain with a single dot
+    product, and the result is soft-clipped once. The same matrix gives every
+    source's peak/RMS level, published to `source.level` per METER_WINDOW.
+
+    Sources with a `priority` duck each other: while a source is active, every
+    source of lower priority is attenuated by `duck_db`. Activity comes from a
+    per-source envelope of the block energies the meter already computes, so
+    ducking costs a few vector operations per block however many sources or
+    speakers there are.
+    """
+    def __init__(self, duck_db=DUCK_DB):
+        self._sources = ()
+        self._lock    = threading.Lock()
+        self.duck_db  = duck_db
+        self._alloc(4, FRAME)
+
+    def _alloc(self, rows, frames):
+        self._rows  = np.zeros((rows, frames), dtype=np.float32)
+        self._gains = np.zeros(rows, dtype=np.float32)
+        self._mix   = np.zeros(frames, dtype=np.float32)
+        self._mag   = np.zeros(frames, dtype=np.float32)
+        self._abs   = np.zeros((rows, frames), dtype=np.float32)
+        self._peak  = np.zeros(rows, dtype=np.float32)
+        self._sumsq = np.zeros(rows, dtype=np.float64)
+        self._tmp   = np.zeros(rows, dtype=np.float32)
+        self._metered = 0           # samples in the current meter window
+        self._prio  = np.full(rows, np.nan, dtype=np.float32)
+        self._env   = np.zeros(rows, dtype=np.float32)     # activity envelope per source
+        self._duck  = np.ones(rows, dtype=np.float32)      # current duck gain per source
+        self._next  = np.ones(rows, dtype=np.float32)
+        self._ramp  = np.zeros(0, dtype=np.float32)
+        self._ducked_for = ()       # the sources _env and _duck rows belong to
+
+    @property
+    def duck_db(self):
+        """Attenuation of lower-priority sources in dB; 0 turns ducking off."""
+        return self._duck_db
+
+    @duck_db.setter
+    def duck_db(self, db):
+        self._duck_db   = min(0.0, float(db))
+        self._duck_gain = 10 ** (self._duck_db / 20)
+
+    def add_source(self, source):
+        with self._lock:
+            self._sources = self._sources + (source,)
+        return source
+
+    def remove_source(self, source):
+        with self._lock:
+            self._sources = tuple(s for s in self._sources if s is not source)
+
+    def render(self, out):
+        """Mix the next len(out) samples of every source into `out` (int16)."""
+        sources = self._sources
+        n = len(out)
+        if not sources:
+            out[:] = 0
+            return
+        if len(sources) > self._rows.shape[0] or n > self._rows.shape[1]:
+            self._alloc(max(len(sources), self._rows.shape[0]), max(n, self._rows.shape[1]))
+        rows  = self._rows[:len(sources), :n]
+        gains = self._gains[:len(sources)]
+        mix   = self._mix[:n]
+        prio  = self._prio[:len(sources)]
+        for i, src in enumerate(sources):
+            gains[i] = src.gain
+            p = getattr(src, 'priority', None)
+            prio[i] = np.nan if p is None else p
+            src.read_into(rows[i])
+        self._meter(sources, rows)
+        self._apply_duck(sources, rows, gains)
+        np.dot(gains, rows, out=mix)
+        mix *= 1.0 / 32768
+        soft_clip(mix, self._mag[:n])
+        mix *= 32767
+        np.copyto(out, mix, casting="unsafe")
+
+    def _meter(self, sources, rows):
+        k, n = rows.shape
+        peak, sumsq, tmp = self._peak[:k], self._sumsq[:k], self._tmp[:k]
+        absr = self._abs[:k, :n]
+        np.abs(rows, out=absr)
+        absr.max(axis=1, out=tmp)
+        np.maximum(peak, tmp, out=peak)
+        np.einsum('ij,ij->i', rows, rows, out=tmp)
+        sumsq += tmp
+        self._metered += n
+        if self._metered >= METER_WINDOW:
+            scale = 1.0 / 32768
+            for i, src in enumerate(sources):
+                src.level = (min(1.0, float(peak[i]) * scale),
+                             math.sqrt(sumsq[i] / self._metered) * scale)
+            peak[:] = 0.0
+            sumsq[:] = 0.0
+            self._metered = 0
+
+    def _apply_duck(self, sources, rows, gains):
+        # runs after _meter, which leaves each row's block energy in _tmp
+        k, n = rows.shape
+        if sources is not self._ducked_for:
+            self._remap_duck(sources)
+        env, duck, nxt, prio = self._env[:k], self._duck[:k], self._next[:k], self._prio[:k]
+        rms = self._tmp[:k]
+        rms *= 1.0 / (n * 32768.0 * 32768.0)
+        np.sqrt(rms, out=rms)
+        env *= math.exp(-n / (DUCK_HOLD * SAMPLE_RATE))
+        np.maximum(env, rms, out=env)
+        # loudest active priority; every source below it is ducked
+        active = (env > DUCK_ON) & ~np.isnan(prio)
+        if self._duck_gain < 1.0 and active.any():
+            top = prio[active].max()
+            with np.errstate(invalid="ignore"):
+                np.copyto(nxt, np.where(prio < top, self._duck_gain, 1.0))
+        else:
+            nxt[:] = 1.0
+        # duck within one block, come back over DUCK_RELEASE
+        up = nxt > duck
+        if up.any():
+            nxt[up] += (duck[up] - nxt[up]) * math.exp(-n / (DUCK_RELEASE * SAMPLE_RATE))
+            nxt[up & (nxt > 0.999)] = 1.0
+        steady = nxt == duck
+        np.multiply(gains, duck, out=gains, where=steady)
+        changing = np.flatnonzero(~steady)
+        if len(changing):
+            # ramp sample by sample so a gain change never clicks
+            if len(self._ramp) != n:
+                self._ramp = np.arange(1, n + 1, dtype=np.float32) / n
+            g = self._mag[:n]
+            for i in changing:
+                np.multiply(self._ramp, nxt[i] - duck[i], out=g)
+                g += duck[i]
+                rows[i] *= g
+            np.copyto(duck, nxt)
+
+    def _remap_duck(self, sources):
+        # sources were added or removed: keep each survivor's envelope and gain
+        old = {id(s): i for i, s in enumerate(self._ducked_for)}
+        env, duck = self._env.copy(), self._duck.copy()
+        for i, src in enumerate(sources):
+            j = old.get(id(src))
+            self._env[i]  = env[j] if j is not None else 0.0
+            self._duck[i] = duck[j] if j is not None else 1.0
+        self._ducked_for = sources
+
+
+def soft_clip(x, scratch):
+    """
+    In-place soft clipper for float audio in [-1, 1] full scale: linear up to
+    CLIP_KNEE, then a tanh curve that approaches but never exceeds 1.0.
+    """
+    np.abs(x, out=scratch)
+    over = scratch > CLIP_KNEE
+    if over.any():
+        room = 1.0 - CLIP_KNEE
+        x[over] = np.sign(x[over]) * (
+            CLIP_KNEE + room * np.tanh((scratch[over] - CLIP_KNEE) / room)
+        )
+
+
+class AudioEngine:
+    """
+    Owns the shared microphone stream and the shared, mixed output stream.
+    """
+    def __init__(self, dev_in=None, dev_out=None, capture_ms=None, capture_int16=False,
+                 duck_db=DUCK_DB):
+        if dev_in is None or dev_out is None:
+            def_in, def_out = default_devices()
+            dev_in  = def_in if dev_in is None else dev_in
+            dev_out = def_out if dev_out is None else dev_out
+        self.dev_in   = dev_in          # input device index
+        self.dev_out  = dev_out         # output device index
+        self._bots    = []              # bots fed by the mic stream
+        self.mixer    = Mixer(duck_db)  # sums every bot into one stream
+        self.mic_meter = LevelMeter()   # level of the captured microphone
+        self._mic_stream = None
+        self._out_stream = None
+        # capture_ms=10/20 selects low-latency blocks aligned to Opus frames;
+        # None keeps the original 2048-sample / 100 ms stream.
+        self.capture_ms    = capture_ms
+        self.capture_int16 = capture_int16  # ask PortAudio for int16 directly
+        self._mic_f32 = self._mic_i16 = None
+        self._mic_beat = self._out_beat = None  # monotonic time of last callback
+        self._mic_seconds = CALLBACK_SECONDS.labels(stream="mic")
+        self._out_seconds = CALLBACK_SECONDS.labels(stream="out")
+        STREAM_LATENCY.labels(stream="mic").set_function(lambda: self._latency(self._mic_stream))
+        STREAM_LATENCY.labels(stream="out").set_function(lambda: self._latency(self._out_stream))
+
+    @staticmethod
+    def _latency(stream):
+        # 0 rather than an exception (NaN) before a stream opens or once closed
+        try:
+            return float(stream.latency) if stream is not None else 0.0
+        except Exception:
+            return 0.0
+
+    def add_bot(self, bot):
+        self._bots.append(bot)
+
+    def remove_bot(self, bot):
+        if bot in self._bots:
+            self._bots.remove(bot)
+        if not self._bots:
+            self.stop()
+
+    def start(self):
+        self._start_mic_stream()
+        self._start_out_stream()
+
+    def stop(self):
+        try: self._mic_stream.close()
+        except: pass
+        try: self._out_stream.close()
+        except: pass
+        try: sd.stop()
+        except Exception: pass
+
+    def heartbeat(self):
+        """Seconds since each audio callback last ran (None before the first)."""
+        now = time.monotonic()
+        return {
+            'mic_age': None if self._mic_beat is None else now - self._mic_beat,
+            'out_age': None if self._out_beat is None else now - self._out_beat,
+        }
+
+    @staticmethod
+    def _count_xruns(stream, status):
+        for flag in XRUN_FLAGS:
+            if getattr(status, flag, False):
+                XRUNS.labels(stream=stream, kind=flag).inc()
+
+    # --- microphone ---
+    def _fan_out(self, pcm):
+        for bot in self._bots:
+            bot.feed_mic(pcm)
+
+    def _mic_callback(self, indata, frames, ti, status):
+        self._mic_beat = t0 = time.monotonic()
+        if status:
+            self._count_xruns("mic", status)
+        if indata is None or len(indata) == 0:
+            return
+        n = len(indata)
+        if n > len(self._mic_i16):
+            self._alloc_mic(n)
+        f32 = self._mic_f32[:n]
+        i16 = self._mic_i16[:n]
+        try:
+            # convert into the preallocated buffers, no per-block arrays
+            np.multiply(indata[:,0], 32767, out=f32)
+            np.clip(f32, -32768, 32767, out=f32)
+            np.copyto(i16, f32, casting="unsafe")
+        except Exception as e:
+            print(f"[MIC CALLBACK ERROR] Could not convert indata to PCM: {e}")
+            return
+        self.mic_meter.add(f32)
+        self._fan_out(i16.tobytes())
+        self._mic_seconds.observe(time.monotonic() - t0)
+
+    def _mic_callback_int16(self, indata, frames, ti, status):
+        # PortAudio already delivers int16 PCM: forward the bytes untouched
+        self._mic_beat = t0 = time.monotonic()
+        if status:
+            self._count_xruns("mic", status)
+        if indata is None or len(indata) == 0:
+            return
+        pcm = bytes(indata)
+        self.mic_meter.add(pcm)
+        self._fan_out(pcm)
+        self._mic_seconds.observe(time.monotonic() - t0)
+
+    def _alloc_mic(self, blocksize):
+        self._mic_f32 = np.zeros(blocksize, dtype=np.float32)
+        self._mic_i16 = np.zeros(blocksize, dtype=np.int16)
+
+    def _start_mic_stream(self):
+        if self.capture_ms:
+            blocksize = SAMPLE_RATE * self.capture_ms // 1000
+            latency   = "low"
+        else:
+            blocksize = 2048
+            latency   = 0.1
+        self._alloc_mic(blocksize)
+        if self.capture_int16:
+            self._mic_stream = sd.RawInputStream(
+                device=self.dev_in,
+                channels=1,
+                samplerate=SAMPLE_RATE,
+                dtype="int16",
+                blocksize=blocksize,
+                latency=latency,
+                callback=self._mic_callback_int16
+            )
+        else:
+            self._mic_stream = sd.InputStream(
+                device=self.dev_in,
+                channels=1,
+                samplerate=SAMPLE_RATE,
+                blocksize=blocksize,
+                latency=latency,
+                callback=self._mic_callback
+            )
+        self._mic_stream.start()
+
+    def set_input(self, idx):
+        try: self._mic_stream.close()
+        except: pass
+        self.dev_in = idx
+        self._start_mic_stream()
+
+    # --- playback ---
+    def _out_callback(self, outdata, frames, ti, status):
+        # PortAudio pulls one FRAME at a time, so the device is the clock
+        self._out_beat = t0 = time.monotonic()
+        if status:
+            self._count_xruns("out", status)
+        self.mixer.render(np.frombuffer(outdata, dtype=np.int16))
+        self._out_seconds.observe(time.monotonic() - t0)
+
+    def _start_out_stream(self):
+        self._out_stream = sd.RawOutputStream(
+            device=self.dev_out,
+            channels=1,
+            samplerate=SAMPLE_RATE,
+            dtype="int16",
+            blocksize=FRAME,
+            latency="low",
+            callback=self._out_callback
+        )
+        self._out_stream.start()
+
+    def set_output(self, idx):
+        try: self._out_stream.close()
+        except: pass
+        self.dev_out = idx
+        self._start_out_stream()
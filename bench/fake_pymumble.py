@@ -0,0 +1,340 @@
+"""
+In-process stand-in for `pymumble_py3`, backed by a FakeServer.
+
+install() registers this module as `pymumble_py3` (and its `constants`), so
+bot_server.py runs unmodified against it. The FakeServer keeps the channel
+tree and a set of synthetic speakers. Each tick, every speaker sends one
+20 ms packet of PCM (a tone at its own pitch), with optional network jitter
+and loss. The packet reaches each connected client in the same channel
+through the client's SOUNDRECEIVED callback, just as pymumble delivers it,
+and to every client listening to that channel (Mumble channel listeners).
+"""
+import heapq
+import random
+import sys
+import threading
+import time
+import types
+import numpy as np
+
+SAMPLE_RATE = 48000
+PACKET      = 960       # samples per speaker packet (20 ms)
+SEQ_STEP    = 2         # Mumble sequence numbers count 10 ms units
+
+constants = types.ModuleType("pymumble_py3.constants")
+constants.PYMUMBLE_CONN_STATE_NOT_CONNECTED = 0
+constants.PYMUMBLE_CONN_STATE_AUTHENTICATING = 1
+constants.PYMUMBLE_CONN_STATE_CONNECTED = 2
+constants.PYMUMBLE_CONN_STATE_FAILED = 3
+constants.PYMUMBLE_CLBK_CONNECTED = "connected"
+constants.PYMUMBLE_CLBK_DISCONNECTED = "disconnected"
+constants.PYMUMBLE_CLBK_CHANNELCREATED = "channel_created"
+constants.PYMUMBLE_CLBK_CHANNELUPDATED = "channel_updated"
+constants.PYMUMBLE_CLBK_CHANNELREMOVED = "channel_remove"
+constants.PYMUMBLE_CLBK_USERCREATED = "user_created"
+constants.PYMUMBLE_CLBK_USERUPDATED = "user_updated"
+constants.PYMUMBLE_CLBK_USERREMOVED = "user_removed"
+constants.PYMUMBLE_CLBK_SOUNDRECEIVED = "sound_received"
+constants.PYMUMBLE_MSG_TYPES_USERSTATE = 9
+
+mumble_pb2 = types.ModuleType("pymumble_py3.mumble_pb2")
+messages   = types.ModuleType("pymumble_py3.messages")
+
+
+class UserState:
+    def __init__(self):
+        self.session = None
+        self.channel_id = None
+        self.listening_channel_add = []
+        self.listening_channel_remove = []
+
+
+class Cmd:
+    def __init__(self):
+        self.cmd_id = None
+        self.cmd = None
+        self.parameters = None
+        self.response = None
+
+
+mumble_pb2.UserState = UserState
+messages.Cmd = Cmd
+
+SERVER = None           # the FakeServer new Mumble clients connect to
+
+
+def install(server):
+    """Make `import pymumble_py3` resolve to this fake, connected to `server`."""
+    global SERVER
+    SERVER = server
+    sys.modules["pymumble_py3"] = sys.modules[__name__]
+    sys.modules["pymumble_py3.constants"] = constants
+    sys.modules["pymumble_py3.mumble_pb2"] = mumble_pb2
+    sys.modules["pymumble_py3.messages"] = messages
+
+
+class SoundChunk:
+    def __init__(self, pcm, sequence, size, calculated_time):
+        self.pcm = pcm
+        self.sequence = sequence
+        self.size = size
+        self.duration = float(size) / 2 / SAMPLE_RATE
+        self.time = calculated_time
+        self.timestamp = calculated_time
+        self.type = 0
+        self.target = 0
+
+
+class Speaker:
+    """A remote user talking continuously in one channel."""
+    def __init__(self, session, channel_id, freq):
+        self.user = {'session': session, 'channel_id': channel_id, 'name': f"speaker{session}"}
+        t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+        self.tone = (0.2 * 32767 * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+        self.sequence = 0
+        self._pos = 0
+
+    def packet(self):
+        pcm = self.tone[self._pos:self._pos + PACKET].tobytes()
+        self._pos = (self._pos + PACKET) % (len(self.tone) - PACKET)
+        seq = self.sequence
+        self.sequence += SEQ_STEP
+        return seq, pcm
+
+
+class FakeServer:
+    """
+    Channels `loops` under Root, `speakers` synthetic talkers in each, and
+    the connected clients. `jitter_ms` is the maximum random extra delay per
+    packet, `loss` the fraction of packets dropped.
+    """
+    def __init__(self, loops, speakers=1, jitter_ms=0.0, loss=0.0, seed=0):
+        self.channels = {0: "Root"}
+        for i, name in enumerate(loops, 1):
+            self.channels[i] = name
+        self.speakers = []
+        session = 1000
+        for cid in range(1, len(loops) + 1):
+            for k in range(speakers):
+                session += 1
+                self.speakers.append(Speaker(session, cid, 220 + 55 * k + 3 * cid))
+        self.jitter = jitter_ms / 1000.0
+        self.loss   = loss
+        self.rng    = random.Random(seed)
+        self.clients = []
+        self.sent = self.lost = 0
+        self._queue = []            # (due time, order, speaker, sequence, pcm)
+        self._order = 0
+        self._lock  = threading.Lock()
+        self._running = False
+        self._next_session = 1
+
+    def connect(self, client):
+        with self._lock:
+            self._next_session += 1
+            self.clients.append(client)
+            return self._next_session
+
+    def disconnect(self, client):
+        with self._lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def tick(self, now=None):
+        """Every speaker emits one packet; deliver whatever is now due."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for sp in self.speakers:
+                seq, pcm = sp.packet()
+                self.sent += 1
+                if self.loss and self.rng.random() < self.loss:
+                    self.lost += 1
+                    continue
+                due = now + (self.rng.random() * self.jitter if self.jitter else 0.0)
+                self._order += 1
+                heapq.heappush(self._queue, (due, self._order, sp, seq, pcm))
+        return self.deliver(now)
+
+    def deliver(self, now):
+        n = 0
+        while True:
+            with self._lock:
+                if not self._queue or self._queue[0][0] > now:
+                    return n
+                _, _, sp, seq, pcm = heapq.heappop(self._queue)
+                clients = list(self.clients)
+            cid = sp.user['channel_id']
+            for c in clients:
+                if c.users.myself['channel_id'] == cid or cid in c.listening:
+                    c.receive(sp.user['session'], seq, pcm)
+                    n += 1
+
+    def run(self, period=PACKET / SAMPLE_RATE):
+        """Tick in real time on a background thread until stop()."""
+        self._running = True
+
+        def clock():
+            due = time.perf_counter()
+            while self._running:
+                self.tick()
+                due += period
+                # deliver jittered packets between ticks, 2 ms resolution
+                while self._running:
+                    wait = due - time.perf_counter()
+                    if wait <= 0:
+                        break
+                    time.sleep(min(wait, 0.002))
+                    if self.jitter:
+                        self.deliver(time.time())
+        threading.Thread(target=clock, daemon=True).start()
+
+    def stop(self):
+        self._running = False
+
+
+# --- client side, mirroring the parts of pymumble_py3 bot_server uses ---
+class CallBacks(dict):
+    def set_callback(self, name, fn):
+        self[name] = fn
+
+    def call(self, name, *args):
+        fn = self.get(name)
+        if fn is not None:
+            fn(*args)
+
+
+class Channel(dict):
+    def __init__(self, client, cid, name):
+        super().__init__(channel_id=cid, name=name, parent=0 if cid else None)
+        self._client = client
+
+    def move_in(self, session=None):
+        me = self._client.users.myself
+        me['channel_id'] = self['channel_id']
+        self._client.callbacks.call(constants.PYMUMBLE_CLBK_USERUPDATED, me,
+                                    {'channel_id': self['channel_id']})
+
+
+class SoundQueue:
+    """A user's receive path; the "codec" passes PCM through unchanged."""
+    def add(self, audio, sequence, type, target):
+        return SoundChunk(audio, sequence, len(audio), time.time())
+
+
+class User(dict):
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.sound = SoundQueue()
+
+
+class Users(dict):
+    myself = None
+
+
+class Commands:
+    def answer(self, cmd):
+        pass
+
+
+class Encoder:
+    bitrate = 40000
+
+    def encode(self, pcm, frame_size):
+        return pcm
+
+
+class SoundOutput:
+    """Accepts mic PCM and drains it in real time, like the Opus sender."""
+    def __init__(self):
+        self.encoder    = None
+        self.create_encoder()
+        self.bytes_sent = 0
+        self.packets    = 0
+        self._queued    = 0.0       # seconds waiting to be "encoded and sent"
+        self._last      = time.time()
+
+    def create_encoder(self):
+        self.encoder = Encoder()
+
+    def add_sound(self, pcm):
+        self.encoder.encode(pcm, len(pcm) // 2)
+        self._drain()
+        self.bytes_sent += len(pcm)
+        self.packets    += 1
+        self._queued    += len(pcm) / 2 / SAMPLE_RATE
+
+    def _drain(self):
+        now = time.time()
+        self._queued = max(0.0, self._queued - (now - self._last))
+        self._last = now
+
+    def get_buffer_size(self):
+        self._drain()
+        return self._queued
+
+
+class Mumble:
+    def __init__(self, host, user, port=64738, password='', certfile=None, keyfile=None,
+                 reconnect=False, tokens=None, stereo=False, debug=False):
+        self.host, self.user, self.port = host, user, port
+        self.callbacks    = CallBacks()
+        self.channels     = {}
+        self.users        = Users()
+        self.sound_output = SoundOutput()
+        self.receive_sound = False
+        self._connected   = constants.PYMUMBLE_CONN_STATE_NOT_CONNECTED
+        self.server       = SERVER
+        # like pymumble, the client dies with the thread that built it
+        self.parent_thread = threading.current_thread()
+        self.commands     = Commands()
+        self.listening    = set()     # channel ids we hear without being in them
+
+    def is_alive(self):
+        return self.parent_thread.is_alive()
+
+    @property
+    def connected(self):
+        if not self.is_alive():
+            return constants.PYMUMBLE_CONN_STATE_NOT_CONNECTED
+        return self._connected
+
+    @connected.setter
+    def connected(self, state):
+        self._connected = state
+
+    def set_receive_sound(self, value):
+        self.receive_sound = bool(value)
+
+    def start(self):
+        session = self.server.connect(self)
+        self.listening = set()
+        self.channels = {cid: Channel(self, cid, name) for cid, name in self.server.channels.items()}
+        self.users = Users()
+        for sp in self.server.speakers:
+            self.users[sp.user['session']] = User(sp.user)
+        me = User(session=session, channel_id=0, name=self.user)
+        self.users[session] = me
+        self.users.myself = me
+        self.connected = constants.PYMUMBLE_CONN_STATE_CONNECTED
+        self.callbacks.call(constants.PYMUMBLE_CLBK_CONNECTED)
+
+    def execute_command(self, cmd, blocking=True):
+        self.treat_command(cmd)
+
+    def treat_command(self, cmd):
+        pass
+
+    def send_message(self, type, message):
+        if type == constants.PYMUMBLE_MSG_TYPES_USERSTATE:
+            self.listening.update(message.listening_channel_add)
+            self.listening.difference_update(message.listening_channel_remove)
+
+    def stop(self):
+        self.server.disconnect(self)
+        self.connected = constants.PYMUMBLE_CONN_STATE_NOT_CONNECTED
+
+    def receive(self, session, sequence, payload):
+        if self.receive_sound and self.is_alive():
+            user = self.users[session]
+            chunk = user.sound.add(payload, sequence, 4, 0)
+            self.callbacks.call(constants.PYMUMBLE_CLBK_SOUNDRECEIVED, user, chunk)
@@ -0,0 +1,141 @@
+"""
+Null stand-in for the `sounddevice` module.
+
+Implements just what audio_engine.py uses: query_devices(), stop(), and the
+InputStream / RawInputStream / RawOutputStream callback streams. Nothing
+touches a sound card. A stream is either clocked (a thread calls the callback
+once per block in real time, like PortAudio) or driven by hand with pump(),
+which runs the callback as fast as the caller likes.
+
+Input streams play back INPUT (a float32 array in -1..1, looped) and default
+to a 440 Hz tone. Output streams hand every rendered block to SINK, if set.
+"""
+import threading
+import time
+import numpy as np
+
+SAMPLE_RATE = 48000
+INPUT = (0.25 * np.sin(2 * np.pi * 440 * np.arange(SAMPLE_RATE) / SAMPLE_RATE)).astype(np.float32)
+SINK  = None            # callable(int16 ndarray) receiving each output block
+CLOCKED = True          # start() runs a real-time clock thread
+
+_DEVICES = [
+    {'name': 'null input',  'index': 0, 'max_input_channels': 1, 'max_output_channels': 0,
+     'default_samplerate': SAMPLE_RATE, 'hostapi': 0},
+    {'name': 'null output', 'index': 1, 'max_input_channels': 0, 'max_output_channels': 2,
+     'default_samplerate': SAMPLE_RATE, 'hostapi': 0},
+]
+
+
+def query_devices(device=None, kind=None):
+    if device is not None:
+        return _DEVICES[device]
+    return list(_DEVICES)
+
+
+def stop():
+    pass
+
+
+class CallbackFlags:
+    """Mirrors sounddevice.CallbackFlags; falsy unless a flag is set."""
+    def __init__(self, **flags):
+        self.input_underflow  = flags.get('input_underflow', False)
+        self.input_overflow   = flags.get('input_overflow', False)
+        self.output_underflow = flags.get('output_underflow', False)
+        self.output_overflow  = flags.get('output_overflow', False)
+
+    def __bool__(self):
+        return any(vars(self).values())
+
+
+class _Stream:
+    def __init__(self, device=None, channels=1, samplerate=SAMPLE_RATE, dtype="float32",
+                 blocksize=0, latency=None, callback=None, **kw):
+        self.device     = device
+        self.channels   = channels
+        self.samplerate = samplerate
+        self.dtype      = dtype
+        self.blocksize  = blocksize or 1024
+        self.latency    = latency if isinstance(latency, float) else self.blocksize / samplerate
+        self.callback   = callback
+        self.active     = False
+        self.late       = 0             # clock ticks that ran behind real time
+        self._thread    = None
+
+    def start(self):
+        self.active = True
+        if CLOCKED:
+            self._thread = threading.Thread(target=self._clock, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self.active = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+
+    close = stop
+
+    def _clock(self):
+        period = self.blocksize / self.samplerate
+        due = time.perf_counter()
+        status = CallbackFlags()
+        while self.active:
+            self.pump(1, status)
+            due += period
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+                status = CallbackFlags()
+            else:
+                # the callback overran its block: PortAudio would report an xrun
+                self.late += 1
+                status = self._xrun_flags()
+
+    def pump(self, blocks=1, status=None):
+        raise NotImplementedError
+
+
+class _Input(_Stream):
+    _pos = 0
+
+    def _read(self, n):
+        src = INPUT
+        idx = (self._pos + np.arange(n)) % len(src)
+        self._pos = (self._pos + n) % len(src)
+        return src[idx]
+
+    def _xrun_flags(self):
+        return CallbackFlags(input_overflow=True)
+
+
+class InputStream(_Input):
+    def pump(self, blocks=1, status=None):
+        status = status or CallbackFlags()
+        for _ in range(blocks):
+            data = self._read(self.blocksize).reshape(-1, 1)
+            self.callback(data, self.blocksize, None, status)
+
+
+class RawInputStream(_Input):
+    def pump(self, blocks=1, status=None):
+        status = status or CallbackFlags()
+        for _ in range(blocks):
+            pcm = (self._read(self.blocksize) * 32767).astype(np.int16)
+            self.callback(memoryview(pcm.tobytes()), self.blocksize, None, status)
+
+
+class RawOutputStream(_Stream):
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self._buf = bytearray(self.blocksize * 2 * self.channels)
+
+    def _xrun_flags(self):
+        return CallbackFlags(output_underflow=True)
+
+    def pump(self, blocks=1, status=None):
+        status = status or CallbackFlags()
+        for _ in range(blocks):
+            self.callback(self._buf, self.blocksize, None, status)
+            if SINK is not None:
+                SINK(np.frombuffer(self._buf, dtype=np.int16))
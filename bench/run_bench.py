@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the bot audio path: no sound card, no Mumble server.
+
+The real LoopBot, AudioEngine, jitter buffers and mixer from bot_server.py
+run against bench/fake_pymumble.py and bench/null_sounddevice.py.
+
+  mix   Drives the output and mic callbacks as fast as possible. Reports
+        the real-time factor and per-callback cost for receive, mix and the
+        talk path.
+  live  Runs in real time for --seconds with network jitter. Reports
+        receive-to-mix latency percentiles, frame losses, xruns, CPU per bot
+        and memory over time.
+
+Each scenario runs for every loop count in --loops (one bot per loop).
+--save writes the numbers as JSON. --compare fails (exit 1) when a run is
+worse than a saved baseline by more than --tolerance.
+
+    python bench/run_bench.py --loops 1,4,16,32 | tee bench_output.txt
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [HERE, ROOT]
+
+import numpy as np
+import psutil
+import null_sounddevice
+import fake_pymumble
+
+sys.modules["sounddevice"] = null_sounddevice
+fake_pymumble.install(None)
+
+import bot_server
+from audio_engine import AudioEngine, FRAME, SAMPLE_RATE
+from cert_manager import CertManager
+
+FRAME_SECONDS = FRAME / SAMPLE_RATE
+
+# Lower is better unless listed in HIGHER_IS_BETTER
+HIGHER_IS_BETTER = {"rt_factor"}
+SKIP_COMPARE     = {"loops", "speakers", "frames", "seconds", "rss_start_mb"}
+
+_certs = None
+_run = 0
+
+
+def pct(a, q):
+    return float(np.percentile(a, q)) if len(a) else float("nan")
+
+
+def build(loops, speakers, jitter_ms=0.0, loss=0.0, clocked=False):
+    """One engine with `loops` bots, each joined to its own busy loop."""
+    global _certs, _run
+    _run += 1
+    if _certs is None:
+        _certs = CertManager(tempfile.mkdtemp(prefix="mc-bench-"), key_type="ec", pool_size=0)
+    names = [f"LOOP{i}" for i in range(loops)]
+    server = fake_pymumble.FakeServer(names, speakers, jitter_ms=jitter_ms, loss=loss)
+    fake_pymumble.SERVER = server
+    null_sounddevice.CLOCKED = clocked
+    engine = AudioEngine(capture_ms=20)
+    bots = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, loop in enumerate(names):
+            bot = bot_server.LoopBot(f"bench{_run}_{i}", engine, "fake", 64738, certs=_certs)
+            bot.connect()
+            bot.join(loop)
+            bot.talk()
+            bots.append(bot)
+    return server, engine, bots
+
+
+def teardown(server, engine, bots):
+    server.stop()
+    engine.stop()
+    for b in bots:
+        engine.mixer.remove_source(b.source)
+        b.client.stop()
+
+
+def scenario_mix(loops, speakers, frames):
+    server, engine, bots = build(loops, speakers)
+    engine.start()
+    out, mic = engine._out_stream, engine._mic_stream
+    recv_t = np.zeros(frames)
+    mix_t  = np.zeros(frames)
+    mic_t  = np.zeros(frames)
+    for _ in range(20):                     # fill the jitter buffers first
+        server.tick()
+        out.pump()
+    start = time.perf_counter()
+    for i in range(frames):
+        t0 = time.perf_counter()
+        server.tick()
+        t1 = time.perf_counter()
+        out.pump()
+        t2 = time.perf_counter()
+        mic.pump()
+        t3 = time.perf_counter()
+        recv_t[i], mix_t[i], mic_t[i] = t1 - t0, t2 - t1, t3 - t2
+    wall = time.perf_counter() - start
+    teardown(server, engine, bots)
+    us = 1e6
+    return {
+        "loops": loops, "speakers": speakers, "frames": frames,
+        "rt_factor": frames * FRAME_SECONDS / wall,
+        "recv_us_p50": pct(recv_t, 50) * us, "recv_us_p99": pct(recv_t, 99) * us,
+        "mix_us_p50": pct(mix_t, 50) * us, "mix_us_p99": pct(mix_t, 99) * us,
+        "mic_us_p50": pct(mic_t, 50) * us, "mic_us_p99": pct(mic_t, 99) * us,
+    }
+
+
+def scenario_live(loops, speakers, seconds, jitter_ms, loss):
+    proc = psutil.Process()
+    server, engine, bots = build(loops, speakers, jitter_ms, loss, clocked=True)
+    rss = [proc.memory_info().rss]
+    cpu0 = proc.cpu_times()
+    t0 = time.perf_counter()
+    engine.start()
+    server.run()
+    while time.perf_counter() - t0 < seconds:
+        time.sleep(0.5)
+        rss.append(proc.memory_info().rss)
+    wall = time.perf_counter() - t0
+    cpu1 = proc.cpu_times()
+    late_ticks = engine._out_stream.late + engine._mic_stream.late
+    teardown(server, engine, bots)
+
+    lat = np.concatenate([
+        bot_server.PACKET_TO_MIX.labels(bot=b.name).recent() for b in bots])
+    stats = [b.source.stats() for b in bots]
+    cpu = (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system)
+    mb = 1 / (1024 * 1024)
+    return {
+        "loops": loops, "speakers": speakers, "seconds": round(wall, 1),
+        "recv_to_mix_ms_p50": pct(lat, 50) * 1e3,
+        "recv_to_mix_ms_p95": pct(lat, 95) * 1e3,
+        "recv_to_mix_ms_p99": pct(lat, 99) * 1e3,
+        "late":      sum(s['late'] for s in stats),
+        "dropped":   sum(s['dropped'] for s in stats),
+        "concealed": sum(s['concealed'] for s in stats),
+        "xruns":     late_ticks,
+        "cpu_pct_total":   100 * cpu / wall,
+        "cpu_pct_per_bot": 100 * cpu / wall / loops,
+        "rss_start_mb":  rss[0] * mb,
+        "rss_peak_mb":   max(rss) * mb,
+        "rss_growth_mb": (rss[-1] - rss[0]) * mb,
+    }
+
+
+def print_table(title, rows):
+    if not rows:
+        return
+    cols = list(rows[0])
+    print(f"\n== {title} ==")
+    print("  ".join(f"{c:>14}" for c in cols))
+    for r in rows:
+        print("  ".join(f"{r[c]:>14.3f}" if isinstance(r[c], float) else f"{r[c]:>14}"
+                        for c in cols))
+
+
+def compare(results, baseline, tolerance):
+    """List every metric that got worse than the baseline by > tolerance."""
+    worse = []
+    for name, rows in results.items():
+        base_rows = {r["loops"]: r for r in baseline.get(name, [])}
+        for r in rows:
+            b = base_rows.get(r["loops"])
+            if b is None:
+                continue
+            for k, v in r.items():
+                if k in SKIP_COMPARE or k not in b or not isinstance(v, (int, float)):
+                    continue
+                old = b[k]
+                if k in HIGHER_IS_BETTER:
+                    bad = v < old / (1 + tolerance)
+                else:
+                    # small absolute counts (e.g. 0 -> 2 drops) are noise
+                    bad = v > old * (1 + tolerance) and v - old > 1.0
+                if bad:
+                    worse.append(f"{name} loops={r['loops']} {k}: {old:.3f} -> {v:.3f}")
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", default="mix,live", help="comma list: mix, live")
+    parser.add_argument("--loops", default="1,2,4,8,16,32", help="comma list of loop counts")
+    parser.add_argument("--speakers", type=int, default=2, help="talkers per loop")
+    parser.add_argument("--frames", type=int, default=1000, help="frames per mix run")
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of each live run")
+    parser.add_argument("--jitter-ms", type=float, default=15.0, help="max network jitter (live)")
+    parser.add_argument("--loss", type=float, default=0.0, help="packet loss fraction (live)")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative regression against --compare")
+    args = parser.parse_args()
+
+    loop_counts = [int(x) for x in args.loops.split(",") if x]
+    scenarios = [s.strip() for s in args.scenario.split(",") if s.strip()]
+    results = {}
+    for name in scenarios:
+        rows = []
+        for n in loop_counts:
+            if name == "mix":
+                rows.append(scenario_mix(n, args.speakers, args.frames))
+            elif name == "live":
+                rows.append(scenario_live(n, args.speakers, args.seconds,
+                                          args.jitter_ms, args.loss))
+            else:
+                parser.error(f"unknown scenario: {name}")
+        results[name] = rows
+        print_table(name, rows)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            worse = compare(results, json.load(f), args.tolerance)
+        if worse:
+            print("\nREGRESSIONS:")
+            for w in worse:
+                print("  " + w)
+            sys.exit(1)
+        print("\nNo regressions against", args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Client for the bot_server.py control API.
+
+All commands go through one keep-alive requests.Session with strict timeouts,
+so a hung bot costs at most one timeout instead of blocking a Flask worker
+forever. A command plan maps each bot port to an ordered list of operations:
+a bot's operations are sent as one /batch request, and different bots run in
+parallel.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+HOST            = "127.0.0.1"
+CONNECT_TIMEOUT = 0.5       # seconds; bots are local, so this is generous
+# What one command may legitimately wait for inside a bot: a lazy bot's
+# Mumble connect, then the server confirming a channel move before a talk
+LAZY_CONNECT_S  = 1.5
+CONFIRM_S       = 1.0
+READ_TIMEOUT    = LAZY_CONNECT_S + CONFIRM_S + 1.0
+
+
+class BotClient:
+    """
+    Pooled, concurrent sender of commands to local bots.
+    """
+    def __init__(self, workers=16, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=0)
+        self.session.mount("http://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="botcmd")
+
+    def url(self, port, path):
+        return f"http://{HOST}:{port}/{path.lstrip('/')}"
+
+    def post(self, port, path, body=None):
+        """POST one command; returns the decoded JSON reply, or None on failure."""
+        try:
+            r = self.session.post(self.url(port, path), json=body or {}, timeout=self.timeout)
+            r.raise_for_status()
+            return r.json() if r.content else {}
+        except (requests.RequestException, ValueError) as e:
+            print(f"[BOT CMD] {path} on :{port} failed: {e}")
+            return None
+
+    def get(self, port, path):
+        try:
+            r = self.session.get(self.url(port, path), timeout=self.timeout)
+            r.raise_for_status()
+            return r.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"[BOT CMD] {path} on :{port} failed: {e}")
+            return None
+
+    def get_all(self, ports, path):
+        """GET `path` from every port in parallel; {port: JSON or None}."""
+        futures = {port: self._pool.submit(self.get, port, path) for port in ports}
+        return {port: f.result() for port, f in futures.items()}
+
+    def _run_one(self, port, ops):
+        if len(ops) == 1:
+            path, body = ops[0]
+            return self.post(port, path, body) is not None
+        # several steps: one /batch request, applied atomically by the bot
+        batch = [{'op': path, **(body or {})} for path, body in ops]
+        reply = self.post(port, "batch", {'ops': batch})
+        return bool(reply and reply.get('ok'))
+
+    def run(self, plan):
+        """
+        Execute {port: [(path, body), ...]}: one request per bot, applied
+        in order by that bot, with all bots in parallel. Returns
+        {port: True if every step succeeded}.
+        """
+        futures = {
+            port: self._pool.submit(self._run_one, port, ops)
+            for port, ops in plan.items() if ops
+        }
+        return {port: f.result() for port, f in futures.items()}
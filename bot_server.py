@@ -1,181 +1,283 @@
 #!/usr/bin/env python3
 import os
 import time
-import queue
 import threading
-import numpy as np
-import sounddevice as sd
-from flask import Flask, request, jsonify
+import argparse
+import functools
+import math
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify
 import signal
 import sys
 from flask_cors import CORS
+from werkzeug.serving import make_server
 
 script_dir = os.path.dirname(__file__)
 if hasattr(os, "add_dll_directory"):  # Windows only
     os.add_dll_directory(script_dir)
 
+from audio_engine import AudioEngine, LevelMeter
+from jitter_buffer import JitterSource, POLICIES
+from delay_line import DelayLine
+from vad import VoiceGate
+from activity import ActivityTracker
+from events import EventHub
+from bot_client import LAZY_CONNECT_S, CONFIRM_S
+from recorder import Recorder, EncoderTap, MAGIC, REC
+from replay import ReplayRing, ReplaySource, time_stretch, MAX_SPEED
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+engine = None   # the process-wide AudioEngine, created in main()
+
 # --- Graceful Shutdown on SIGTERM/SIGINT ---
 def handle_exit(signum, frame):
     print(f"Received signal {signum}. Exiting bot_server.py.")
     try:
-        sd.stop()
+        if engine is not None:
+            engine.stop()
+        if recorder is not None:
+            recorder.stop()
     except Exception:
         pass
     sys.exit(0)
 
-signal.signal(signal.SIGTERM, handle_exit)
-signal.signal(signal.SIGINT, handle_exit)
-
 # --- CERTIFICATE MANAGEMENT ---
-from cryptography import x509
-from cryptography.x509.oid import NameOID
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import rsa
-import datetime
-
-def ensure_bot_cert(bot_name):
-    cert_dir = os.path.join(os.path.dirname(__file__), "certs")
-    os.makedirs(cert_dir, exist_ok=True)
-    certfile = os.path.join(cert_dir, f"{bot_name}.pem")
-    keyfile  = os.path.join(cert_dir, f"{bot_name}-key.pem")
-    if os.path.isfile(certfile) and os.path.isfile(keyfile):
-        return certfile, keyfile
-    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
-    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, u"{}".format(bot_name))])
-    cert = (
-        x509.CertificateBuilder()
-        .subject_name(subject)
-        .issuer_name(subject)
-        .public_key(key.public_key())
-        .serial_number(x509.random_serial_number())
-        .not_valid_before(datetime.datetime.utcnow())
-        .not_valid_after(datetime.datetime.utcnow() + datetime.timedelta(days=3650))
-        .sign(key, hashes.SHA256())
-    )
-    with open(keyfile, "wb") as f:
-        f.write(key.private_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.TraditionalOpenSSL,
-            encryption_algorithm=serialization.NoEncryption(),
-        ))
-    with open(certfile, "wb") as f:
-        f.write(cert.public_bytes(serialization.Encoding.PEM))
-    print(f"[CERT] Generated new certificate for {bot_name}: {certfile}")
-    return certfile, keyfile
-
-# --- DEFAULT AUDIO DEVICES ---
-devs = sd.query_devices()
-DEFAULT_IN  = next(i for i,d in enumerate(devs) if d["max_input_channels"]>0)
-DEFAULT_OUT = next(i for i,d in enumerate(devs) if d["max_output_channels"]>0)
-
-# --- CLI ARGUMENTS ---
-import argparse
-parser = argparse.ArgumentParser()
-parser.add_argument("--bot-name", required=True)
-parser.add_argument("--api-port", required=True, type=int)
-parser.add_argument("--server", required=True)
-parser.add_argument("--port", required=True, type=int)
-args = parser.parse_args()
-
-SERVER = args.server
-PORT   = args.port
-USER   = args.bot_name
+from cert_manager import CertManager, KEY_TYPES
 
-certfile, keyfile = ensure_bot_cert(USER)
+certs = None    # the process-wide CertManager, created in main()
+recorder = None # the process-wide Recorder, with --record
 
 # --- MUMBLE DEPENDENCIES ---
-from pymumble_py3 import Mumble
+from pymumble_py3 import Mumble, mumble_pb2
+from pymumble_py3.messages import Cmd
 from pymumble_py3.constants import (
+    PYMUMBLE_CLBK_CONNECTED,
+    PYMUMBLE_CLBK_DISCONNECTED,
+    PYMUMBLE_CLBK_CHANNELCREATED,
+    PYMUMBLE_CLBK_CHANNELUPDATED,
+    PYMUMBLE_CLBK_CHANNELREMOVED,
     PYMUMBLE_CLBK_SOUNDRECEIVED,
+    PYMUMBLE_CLBK_USERCREATED,
     PYMUMBLE_CLBK_USERUPDATED,
     PYMUMBLE_CLBK_USERREMOVED,
+    PYMUMBLE_CONN_STATE_CONNECTED,
+    PYMUMBLE_MSG_TYPES_USERSTATE,
 )
 
+# --- CHANNEL LISTENERS ---
+# Mumble 1.4+ lets a user "listen" to channels it is not in. pymumble has no
+# command for it, so LoopBot hooks pymumble's command dispatch and sends the
+# UserState itself, on pymumble's thread like every other command.
+CMD_LISTEN = "listen_channels"
+
+class ListenCmd(Cmd):
+    """Add and/or remove channel listeners for our own session."""
+    def __init__(self, session, add=(), remove=()):
+        Cmd.__init__(self)
+        self.cmd = CMD_LISTEN
+        self.parameters = {"session": session, "add": list(add), "remove": list(remove)}
+
+# --- METRICS ---
+JITTER_DEPTH  = Gauge("jitter_buffer_depth_frames",
+                      "10 ms frames buffered across all speakers", ("bot",))
+JITTER        = Gauge("jitter_seconds",
+                      "Largest smoothed inter-arrival jitter among speakers", ("bot",))
+SPEAKERS      = Gauge("jitter_speakers", "Remote speakers with a jitter buffer", ("bot",))
+FRAMES        = Counter("jitter_frames_total",
+                        "Received frames that were late, dropped or concealed",
+                        ("bot", "outcome"))
+PACKET_TO_MIX = Histogram("packet_to_mix_seconds",
+                          "Time from receiving a packet to mixing it for output", ("bot",))
+TALK_DELAY    = Gauge("talk_delay_seconds", "Talk-path delay line length, 0 when off", ("bot",))
+SEND_BUFFER   = Gauge("mumble_send_buffer_seconds",
+                      "Mic audio queued in pymumble for encoding and sending", ("bot",))
+VAD_SUPPRESSED = Counter("vad_suppressed_blocks_total",
+                         "Mic blocks not sent because the voice gate was closed", ("bot",))
+SEND_SHED     = Counter("mumble_send_shed_blocks_total",
+                        "Mic blocks dropped because pymumble's send buffer was full", ("bot",))
+
+MAX_AUDIO_DELAY = 30.0  # seconds; the delay line's memory grows with the delay
+
+# --- LEVEL STREAM ---
+LEVEL_HZ    = 25        # /levels frames per second
+LEVEL_FLOOR = -60.0     # dBFS shown as an empty meter
+
+def level_bytes(level):
+    """(peak, rms) as fractions of full scale -> two bytes, 0 = -60 dBFS, 255 = 0 dBFS."""
+    out = []
+    for v in level:
+        db = 20 * math.log10(v) if v > 0 else LEVEL_FLOOR
+        out.append(max(0, min(255, int((db - LEVEL_FLOOR) / -LEVEL_FLOOR * 255))))
+    return bytes(out)
+
+# Operations accepted by LoopBot.apply() and the /batch endpoint
+BATCH_OPS = {
+    'join', 'leave', 'talk', 'mute', 'volume', 'set_volume', 'delay',
+    'delay_on', 'delay_off', 'mute_after_delay', 'leave_after_delay',
+    'listen', 'unlisten', 'replay', 'park', 'standby',
+}
+
 class LoopBot:
     """
-    Main class that manages Mumble connection, audio I/O, state, delay, and volume logic.
+    Main class that manages Mumble connection, state, delay, and volume logic.
+    Audio I/O goes through the AudioEngine shared by every bot in the process.
     """
-    def __init__(self):
-        self.dev_in    = DEFAULT_IN     # input device index
-        self.dev_out   = DEFAULT_OUT    # output device index
+    def __init__(self, name, engine, server, port, certs=None, jitter_ms=40, jitter_max_ms=200,
+                 lazy=False, jitter_policy="drop_oldest", send_max_ms=200,
+                 vad=False, vad_threshold_db=-50.0, vad_hangover_ms=300, recorder=None,
+                 replay_seconds=30):
+        self.name      = name           # Mumble user name
+        self.server    = server
+        self.port      = port
+        self.engine    = engine         # shared mic / output streams
         self.loop      = None           # currently joined loop (channel) name
+        self.parked    = False          # joined ahead of use, not heard (see park())
         self.streaming = False          # True if currently "talking"
-        self.status    = "Starting…"
-        self._recv_q   = queue.Queue()  # queue for received PCM audio
-        self.playback_volume = 1.0      # Output volume (0.0-1.0)
-        self._connect_mumble()          # connect to Mumble server
-        self._start_mic_stream()        # start microphone input stream
-        self._start_playback_thread()   # start thread for playback
+        self.status    = "Standby" if lazy else "Starting…"
+        self.lazy      = lazy           # connect on the first join instead of at startup
+        self.client    = None
+        self.connect_seconds = None     # how long the Mumble connect took
+        self.connect_error   = None
+        self._connect_lock   = threading.Lock()
+        self._mumble_jobs    = queue.Queue()    # run by _mumble_thread
+        self._jitter   = (jitter_ms, jitter_max_ms, jitter_policy)
+        self.replay_seconds = replay_seconds    # "say again" window per loop
+        self.replay    = ReplaySource(replay_seconds)
+        self.source    = self._new_source()   # the joined loop; gain = volume
+        # Loops heard through channel listeners, each with its own source
+        # (and so its own volume) in the mixer
+        self.listens   = {}             # loop name -> JitterSource
+        self._listen_cids = {}          # channel_id -> JitterSource, for routing
+        self._listen_retired = {}       # frame counts of sources already removed
+        self.send_max  = send_max_ms / 1000.0   # ceiling on pymumble's send backlog
+        self.send_shed = 0              # mic blocks dropped at that ceiling
+        # Voice gate on the talk path: always detects (for report()), only
+        # withholds silence from the encoder when vad is on
+        self.gate      = VoiceGate(vad_threshold_db, hangover_ms=vad_hangover_ms)
+        self.vad       = vad
+        self.voice     = False          # voice detected on the outgoing mic audio
+        self._voice_changed = False     # set by the mic callback, see _activity_loop
+        self.vad_suppressed = 0
+        self._held_block = None         # last gated block, sent as pre-roll on open
+        self.tx_meter  = LevelMeter()   # level of what is actually sent
+        self.recorder  = recorder       # archives Opus packets, heard and sent
+        self._tx_frames = 0             # sequence numbers for recorded sent frames
+        # Channel/user index, maintained incrementally from pymumble callbacks
+        self._index_lock       = threading.Lock()
+        self._channel_ids      = {}     # channel name -> channel_id
+        self._channel_names    = {}     # channel_id -> channel name
+        self._user_channel     = {}     # user session -> channel_id
         self._users_by_channel = {}     # channel_id -> user count
+        self._user_counts      = {}     # channel name -> user count
+        self.activity  = ActivityTracker()  # who is talking, from received audio
+        self.events    = EventHub()     # /events subscribers (web UI)
+        self._last_report = None        # last status pushed to them
+        self.lock      = threading.RLock()  # serialises state transitions
+        self._target_cid = None         # channel id the last join moved to
+        self.certfile, self.keyfile = (certs or CertManager()).get(name)
 
-        # === DELAY feature (robust version) ===
+        # === DELAY feature (sample-clocked ring buffer) ===
         self.audio_delay_enabled = False        # if delay is active
         self.audio_delay_seconds = 3           # delay length (seconds)
-        self.audio_delay_queue = queue.Queue() # queue for delayed audio
-        self._delay_thread = threading.Thread(target=self._delay_audio_worker, daemon=True)
-        self._delay_thread.start()
+        self.delay_line = DelayLine(self.audio_delay_seconds)
+        self.engine.add_bot(self)       # receive mic audio
+        self.engine.mixer.add_source(self.source)
+        self.engine.mixer.add_source(self.replay)
+        self._register_metrics()
+        threading.Thread(target=self._activity_loop, daemon=True).start()
+        threading.Thread(target=self._mumble_thread, name=f"mumble-{name}",
+                         daemon=True).start()
+
+    def _new_source(self):
+        """Per-speaker jitter buffers for one loop, fed by _on_sound_received."""
+        jitter_ms, jitter_max_ms, policy = self._jitter
+        src = JitterSource(jitter_ms, jitter_max_ms, policy=policy,
+                           on_play=PACKET_TO_MIX.labels(bot=self.name).observe)
+        if self.replay_seconds > 0:
+            src.replay = ReplayRing(self.replay_seconds)
+        return src
+
+    @property
+    def playback_volume(self):
+        """Output volume (0.0-1.0), applied by the engine's mixer."""
+        return self.source.gain
+
+    @property
+    def dev_in(self):
+        return self.engine.dev_in
+
+    @property
+    def dev_out(self):
+        return self.engine.dev_out
 
     def enable_audio_delay(self, seconds=3):
-        self.audio_delay_enabled = True
+        seconds = max(0.0, min(MAX_AUDIO_DELAY, float(seconds)))
+        if self.audio_delay_enabled:
+            # already delaying: glide to the new length, nothing is dropped
+            self.delay_line.set_delay(seconds)
+        else:
+            self.delay_line.reset(seconds)
         self.audio_delay_seconds = seconds
+        self.audio_delay_enabled = True
         # print(f"[DELAY] Enabled with {seconds}s")
 
     def disable_audio_delay(self):
+        # Whatever is still in the line is discarded on the next enable
         self.audio_delay_enabled = False
-        # Immediately flush the queue
-        flushed = 0
-        while not self.audio_delay_queue.empty():
-            try:
-                self.audio_delay_queue.get_nowait()
-                flushed += 1
-            except Exception:
-                break
-        # print(f"[DELAY] Disabled. Flushed {flushed} audio chunks.")
+        # print("[DELAY] Disabled.")
 
-    def _delay_audio_worker(self):
-        while True:
+    def _send_pcm(self, pcm):
+        # Send to Mumble only if in "talking" mode
+        if self.streaming and self.client and getattr(self.client, "sound_output", None):
+            voice = self.gate.process(pcm)
+            if voice != self.voice:
+                # this is the audio callback: _activity_loop publishes it
+                self.voice = voice
+                self._voice_changed = True
+            if self.vad and not voice:
+                # silence: keep it from the encoder and the network
+                self._held_block = pcm
+                self.vad_suppressed += 1
+                return
             try:
-                tstamp, pcm = self.audio_delay_queue.get()
-                if not self.audio_delay_enabled:
-                    # Discard all queued audio when delay is off
-                    # print("[DELAY WORKER] Discarding chunk (delay is OFF)")
-                    continue
-                wait_needed = (tstamp + self.audio_delay_seconds) - time.time()
-                if wait_needed > 0:
-                    time.sleep(wait_needed)
-                # Play out only if in "talking" mode
-                if self.streaming and self.client and getattr(self.client, "sound_output", None):
-                    try:
-                        self.client.sound_output.add_sound(pcm)
-                    except Exception as e:
-                        print(f"[DELAY WORKER] Error playing sound: {e}")
+                out = self.client.sound_output
+                if out.get_buffer_size() > self.send_max:
+                    # the sender is behind: drop this block instead of
+                    # letting the talk path drift further from real time
+                    self.send_shed += 1
+                    return
+                if self._held_block is not None:
+                    # gate just opened: send the block before the onset too
+                    out.add_sound(self._held_block)
+                    self._held_block = None
+                out.add_sound(pcm)
+                self.tx_meter.add(pcm)
             except Exception as e:
-                # print(f"[DELAY WORKER ERROR] {e}")
-                time.sleep(0.01)
+                print(f"[AUDIO OUT ERROR] {e}")
 
-    def _mic_callback(self, indata, frames, ti, status):
-        if indata is None or len(indata) == 0:
-            return
-        try:
-            pcm = (indata[:,0] * 32767).astype(np.int16).tobytes()
-        except Exception as e:
-            print(f"[MIC CALLBACK ERROR] Could not convert indata to PCM: {e}")
-            return
+    def feed_mic(self, pcm):
+        """Called by the engine's mic callback with one block of int16 PCM."""
         if self.audio_delay_enabled:
-            self.audio_delay_queue.put((time.time(), pcm))
-        elif self.streaming and self.client and getattr(self.client, "sound_output", None):
-            try:
-                self.client.sound_output.add_sound(pcm)
-            except Exception as e:
-                print(f"[AUDIO OUT ERROR] {e}")
+            pcm = self.delay_line.process(pcm)
+        self._send_pcm(pcm)
 
     def _connect_mumble(self):
         self.client = Mumble(
-            SERVER, USER, port=PORT, reconnect=True,
-            certfile=certfile, keyfile=keyfile,
+            self.server, self.name, port=self.port, reconnect=True,
+            certfile=self.certfile, keyfile=self.keyfile,
         )
-        self.client.callbacks.set_callback(PYMUMBLE_CLBK_USERUPDATED,  lambda u,e: self._update_user_map())
-        self.client.callbacks.set_callback(PYMUMBLE_CLBK_USERREMOVED,  lambda u,e: self._update_user_map())
+        cb = self.client.callbacks
+        cb.set_callback(PYMUMBLE_CLBK_CONNECTED,      self._on_connected)
+        cb.set_callback(PYMUMBLE_CLBK_DISCONNECTED,   self._clear_index)
+        cb.set_callback(PYMUMBLE_CLBK_CHANNELCREATED, self._on_channel_created)
+        cb.set_callback(PYMUMBLE_CLBK_CHANNELUPDATED, self._on_channel_updated)
+        cb.set_callback(PYMUMBLE_CLBK_CHANNELREMOVED, self._on_channel_removed)
+        cb.set_callback(PYMUMBLE_CLBK_USERCREATED,    self._on_user_created)
+        cb.set_callback(PYMUMBLE_CLBK_USERUPDATED,    self._on_user_updated)
+        cb.set_callback(PYMUMBLE_CLBK_USERREMOVED,    self._on_user_removed)
+        self.client.treat_command = functools.partial(
+            self._treat_command, self.client.treat_command)
         self.client.set_receive_sound(True)
         self.client.callbacks.set_callback(
             PYMUMBLE_CLBK_SOUNDRECEIVED, self._on_sound_received
@@ -185,228 +287,896 @@ class LoopBot:
         elif hasattr(self.client, "set_deaf"): self.client.set_deaf(False)
         if hasattr(self.client, "unmute"):   self.client.unmute()
         elif hasattr(self.client, "set_mute"): self.client.set_mute(False)
-        for _ in range(20):
-            if getattr(self.client, "connected", False): break
-            time.sleep(0.2)
-        else:
-            raise RuntimeError("Mumble connect timeout")
-        self.status = "Connected"
-        self._update_user_map()
 
-    def _on_sound_received(self, user, soundchunk):
-        # Receive PCM from others, put to playback queue
-        self._recv_q.put(soundchunk.pcm)
-
-    def _start_mic_stream(self):
-        self._mic_stream = sd.InputStream(
-            device=self.dev_in,
-            channels=1,
-            samplerate=48000,
-            blocksize=2048,
-            latency=0.1,
-            callback=self._mic_callback
-        )
-        self._mic_stream.start()
+    def _treat_command(self, fallback, cmd):
+        # runs on pymumble's thread; see ListenCmd
+        if cmd.cmd != CMD_LISTEN:
+            return fallback(cmd)
+        state = mumble_pb2.UserState()
+        state.session = cmd.parameters["session"]
+        state.listening_channel_add.extend(cmd.parameters["add"])
+        state.listening_channel_remove.extend(cmd.parameters["remove"])
+        self.client.send_message(PYMUMBLE_MSG_TYPES_USERSTATE, state)
+        cmd.response = True
+        self.client.commands.answer(cmd)
+
+    # --- recording taps: the Opus packets around pymumble's codec ---
+    def _tap_user(self, user):
+        """Keep each received packet's Opus payload on the chunk as .opus."""
+        sound = getattr(user, 'sound', None)
+        if self.recorder is None or sound is None or 'add' in vars(sound):
+            return
+        add = sound.add
+        def tapped(audio, sequence, type, target):
+            chunk = add(audio, sequence, type, target)
+            if chunk is not None:
+                chunk.opus = audio
+            return chunk
+        sound.add = tapped
 
-    def _playback_thread(self):
+    def _tap_encoder(self):
+        """Record what we send; pymumble recreates the encoder at will."""
+        out = getattr(self.client, 'sound_output', None)
+        if self.recorder is None or out is None or 'create_encoder' in vars(out):
+            return
+        create = out.create_encoder
+        def create_encoder():
+            create()
+            if out.encoder is not None:
+                out.encoder = EncoderTap(out.encoder, self._record_sent)
+        out.create_encoder = create_encoder
+        if getattr(out, 'encoder', None) is not None:
+            out.encoder = EncoderTap(out.encoder, self._record_sent)
+
+    def _records(self, cid):
+        # only loops this bot was given: idle bots wait in Root (or parked in
+        # a loop another bot may be on), and would each record the same audio
+        if cid in self._listen_cids:
+            return True
+        return (self.loop is not None and not self.parked
+                and cid == self._channel_ids.get(self.loop))
+
+    def _record_sent(self, opus):
+        if self.loop is None:
+            return
+        me = self.client.users.myself
+        self._tx_frames += 1
+        self.recorder.record(self.loop, me['session'] if me else 0,
+                             self._tx_frames, opus)
+
+    def _mumble_thread(self):
+        # builds every client this bot has: pymumble stops for good once the
+        # thread that built a client ends, so that must not be a connect
+        # thread or a request thread (lazy joins, rejoins after standby())
+        while True:
+            fn, done = self._mumble_jobs.get()
+            try:
+                fn()
+            except Exception as e:
+                done.error = e
+            done.set()
+
+    def _on_mumble_thread(self, fn):
+        """Run fn on the bot's own long-lived thread and wait for it."""
+        done = threading.Event()
+        done.error = None
+        self._mumble_jobs.put((fn, done))
+        done.wait()
+        if done.error is not None:
+            raise done.error
+
+    def is_connected(self):
+        return getattr(self.client, "connected", None) == PYMUMBLE_CONN_STATE_CONNECTED
+
+    def connect(self, timeout=4.0):
         """
-        Background thread: plays back received PCM to output device,
-        scaling by the current volume.
+        Connect to the Mumble server unless already connected; returns True
+        once connected. Safe to call from several threads.
         """
-        with sd.RawOutputStream(
-            device=self.dev_out,
-            channels=1,
-            samplerate=48000,
-            dtype="int16",
-            blocksize=2048,
-            latency=0.1
-        ) as outstream:
-            while True:
-                pcm = self._recv_q.get()
-                arr = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
-                arr *= self.playback_volume
-                arr = np.clip(arr, -32768, 32767).astype(np.int16)
-                outstream.write(arr.tobytes())
+        with self._connect_lock:
+            if self.is_connected():
+                return True
+            t0 = time.time()
+            self.status = "Connecting…"
+            self._notify()
+            try:
+                if self.client is None:
+                    self._on_mumble_thread(self._connect_mumble)
+                deadline = t0 + timeout
+                while not self.is_connected():
+                    if time.time() > deadline:
+                        raise RuntimeError("Mumble connect timeout")
+                    time.sleep(0.02)
+            except Exception as e:
+                # pymumble keeps retrying in the background; the next
+                # connect() call waits for it again
+                self.connect_error = str(e)
+                self.status = f"Connect failed: {e}"
+                print(f"[MUMBLE] {self.name}: {e}")
+                self._notify()
+                return False
+            self.connect_seconds = time.time() - t0
+            self.connect_error = None
+            self.status = "Connected"
+            self._rebuild_index()
+            return True
+
+    def readiness(self):
+        """What start_all.py waits for: connected, or a lazy bot on standby."""
+        connected = self.is_connected()
+        return {
+            'ready':     connected or (self.lazy and self.client is None),
+            'connected': connected,
+            'lazy':      self.lazy,
+            'connect_s': self.connect_seconds,
+            'error':     self.connect_error,
+        }
+
+    def _on_sound_received(self, user, soundchunk):
+        # Receive PCM from others into that speaker's jitter buffer, in the
+        # source of the listened loop they talk in, else the joined loop's
+        cid = user.get('channel_id', 0)
+        src = self._listen_cids.get(cid, self.source)
+        src.push(user['session'], soundchunk.sequence, soundchunk.pcm)
+        opus = getattr(soundchunk, 'opus', None)
+        if opus is not None and self._records(cid):
+            self.recorder.record(self._channel_names.get(cid, "Root"), user['session'],
+                                 soundchunk.sequence, opus)
+        if self.activity.update(user['session'], cid, soundchunk.pcm, time.time()):
+            self._notify()          # someone started talking
+
+    def _activity_loop(self, period=0.25):
+        # meters decay and spurts end without a packet to report them; also
+        # publishes voice gate changes, which the mic callback only flags
+        while True:
+            time.sleep(period)
+            if self._voice_changed or self.activity.any_recent(time.time()):
+                self._voice_changed = False
+                self._notify()
 
-    def _start_playback_thread(self):
-        t = threading.Thread(target=self._playback_thread, daemon=True)
-        t.start()
+    def speakers(self):
+        """Users heard recently, grouped by loop: {loop: [{name, talking, ...}]}."""
+        users = getattr(self.client, 'users', None) or {}
+        out = {}
+        for row in self.activity.snapshot(time.time()):
+            loop = self._channel_names.get(row['channel_id'], "Root")
+            name = (users.get(row['session']) or {}).get('name', str(row['session']))
+            out.setdefault(loop, []).append({
+                'name':    name,
+                'talking': row['talking'],
+                'level':   round(row['level'], 1),
+                'spurts':  row['spurts'],
+            })
+        return out
 
     def set_input(self, idx):
-        self._mic_stream.close()
-        self.dev_in = idx
+        self.engine.set_input(idx)
         self.status = f"Input → {idx}"
-        self._start_mic_stream()
+        self._notify()
 
     def set_output(self, idx):
-        self.dev_out = idx
+        self.engine.set_output(idx)
         self.status  = f"Output → {idx}"
+        self._notify()
 
     def _move_to_loop(self):
-        target = self.loop or "Root"
-        for cid, ch in self.client.channels.items():
-            name = getattr(ch, 'name', None) or ch.get('name', '')
-            if name == target:
-                ch.move_in()
-                break
-
-    def join(self, loop_name):
-        self.loop   = loop_name
-        self.status = f"Listen → {loop_name or 'Root'}"
-        self._move_to_loop()
+        if self.client is None:
+            return None
+        cid = self._channel_ids.get(self.loop or "Root")
+        ch = self.client.channels.get(cid) if cid is not None else None
+        if ch is None:
+            return None
+        ch.move_in()
+        return cid
+
+    def _wait_in_channel(self, timeout=CONFIRM_S):
+        """Block until the server confirms our move to the joined channel."""
+        if self._target_cid is None:
+            return True
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            me = getattr(self.client.users, 'myself', None)
+            if me is not None and me.get('channel_id') == self._target_cid:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def join(self, loop_name, park=False, priority=0):
+        if loop_name is not None and not self.is_connected():
+            # lazy bot: the first assignment brings it online. Stay inside the
+            # web UI's command timeout; if the server is slow, _on_connected
+            # moves us into the loop once pymumble gets through.
+            self.connect(timeout=LAZY_CONNECT_S)
+        with self.lock:
+            if loop_name != self.loop or self.parked != park:
+                # a parked source is not read, so whatever it holds is stale
+                self.source.clear()
+                if self.source.replay is not None:
+                    self.source.replay.clear()
+                # never carry an open mic into another channel
+                self.streaming = False
+            if park != self.parked:
+                if park:
+                    self.engine.mixer.remove_source(self.source)
+                else:
+                    self.engine.mixer.add_source(self.source)
+                self.parked = park
+            self.loop   = loop_name
+            self.source.priority = priority
+            self.status = f"{'Parked' if park else 'Listen'} → {loop_name or 'Root'}"
+            self._target_cid = self._move_to_loop()
+            self._notify()
 
     def leave(self):
         self.join(None)
 
+    def park(self, loop_name):
+        """
+        Wait in loop_name without playing it, so that a later join() of the
+        same loop needs no channel move. Used by the web UI's scheduler.
+        """
+        self.join(loop_name, park=True)
+
+    def standby(self):
+        """Hang up until the next join, like a lazy bot; frees a connection."""
+        with self.lock:
+            if self.client is None:
+                return
+            self.mute()
+            self.join(None)
+            client, self.client = self.client, None
+            self.lazy = True
+            self.status = "Standby"
+        try:
+            client.stop()
+        except Exception as e:
+            print(f"[MUMBLE] {self.name}: stop: {e}")
+        self._clear_index()
+        self._notify()
+
+    def listen(self, loop_name, priority=0):
+        """
+        Also hear loop_name without joining it, through a channel listener.
+        Any number of loops can be listened to besides the joined one.
+        Raises ValueError if the server has no such channel (yet).
+        """
+        if not self.is_connected():
+            self.connect(timeout=LAZY_CONNECT_S)
+        with self.lock:
+            if self._channel_ids.get(loop_name) is None:
+                raise ValueError(f"no such loop: {loop_name!r}")
+            if loop_name in self.listens:
+                self.listens[loop_name].priority = priority
+                return
+            src = self._new_source()
+            src.priority = priority
+            self.listens[loop_name] = src
+            self.engine.mixer.add_source(src)
+            self._sync_listeners()
+            self.status = f"Listen + {loop_name}"
+            self._notify()
+
+    def unlisten(self, loop_name):
+        with self.lock:
+            src = self.listens.pop(loop_name, None)
+            if src is None:
+                return
+            self._sync_listeners(removed=[loop_name])
+            self.engine.mixer.remove_source(src)
+            st = src.stats()
+            for k in ('late', 'dropped', 'concealed', 'compressed', 'skipped'):
+                self._listen_retired[k] = self._listen_retired.get(k, 0) + st[k]
+            self.status = f"Unlisten {loop_name}"
+            self._notify()
+
+    def say_again(self, loop=None, seconds=None, speed=1.0):
+        """
+        Play the last `seconds` (default: the whole window) heard on `loop`
+        (default: the joined loop) into the output, `speed` times faster at
+        the same pitch. Returns the playing time in seconds, 0 if nothing.
+        """
+        src = self.listens.get(loop, self.source)
+        if src.replay is None:
+            return 0.0
+        speed = max(1.0, min(MAX_SPEED, float(speed)))
+        clip = src.replay.snapshot(None if seconds is None else float(seconds))
+        if not len(clip):
+            return 0.0
+        played = self.replay.load(time_stretch(clip, speed), gain=src.gain,
+                                  loop=loop if loop in self.listens else self.loop)
+        self.status = f"Replay {played:.0f}s → {self.replay.loop or 'Root'}"
+        self._notify()
+        return played
+
+    def _sync_listeners(self, removed=()):
+        """Point audio routing at the listened loops and tell the server."""
+        cids = {}
+        for name, src in self.listens.items():
+            cid = self._channel_ids.get(name)
+            if cid is not None:
+                cids[cid] = src
+        gone = [self._channel_ids[n] for n in removed if n in self._channel_ids]
+        self._listen_cids = cids
+        if self.is_connected() and (cids or gone):
+            me = self.client.users.myself
+            self.client.execute_command(
+                ListenCmd(me['session'], add=list(cids), remove=gone), blocking=False)
+
+    def _source_stats(self):
+        """stats() over the joined loop's and every listened loop's source."""
+        st = self.source.stats()
+        for k, v in self._listen_retired.items():
+            st[k] += v
+        for src in list(self.listens.values()):
+            for k, v in src.stats().items():
+                st[k] = max(st[k], v) if k == 'jitter' else st[k] + v
+        return st
+
     def talk(self):
-        self.streaming = True
-        self.status    = f"Talk → {self.loop or 'Root'}"
+        """
+        Open the mic once the server confirms we are in the joined loop's
+        channel; otherwise stay muted and raise ValueError.
+        """
+        with self.lock:
+            if not self.is_connected() \
+                    or (self.loop is not None and self._target_cid is None) \
+                    or not self._wait_in_channel():
+                self.mute()
+                raise ValueError(f"not in {self.loop or 'Root'} yet; mic stays closed")
+            self.streaming = True
+            self.status    = f"Talk → {self.loop or 'Root'}"
+            self._notify()
 
     def mute(self):
-        self.streaming = False
-        self.status    = f"Muted → {self.loop or 'Root'}"
+        with self.lock:
+            self.streaming = False
+            self.voice     = False
+            self._held_block = None
+            self.status    = f"Muted → {self.loop or 'Root'}"
+            self._notify()
+
+    def mute_after_delay(self):
+        """Mute once the audio already in the delay line has been sent."""
+        def delayed_mute():
+            time.sleep(self.audio_delay_seconds)
+            self.mute()
+        threading.Thread(target=delayed_mute, daemon=True).start()
+
+    def leave_after_delay(self):
+        def delayed_leave():
+            time.sleep(self.audio_delay_seconds)
+            with self.lock:
+                self.mute()
+                self.leave()
+        threading.Thread(target=delayed_leave, daemon=True).start()
+
+    def _register_metrics(self):
+        # evaluated at scrape time, so the audio path pays nothing for them
+        stats, name = self._source_stats, self.name
+        JITTER_DEPTH.labels(bot=name).set_function(lambda: stats()['depth'])
+        JITTER.labels(bot=name).set_function(lambda: stats()['jitter'])
+        SPEAKERS.labels(bot=name).set_function(lambda: stats()['speakers'])
+        for outcome in ('late', 'dropped', 'concealed', 'compressed', 'skipped'):
+            FRAMES.labels(bot=name, outcome=outcome).set_function(
+                lambda k=outcome: stats()[k])
+        TALK_DELAY.labels(bot=name).set_function(
+            lambda: self.delay_line.seconds if self.audio_delay_enabled else 0.0)
+        SEND_BUFFER.labels(bot=name).set_function(self._send_backlog)
+        SEND_SHED.labels(bot=name).set_function(lambda: self.send_shed)
+        VAD_SUPPRESSED.labels(bot=name).set_function(lambda: self.vad_suppressed)
+
+    def _send_backlog(self):
+        # the client is replaced on reconnect and None while on standby
+        out = getattr(self.client, 'sound_output', None)
+        try:
+            return out.get_buffer_size() if out is not None else 0.0
+        except Exception:
+            return 0.0
+
+    def level_frame(self):
+        """
+        One /levels frame: microphone, received loop audio (before the
+        volume) and sent audio, each as (peak, rms) in level_bytes() scale,
+        then the number of listened loops and their received (peak, rms) in
+        name order, as listed by report().
+        """
+        listened = [src for _, src in sorted(list(self.listens.items()))][:255]
+        return (level_bytes(self.engine.mic_meter.read())
+                + level_bytes(self.source.level)
+                + level_bytes(self.tx_meter.read())
+                + bytes([len(listened)])
+                + b"".join(level_bytes(src.level) for src in listened))
+
+    def health(self):
+        """Liveness details for the start_all.py supervisor."""
+        return {**self.readiness(), **self.engine.heartbeat(),
+                'status': self.status, 'loop': self.loop}
+
+    # --- batched transitions ---
+    def apply(self, ops):
+        """
+        Apply an ordered list of operations, e.g. [{"op": "join", "loop": X},
+        {"op": "talk"}], under one lock. Every operation is validated before
+        any is applied. A talk waits for the server to confirm the preceding
+        join, so the mic never opens on the previous channel: if a join names
+        a loop with no channel, or the move is not confirmed, the rest of the
+        batch is abandoned with ValueError and the bot is left muted.
+        """
+        for o in ops:
+            if not isinstance(o, dict) or o.get('op') not in BATCH_OPS:
+                raise ValueError(f"unknown operation: {o!r}")
+        with self.lock:
+            for o in ops:
+                op = o['op']
+                if op == 'join':
+                    self.join(o.get('loop'), priority=o.get('priority', 0))
+                    # unconnected (lazy) bots resolve the channel on connect
+                    if o.get('loop') is not None and self._target_cid is None \
+                            and self.is_connected():
+                        self.mute()
+                        raise ValueError(f"no such loop: {o.get('loop')!r}")
+                elif op == 'leave':
+                    self.leave()
+                elif op == 'park':
+                    self.park(o.get('loop'))
+                elif op == 'standby':
+                    self.standby()
+                elif op == 'listen':
+                    self.listen(o.get('loop'), o.get('priority', 0))
+                elif op == 'unlisten':
+                    self.unlisten(o.get('loop'))
+                elif op == 'talk':
+                    self.talk()
+                elif op == 'mute':
+                    self.mute()
+                elif op in ('volume', 'set_volume'):
+                    self.set_volume(o.get('volume', 1.0), o.get('loop'))
+                elif op == 'delay':
+                    if o.get('enabled', True):
+                        self.enable_audio_delay(o.get('seconds', 3))
+                    else:
+                        self.disable_audio_delay()
+                elif op == 'delay_on':
+                    self.enable_audio_delay(o.get('seconds', 3))
+                elif op == 'delay_off':
+                    self.disable_audio_delay()
+                elif op == 'replay':
+                    if o.get('stop'):
+                        self.replay.stop()
+                    else:
+                        self.say_again(o.get('loop'), o.get('seconds'), o.get('speed', 1.0))
+                elif op == 'mute_after_delay':
+                    self.mute_after_delay()
+                elif op == 'leave_after_delay':
+                    self.leave_after_delay()
+            return self.report()
 
     def stop(self):
         self.mute()
-        try: self._mic_stream.close()
-        except: pass
+        for loop in list(self.listens):
+            self.unlisten(loop)
+        self.engine.mixer.remove_source(self.source)
+        self.engine.mixer.remove_source(self.replay)
+        self.engine.remove_bot(self)
         self.status = "Stopped"
+        self._notify()
 
-    def set_volume(self, vol):
+    def set_volume(self, vol, loop=None):
         """
-        Set playback volume (0.0-1.0).
+        Set playback volume (0.0-1.0) of a listened loop, or else of the
+        joined loop.
         """
-        self.playback_volume = max(0.0, min(1.0, float(vol)))
+        src = self.listens.get(loop, self.source)
+        src.gain = max(0.0, min(1.0, float(vol)))
 
-    def _update_user_map(self):
-        channel_users = {}
-        try:
-            chans = {int(cid): ch for cid, ch in self.client.channels.items()}
-        except Exception:
-            chans = {}
-        users = getattr(self.client, 'users', {})
-        for user in users.values():
-            try:
-                ch_id = getattr(user, 'channel_id', None)
-                if ch_id is None:
-                    ch_id = user.get('channel_id', None)
-                if ch_id is not None:
-                    channel_users.setdefault(ch_id, 0)
-                    channel_users[ch_id] += 1
-            except Exception:
-                continue
-        self._users_by_channel = channel_users
+    # --- channel / user index ---
+    def _clear_index(self):
+        self.activity.clear()       # sessions are reassigned on reconnect
+        with self._index_lock:
+            self._channel_ids.clear()
+            self._channel_names.clear()
+            self._user_channel.clear()
+            self._users_by_channel.clear()
+            self._user_counts.clear()
+
+    def _rebuild_index(self):
+        """Full resync from pymumble's tables; only needed on (re)connect."""
+        self._clear_index()
+        for ch in list(self.client.channels.values()):
+            self._on_channel_created(ch, notify=False)
+        for user in list(getattr(self.client, 'users', {}).values()):
+            self._on_user_created(user, notify=False)
+        self._notify()
+
+    def _on_connected(self):
+        # (re)connected: pymumble starts us in Root, so return to our loop
+        self._tap_encoder()     # a new connection has a new sound_output
+        self._rebuild_index()
+        if self.loop is not None:
+            self._target_cid = self._move_to_loop()
+        # the server forgets our listeners with the old session
+        self._sync_listeners()
+
+    def _count(self, cid, delta):
+        # caller holds _index_lock
+        n = self._users_by_channel.get(cid, 0) + delta
+        self._users_by_channel[cid] = n
+        name = self._channel_names.get(cid)
+        if name is not None and self._channel_ids.get(name) == cid:
+            self._user_counts[name] = n
+
+    def _on_channel_created(self, channel, notify=True):
+        cid, name = channel['channel_id'], channel.get('name', '')
+        with self._index_lock:
+            self._channel_names[cid] = name
+            self._channel_ids.setdefault(name, cid)   # first channel of a name wins
+            if self._channel_ids[name] == cid:
+                self._user_counts[name] = self._users_by_channel.get(cid, 0)
+        if notify:
+            self._notify()
+
+    def _on_channel_removed(self, channel):
+        cid = channel['channel_id']
+        with self._index_lock:
+            name = self._channel_names.pop(cid, None)
+            if name is not None and self._channel_ids.get(name) == cid:
+                del self._channel_ids[name]
+                self._user_counts.pop(name, None)
+        self._notify()
+
+    def _on_channel_updated(self, channel, actions):
+        if 'name' in actions:
+            self._on_channel_removed(channel)
+            self._on_channel_created(channel)
+
+    def _on_user_created(self, user, notify=True):
+        self._tap_user(user)
+        cid = user.get('channel_id', 0)
+        with self._index_lock:
+            old = self._user_channel.get(user['session'])
+            if old is not None:
+                self._count(old, -1)
+            self._user_channel[user['session']] = cid
+            self._count(cid, +1)
+        if notify:
+            self._notify()
+
+    def _on_user_updated(self, user, actions):
+        if 'channel_id' in actions:
+            self._on_user_created(user)
+
+    def _on_user_removed(self, user, message):
+        self.activity.remove(user['session'])
+        with self._index_lock:
+            cid = self._user_channel.pop(user['session'], None)
+            if cid is not None:
+                self._count(cid, -1)
+        self._notify()
+
+    def _notify(self):
+        """Push the status to /events subscribers if it changed."""
+        rep = self.report()
+        if rep != self._last_report:
+            self._last_report = rep
+            self.events.publish(rep)
 
     def get_channel_user_count(self, name):
-        for cid, ch in self.client.channels.items():
-            chname = getattr(ch, 'name', None) or ch.get('name', '')
-            if chname == name:
-                return self._users_by_channel.get(int(cid), 0)
-        return 0
+        return self._user_counts.get(name, 0)
 
     def report(self):
-        user_counts = {}
-        for cid, ch in self.client.channels.items():
-            chname = getattr(ch, 'name', None) or ch.get('name', '')
-            user_counts[chname] = self._users_by_channel.get(int(cid), 0)
+        with self._index_lock:
+            user_counts = dict(self._user_counts)
         return {
             'status':     self.status,
             'loop':       self.loop,
+            'parked':     self.parked,
+            'listening':  sorted(self.listens),
             'talking':    self.streaming,
+            'voice':      self.voice,
             'device_in':  self.dev_in,
             'device_out': self.dev_out,
             'user_counts': user_counts,
+            'speakers':   self.speakers(),
         }
 
 # --- FLASK API SERVER ---
-app = Flask(__name__)
-CORS(app)
-bot = LoopBot()
-
-@app.route('/status')
-def status():
-    return jsonify(bot.report())
-
-@app.route('/join', methods=['POST'])
-def join():
-    bot.join(request.json.get('loop'))
-    return jsonify(ok=True)
-
-@app.route('/leave', methods=['POST'])
-def leave():
-    bot.leave()
-    return jsonify(ok=True)
-
-@app.route('/talk', methods=['POST'])
-def talk():
-    bot.talk()
-    return jsonify(ok=True)
-
-@app.route('/mute', methods=['POST'])
-def mute():
-    bot.mute()
-    return jsonify(ok=True)
-
-@app.route('/device_in', methods=['POST'])
-def device_in():
-    bot.set_input(int(request.json['device']))
-    return jsonify(ok=True)
-
-@app.route('/device_out', methods=['POST'])
-def device_out():
-    bot.set_output(int(request.json['device']))
-    return jsonify(ok=True)
-
-@app.route('/stop', methods=['POST'])
-def stop():
-    bot.stop()
-    return jsonify(ok=True)
-
-@app.route('/users')
-def users():
-    users = []
-    for user in getattr(bot.client, "users", {}).values():
-        u_name = getattr(user, "name", None) or user.get("name")
-        users.append(u_name)
-    return jsonify(users=users)
-
-@app.route('/delay_on', methods=['POST'])
-def delay_on():
-    data = request.get_json(silent=True) or {}
-    seconds = data.get('seconds', 3)
-    bot.enable_audio_delay(seconds)
-    return jsonify(ok=True)
-
-@app.route('/delay_off', methods=['POST'])
-def delay_off():
-    bot.disable_audio_delay()
-    return jsonify(ok=True)
-
-@app.route('/leave_after_delay', methods=['POST'])
-def leave_after_delay():
-    def delayed_leave():
-        time.sleep(bot.audio_delay_seconds)
-        bot.mute()
+def create_app(bot):
+    """Build the HTTP control API for one bot."""
+    app = Flask(__name__)
+    CORS(app)
+
+    @app.route('/status')
+    def status():
+        return jsonify(bot.report())
+
+    @app.route('/ready')
+    def ready():
+        """Readiness probe for start_all.py: 200 once usable, else 503."""
+        info = bot.readiness()
+        return jsonify(info), (200 if info['ready'] else 503)
+
+    @app.route('/health')
+    def health():
+        return jsonify(bot.health())
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus text: this bot's series plus the shared audio engine's."""
+        return Response(REGISTRY.render({'bot': bot.name}),
+                        mimetype='text/plain; version=0.0.4')
+
+    @app.route('/metrics.json')
+    def metrics_json():
+        """The same series with recent-window percentiles for histograms."""
+        return jsonify(pid=os.getpid(), bot=bot.name,
+                       metrics=REGISTRY.snapshot({'bot': bot.name}))
+
+    @app.route('/levels')
+    def levels():
+        """Binary meter stream: LEVEL_HZ frames per second of level_frame()."""
+        def frames():
+            period = 1.0 / LEVEL_HZ
+            while True:
+                yield bot.level_frame()
+                time.sleep(period)
+        return Response(frames(), mimetype='application/octet-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
+    @app.route('/replay', methods=['POST'])
+    def replay():
+        """
+        Say again: {"loop", "seconds", "speed" (1.0-1.5)} all optional, or
+        {"stop": true} to cut a replay short.
+        """
+        data = request.get_json(silent=True) or {}
+        if data.get('stop'):
+            bot.replay.stop()
+            return jsonify(ok=True, seconds=0)
+        try:
+            played = bot.say_again(data.get('loop'), data.get('seconds'), data.get('speed', 1.0))
+        except (TypeError, ValueError) as e:
+            return jsonify(ok=False, error=str(e)), 400
+        return jsonify(ok=True, seconds=played)
+
+    @app.route('/recordings')
+    def recordings():
+        """Recorded segments per loop: [{start, end, bytes}]."""
+        if recorder is None:
+            return jsonify(error="recording is off (start with --record)"), 404
+        return jsonify(recorder.catalog())
+
+    @app.route('/recording')
+    def recording():
+        """
+        Stream ?loop=&start=&end= (epoch seconds; default the last minute),
+        optionally &speaker=<session>, as MAGIC then recorder records: the
+        Opus packets as received, never decoded.
+        """
+        if recorder is None:
+            return jsonify(error="recording is off (start with --record)"), 404
+        try:
+            end   = float(request.args.get('end', time.time()))
+            start = float(request.args.get('start', end - 60))
+            speaker = request.args.get('speaker', type=int)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        loop = request.args.get('loop') or bot.loop or "Root"
+        def records():
+            yield MAGIC
+            for t, session, seq, opus in recorder.read(loop, start, end, speaker):
+                yield REC.pack(t, session, seq, len(opus)) + opus
+        return Response(records(), mimetype='application/octet-stream')
+
+    @app.route('/events')
+    def events():
+        """Server-Sent Events: the status now, then again on every change."""
+        return Response(bot.events.stream(bot.report),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
+    @app.route('/join', methods=['POST'])
+    def join():
+        bot.join(request.json.get('loop'), priority=request.json.get('priority', 0))
+        return jsonify(ok=True)
+
+    @app.route('/leave', methods=['POST'])
+    def leave():
         bot.leave()
-    threading.Thread(target=delayed_leave, daemon=True).start()
-    return jsonify(ok=True)
+        return jsonify(ok=True)
 
-@app.route('/mute_after_delay', methods=['POST'])
-def mute_after_delay():
-    def delayed_mute():
-        time.sleep(bot.audio_delay_seconds)
+    @app.route('/listen', methods=['POST'])
+    def listen():
+        try:
+            bot.listen(request.json['loop'], request.json.get('priority', 0))
+        except ValueError as e:
+            return jsonify(ok=False, error=str(e)), 400
+        return jsonify(ok=True)
+
+    @app.route('/unlisten', methods=['POST'])
+    def unlisten():
+        bot.unlisten(request.json['loop'])
+        return jsonify(ok=True)
+
+    @app.route('/park', methods=['POST'])
+    def park():
+        bot.park(request.json.get('loop'))
+        return jsonify(ok=True)
+
+    @app.route('/standby', methods=['POST'])
+    def standby():
+        bot.standby()
+        return jsonify(ok=True)
+
+    @app.route('/talk', methods=['POST'])
+    def talk():
+        try:
+            bot.talk()
+        except ValueError as e:
+            return jsonify(ok=False, error=str(e)), 400
+        return jsonify(ok=True)
+
+    @app.route('/mute', methods=['POST'])
+    def mute():
         bot.mute()
-    threading.Thread(target=delayed_mute, daemon=True).start()
-    return jsonify(ok=True)
+        return jsonify(ok=True)
 
-@app.route('/set_volume', methods=['POST'])
-def set_volume():
-    """
-    Set the playback volume for this bot (0.0–1.0).
-    """
-    vol = float(request.json.get('volume', 1.0))
-    bot.set_volume(vol)
-    return jsonify(ok=True)
+    @app.route('/device_in', methods=['POST'])
+    def device_in():
+        bot.set_input(int(request.json['device']))
+        return jsonify(ok=True)
+
+    @app.route('/device_out', methods=['POST'])
+    def device_out():
+        bot.set_output(int(request.json['device']))
+        return jsonify(ok=True)
+
+    @app.route('/stop', methods=['POST'])
+    def stop():
+        bot.stop()
+        return jsonify(ok=True)
+
+    @app.route('/users')
+    def users():
+        users = []
+        for user in getattr(bot.client, "users", {}).values():
+            u_name = getattr(user, "name", None) or user.get("name")
+            users.append(u_name)
+        return jsonify(users=users)
+
+    @app.route('/delay_on', methods=['POST'])
+    def delay_on():
+        data = request.get_json(silent=True) or {}
+        seconds = data.get('seconds', 3)
+        bot.enable_audio_delay(seconds)
+        return jsonify(ok=True)
+
+    @app.route('/delay_off', methods=['POST'])
+    def delay_off():
+        bot.disable_audio_delay()
+        return jsonify(ok=True)
+
+    @app.route('/leave_after_delay', methods=['POST'])
+    def leave_after_delay():
+        bot.leave_after_delay()
+        return jsonify(ok=True)
+
+    @app.route('/mute_after_delay', methods=['POST'])
+    def mute_after_delay():
+        bot.mute_after_delay()
+        return jsonify(ok=True)
+
+    @app.route('/batch', methods=['POST'])
+    @app.route('/transition', methods=['POST'])
+    def batch():
+        """
+        Apply {"ops": [{"op": ..., ...}, ...]} in order under the bot's lock
+        and answer once with the resulting status.
+        """
+        data = request.get_json(silent=True) or {}
+        try:
+            report = bot.apply(data.get('ops', []))
+        except ValueError as e:
+            return jsonify(ok=False, error=str(e)), 400
+        return jsonify(ok=True, status=report)
+
+    @app.route('/set_volume', methods=['POST'])
+    def set_volume():
+        """
+        Set the playback volume for this bot (0.0–1.0), or with "loop" for
+        one of its listened loops.
+        """
+        vol = float(request.json.get('volume', 1.0))
+        bot.set_volume(vol, request.json.get('loop'))
+        return jsonify(ok=True)
+
+    return app
+
+# --- PROCESS ENTRY POINT ---
+def bot_names(base, count):
+    """Bot i is named base, base1, base2, ... like start_all.py always did."""
+    return [base if i == 0 else f"{base}{i}" for i in range(count)]
+
+def main():
+    global engine, certs, recorder
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bot-name", required=True)
+    parser.add_argument("--api-port", required=True, type=int)
+    parser.add_argument("--server", required=True)
+    parser.add_argument("--port", required=True, type=int)
+    parser.add_argument("--bot-count", type=int, default=1,
+                        help="host this many bots in one process, on "
+                             "consecutive API ports starting at --api-port")
+    parser.add_argument("--jitter-ms", type=int, default=40,
+                        help="minimum jitter buffer depth per speaker")
+    parser.add_argument("--jitter-max-ms", type=int, default=200,
+                        help="jitter buffer ceiling; older audio is skipped")
+    parser.add_argument("--jitter-policy", choices=POLICIES, default="drop_oldest",
+                        help="how a jitter buffer sheds a backlog before the ceiling")
+    parser.add_argument("--send-max-ms", type=int, default=200,
+                        help="mic audio dropped while pymumble has more than this queued")
+    parser.add_argument("--vad", action="store_true",
+                        help="only send mic audio while voice is detected")
+    parser.add_argument("--vad-threshold-db", type=float, default=-50.0,
+                        help="voice gate never opens below this level (dBFS)")
+    parser.add_argument("--vad-hangover-ms", type=int, default=300,
+                        help="keep the gate open this long after voice stops")
+    parser.add_argument("--capture-ms", type=int, choices=(10, 20),
+                        help="low-latency mic blocks of this many ms "
+                             "(default: 2048 samples, 100 ms latency)")
+    parser.add_argument("--capture-int16", action="store_true",
+                        help="capture int16 straight from PortAudio")
+    parser.add_argument("--cert-key-type", choices=KEY_TYPES, default="rsa",
+                        help="key type for new bot identities")
+    parser.add_argument("--cert-pool", type=int, default=2,
+                        help="spare identities kept pre-generated in certs/pool")
+    parser.add_argument("--replay-seconds", type=float, default=30,
+                        help="say-again window kept per loop; 0 turns it off")
+    parser.add_argument("--duck-db", type=float, default=-12.0,
+                        help="attenuation of lower-priority loops while a "
+                             "higher-priority one is active; 0 turns it off")
+    parser.add_argument("--record", action="store_true",
+                        help="archive every loop's Opus packets under --record-dir")
+    parser.add_argument("--record-dir", default=os.path.join(script_dir, "recordings"))
+    parser.add_argument("--lazy-bots", type=int, default=0,
+                        help="the last N bots of this process connect to Mumble "
+                             "only when first assigned a loop")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, handle_exit)
+    signal.signal(signal.SIGINT, handle_exit)
+
+    engine = AudioEngine(capture_ms=args.capture_ms, capture_int16=args.capture_int16,
+                         duck_db=args.duck_db)
+    certs  = CertManager(key_type=args.cert_key_type, pool_size=args.cert_pool)
+    if args.record:
+        recorder = Recorder(args.record_dir)
+    names = bot_names(args.bot_name, max(1, args.bot_count))
+    first_lazy = len(names) - max(0, args.lazy_bots)
+    with ThreadPoolExecutor(max_workers=len(names)) as ex:
+        bots = list(ex.map(lambda i: LoopBot(
+            names[i], engine, args.server, args.port, certs=certs,
+            jitter_ms=args.jitter_ms, jitter_max_ms=args.jitter_max_ms,
+            jitter_policy=args.jitter_policy, send_max_ms=args.send_max_ms,
+            vad=args.vad, vad_threshold_db=args.vad_threshold_db,
+            vad_hangover_ms=args.vad_hangover_ms, recorder=recorder,
+            replay_seconds=args.replay_seconds,
+            lazy=i >= first_lazy,
+        ), range(len(names))))
+
+    # Listen first so /ready answers at once, then connect every non-lazy
+    # bot concurrently; start_all.py polls /ready instead of sleeping.
+    servers = [
+        make_server('127.0.0.1', args.api_port + i, create_app(b), threaded=True)
+        for i, b in enumerate(bots)
+    ]
+    for srv in servers[1:]:
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+    for b in bots:
+        if not b.lazy:
+            threading.Thread(target=b.connect, daemon=True).start()
+    engine.start()
+    certs.start_refill()    # spares for the next new bot name, off the critical path
+    servers[0].serve_forever()
 
 if __name__ == '__main__':
-    app.run(host='127.0.0.1', port=args.api_port)
+    main()
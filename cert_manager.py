@@ -0,0 +1,183 @@
+"""
+TLS client identities for the Mumble bots.
+
+Identities live in certs/ as <bot name>.pem and <bot name>-key.pem, exactly as
+before, so existing bots keep their registered certificates. When a bot name
+has no identity yet, a spare one is taken from certs/pool/<key type>/, which
+a background thread keeps filled, so a new console never waits on key
+generation. certs/index.json records which identity each bot name uses.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+CERT_DIR  = os.path.join(os.path.dirname(os.path.abspath(__file__)), "certs")
+KEY_TYPES = ("rsa", "ec")   # "ec" (P-256) is much faster, if the server accepts it
+STALE_LOCK = 120.0          # seconds after which a refill lock is taken as abandoned
+
+
+def generate_identity(common_name, key_type="rsa"):
+    """Return (cert PEM, key PEM) for a new self-signed identity."""
+    if key_type == "ec":
+        key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, u"{}".format(common_name))])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=3650))
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    return cert.public_bytes(serialization.Encoding.PEM), key_pem
+
+
+class CertManager:
+    """
+    Hands out a (certfile, keyfile) pair per bot name and keeps a pool of
+    pre-generated spare identities.
+    """
+    def __init__(self, cert_dir=CERT_DIR, key_type="rsa", pool_size=2):
+        if key_type not in KEY_TYPES:
+            raise ValueError(f"unknown key type: {key_type}")
+        self.cert_dir  = cert_dir
+        self.key_type  = key_type
+        self.pool_size = pool_size
+        self.pool_dir  = os.path.join(cert_dir, "pool", key_type)
+        self.index_file = os.path.join(cert_dir, "index.json")
+        self._lock     = threading.Lock()
+        self._refilling = False
+        os.makedirs(self.pool_dir, exist_ok=True)
+
+    def paths(self, bot_name):
+        return (os.path.join(self.cert_dir, f"{bot_name}.pem"),
+                os.path.join(self.cert_dir, f"{bot_name}-key.pem"))
+
+    def get(self, bot_name):
+        """Identity for `bot_name`: existing, else a pooled spare, else a new one."""
+        certfile, keyfile = self.paths(bot_name)
+        if os.path.isfile(certfile) and os.path.isfile(keyfile):
+            return certfile, keyfile
+        if self._claim(certfile, keyfile):
+            print(f"[CERT] Assigned pooled {self.key_type} identity to {bot_name}")
+        else:
+            cert_pem, key_pem = generate_identity(bot_name, self.key_type)
+            self._write(certfile, cert_pem, keyfile, key_pem)
+            print(f"[CERT] Generated new certificate for {bot_name}: {certfile}")
+        self._record(bot_name, certfile, keyfile)
+        self.start_refill()
+        return certfile, keyfile
+
+    # --- pool ---
+    def _pool_entries(self):
+        try:
+            names = os.listdir(self.pool_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(n[:-len("-key.pem")] for n in names if n.endswith("-key.pem"))
+
+    def _claim(self, certfile, keyfile):
+        # Pool entries are published cert first, key last, and claimed by
+        # renaming the key: the rename is atomic, so two bot processes can
+        # never receive the same identity.
+        for ident in self._pool_entries():
+            src_key  = os.path.join(self.pool_dir, f"{ident}-key.pem")
+            src_cert = os.path.join(self.pool_dir, f"{ident}.pem")
+            try:
+                os.replace(src_key, keyfile)
+            except FileNotFoundError:
+                continue
+            os.replace(src_cert, certfile)
+            return True
+        return False
+
+    def _write(self, certfile, cert_pem, keyfile, key_pem):
+        for path, data in ((certfile, cert_pem), (keyfile, key_pem)):
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def missing(self, bot_names):
+        """The names among bot_names that have no identity yet."""
+        return [n for n in bot_names if not all(map(os.path.isfile, self.paths(n)))]
+
+    def fill_pool(self, size=None):
+        """
+        Generate spare identities until the pool holds `size` (default
+        pool_size) of them. Bot processes share the pool, so only the one
+        holding the pool's lock file refills it; the others return at once.
+        """
+        size = self.pool_size if size is None else size
+        lock = os.path.join(self.pool_dir, ".refill.lock")
+        try:
+            if time.time() - os.path.getmtime(lock) > STALE_LOCK:
+                os.remove(lock)     # left behind by a process that died
+        except OSError:
+            pass
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            while len(self._pool_entries()) < size:
+                ident = uuid.uuid4().hex[:12]
+                cert_pem, key_pem = generate_identity(f"mc-comms-{ident}", self.key_type)
+                self._write(os.path.join(self.pool_dir, f"{ident}.pem"), cert_pem,
+                            os.path.join(self.pool_dir, f"{ident}-key.pem"), key_pem)
+        finally:
+            os.close(fd)
+            os.remove(lock)
+
+    def start_refill(self):
+        """Top up the pool on a background thread (no-op if already running)."""
+        with self._lock:
+            if self._refilling or self.pool_size <= 0:
+                return
+            self._refilling = True
+
+        def refill():
+            try:
+                self.fill_pool()
+            except Exception as e:
+                print(f"[CERT] Pool refill failed: {e}")
+            finally:
+                self._refilling = False
+        threading.Thread(target=refill, daemon=True).start()
+
+    # --- index ---
+    def _record(self, bot_name, certfile, keyfile):
+        with self._lock:
+            try:
+                with open(self.index_file, "r") as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+            index[bot_name] = {
+                "cert": os.path.basename(certfile),
+                "key": os.path.basename(keyfile),
+                "type": self.key_type,
+            }
+            tmp = f"{self.index_file}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp, self.index_file)
@@ -19,14 +19,18 @@ def read_config():
     return None
 
 
-def write_config(server, port, bot_base, role):
+def write_config(server, port, bot_base, role, **extra):
+    # Keep optional keys (bot_count, single_process, ...) already on disk
+    cfg = read_config() or {}
+    cfg.update(extra)
+    cfg.update({
+        "server": server,
+        "port": port,
+        "bot_base": bot_base,
+        "role": role,
+    })
     with open(CONFIG_FILE, "w") as f:
-        json.dump({
-            "server": server,
-            "port": port,
-            "bot_base": bot_base,
-            "role": role,
-        }, f)
+        json.dump(cfg, f)
 
 
 def get_config_from_dialog():
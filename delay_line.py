@@ -0,0 +1,108 @@
+"""
+Sample-accurate audio delay for the talk path.
+
+The delay line is a preallocated circular int16 buffer that the microphone
+stream writes into and reads back from in the same callback, so it is
+clocked by the sound card's sample clock rather than by wall time. When the
+delay length changes at runtime the read position slews towards the new
+length by resampling each block slightly faster or slower, so audio is
+stretched or squeezed but never dropped or repeated.
+"""
+import threading
+import numpy as np
+
+SAMPLE_RATE = 48000
+SLEW        = 0.05      # max delay change per block, as a fraction of the block
+
+
+class DelayLine:
+    """
+    Fixed-memory delay of `seconds`, fed and drained one block at a time.
+    """
+    def __init__(self, seconds=3.0, slew=SLEW):
+        self.slew    = slew
+        self._lock   = threading.Lock()
+        self._buf    = np.zeros(0, dtype=np.int16)
+        self._out    = np.zeros(0, dtype=np.float32)
+        self._ramp   = np.zeros(0, dtype=np.float64)
+        self.reset(seconds)
+
+    def _capacity_for(self, delay):
+        # one spare second for the block being written and the slew overshoot
+        return int(delay) + SAMPLE_RATE
+
+    def reset(self, seconds):
+        """Empty the line and set the delay immediately (output is silence)."""
+        with self._lock:
+            self._target = int(round(float(seconds) * SAMPLE_RATE))
+            self._delay  = float(self._target)
+            cap = self._capacity_for(self._target)
+            if len(self._buf) != cap:
+                self._buf = np.zeros(cap, dtype=np.int16)
+            else:
+                self._buf[:] = 0
+            self._w = 0         # total samples written
+
+    def set_delay(self, seconds):
+        """Change the delay; the output glides to the new length."""
+        with self._lock:
+            self._target = int(round(float(seconds) * SAMPLE_RATE))
+            cap = self._capacity_for(max(self._target, int(self._delay) + 1))
+            if cap > len(self._buf):
+                self._grow(cap)
+
+    def _grow(self, cap):
+        # keep the most recent history in order, oldest sample first
+        old, size = self._buf, len(self._buf)
+        keep = min(self._w, size)
+        # by absolute position, so it is right before the ring has wrapped too
+        hist = old[np.arange(self._w - keep, self._w) % size] if keep else old[:0]
+        self._buf = np.zeros(cap, dtype=np.int16)
+        idx = np.arange(self._w - keep, self._w) % cap
+        self._buf[idx] = hist
+
+    @property
+    def seconds(self):
+        """Current (possibly still slewing) delay in seconds."""
+        return self._delay / SAMPLE_RATE
+
+    def process(self, pcm):
+        """Write one block of int16 PCM bytes and return the delayed block."""
+        x = np.frombuffer(pcm, dtype=np.int16)
+        n = len(x)
+        with self._lock:
+            buf, cap = self._buf, len(self._buf)
+            w0 = self._w
+            pos = w0 % cap
+            first = min(n, cap - pos)
+            buf[pos:pos+first] = x[:first]
+            buf[:n-first] = x[first:]
+            self._w += n
+
+            d0 = self._delay
+            step = self.slew * n
+            d1 = d0 + max(-step, min(step, self._target - d0))
+            self._delay = d1
+
+            if len(self._out) < n:
+                self._out  = np.zeros(n, dtype=np.float32)
+                self._ramp = np.arange(1, n + 1, dtype=np.float64)
+            out = self._out[:n]
+            if d0 == d1 and d0 == int(d0):
+                # steady state: plain copy from the ring
+                start = (w0 - int(d0)) % cap
+                first = min(n, cap - start)
+                out[:first] = buf[start:start+first]
+                out[first:] = buf[:n-first]
+            else:
+                # slewing: read position p_j = w0 + j - d_j, linear interpolation
+                ramp = self._ramp[:n]
+                p = (w0 - d0) + ramp - 1 - (d1 - d0) * ramp / n
+                i = np.floor(p)
+                frac = (p - i).astype(np.float32)
+                i = i.astype(np.int64) % cap
+                a = buf[i].astype(np.float32)
+                b = buf[(i + 1) % cap].astype(np.float32)
+                np.multiply(b - a, frac, out=out)
+                out += a
+        return out.astype(np.int16).tobytes()
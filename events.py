@@ -0,0 +1,92 @@
+"""
+Minimal publish/subscribe hub for Server-Sent Events (text/event-stream).
+
+bot_server.py uses it to push its status to the web UI as it changes, and
+web_ui_server.py uses it to push aggregated state diffs to browsers.
+"""
+import json
+import queue
+import threading
+
+
+def format_sse(data, event=None):
+    """Encode one SSE message; `data` is serialised as JSON."""
+    msg = f"data: {json.dumps(data, separators=(',', ':'))}\n\n"
+    if event:
+        msg = f"event: {event}\n" + msg
+    return msg
+
+
+class EventHub:
+    """
+    Fans published messages out to every connected stream. A subscriber
+    that falls `maxsize` messages behind is dropped; its client reconnects
+    and receives a fresh snapshot.
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._subs = set()
+        self._lock = threading.Lock()
+
+    def publish(self, data, event=None):
+        msg = format_sse(data, event)
+        with self._lock:
+            subs = list(self._subs)
+        for q in subs:
+            try:
+                q.put_nowait(msg)
+            except queue.Full:
+                with self._lock:
+                    self._subs.discard(q)
+                # replace the backlog with an end-of-stream marker
+                while not q.empty():
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+                q.put_nowait(None)
+
+    def stream(self, snapshot=None, keepalive=15.0):
+        """
+        Generator for a Flask streaming response. `snapshot` is a callable
+        returning the current full state, sent first so clients can resync.
+        """
+        q = queue.Queue(self.maxsize)
+        with self._lock:
+            self._subs.add(q)
+        try:
+            if snapshot is not None:
+                yield format_sse(snapshot(), "snapshot")
+            while True:
+                try:
+                    msg = q.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if msg is None:
+                    return
+                yield msg
+        finally:
+            with self._lock:
+                self._subs.discard(q)
+
+
+def read_sse(lines):
+    """
+    Parse an iterable of text lines (e.g. requests' iter_lines) into
+    (event, data) tuples; comments and keepalives are skipped.
+    """
+    event, data = None, []
+    for line in lines:
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = None, []
+        elif line.startswith(":"):
+            continue
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
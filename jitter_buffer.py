@@ -0,0 +1,262 @@
+"""
+Adaptive per-speaker jitter buffers for audio received from Mumble.
+
+Every remote user gets a SpeakerBuffer indexed by the Mumble sequence number
+(one step per 10 ms of audio). Packets are played out at a fixed depth behind
+the newest one, late packets are dropped, missing ones are concealed by
+fading out the last good frame, and the depth adapts to the measured
+inter-arrival jitter at the start of each talk spurt. A JitterSource holds all
+speakers of one loop and mixes them per output frame for the Mixer.
+
+Memory is fixed per speaker and latency never exceeds max_slots: beyond it
+the oldest audio is skipped. Before that ceiling, a backlog more than
+OVERLOAD_SLOTS above the target is shed by the speaker's policy:
+"drop_oldest" waits for the ceiling, "compress" cross-fades two slots into
+one (20 ms played in 10 ms), and "skip_silence" discards quiet slots.
+"""
+import math
+import threading
+import time
+import numpy as np
+
+SLOT          = 480     # samples per Mumble sequence step (10 ms at 48 kHz)
+SLOT_SECONDS  = 0.01
+MAX_CONCEAL   = 5       # missing slots concealed before a spurt is over
+CONCEAL_FADE  = 0.6     # gain applied per consecutive concealed slot
+SPEAKER_IDLE  = 30.0    # seconds before a silent speaker's buffer is freed
+OVERLOAD_SLOTS = 3      # backlog above target before a policy starts shedding
+SILENCE_LEVEL  = 300.0  # mean |sample| below which a slot counts as silence
+POLICIES      = ("drop_oldest", "compress", "skip_silence")
+_FADE_IN      = np.linspace(0.0, 1.0, SLOT, dtype=np.float32)
+
+
+class SpeakerBuffer:
+    """
+    Ring of 10 ms slots for one remote speaker, keyed on sequence number.
+    """
+    def __init__(self, target_slots=4, max_slots=20, on_play=None, policy="drop_oldest"):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overload policy: {policy}")
+        self.policy     = policy
+        self.min_target = max(1, target_slots)
+        self.max_slots  = max(self.min_target + 1, max_slots)
+        self.target     = self.min_target       # current adaptive depth
+        cap = 2 * self.max_slots
+        self._pcm     = np.zeros((cap, SLOT), dtype=np.float32)
+        self._have    = np.zeros(cap, dtype=bool)
+        self._arrived = np.zeros(cap, dtype=np.float64)   # arrival time per slot
+        self._level   = np.zeros(cap, dtype=np.float32)   # mean |sample| per slot
+        self._end     = None       # one past the newest sequence received
+        self._queued  = 0          # slots currently holding audio
+        self._play    = None       # next sequence to play; None = idle
+        self._pos     = 0          # samples already played from that slot
+        self._conceal = np.zeros(SLOT, dtype=np.float32)
+        self._fade    = 0.0        # gain of the concealment frame
+        self._missing = 0          # consecutive missing slots
+        self._transit = None       # last (arrival - sequence time)
+        self.jitter   = 0.0        # smoothed inter-arrival jitter (seconds)
+        self.last_arrival = 0.0
+        self.late = self.dropped = self.concealed = 0
+        self.compressed = self.skipped = 0     # slots shed by the policy
+        self.on_play  = on_play    # called with (play time - arrival) per slot
+
+    def _start_spurt(self, sequence):
+        want = int(math.ceil(2 * self.jitter / SLOT_SECONDS)) + 1
+        self.target  = max(self.min_target, min(self.max_slots, want))
+        self._have[:] = False
+        self._queued  = 0
+        self._play    = sequence - self.target
+        self._end     = sequence
+        self._pos     = 0
+        self._fade    = 0.0
+        self._missing = 0
+
+    def push(self, sequence, pcm, now):
+        """Store one decoded packet (int16 PCM bytes) received at `now`."""
+        arr = np.frombuffer(pcm, dtype=np.int16)
+        nslots = -(-len(arr) // SLOT)
+        cap = len(self._have)
+
+        # RFC 3550 style jitter estimate from arrival vs. sequence time
+        transit = now - sequence * SLOT_SECONDS
+        if self._transit is not None and self._play is not None:
+            self.jitter += (abs(transit - self._transit) - self.jitter) / 16
+        self._transit = transit
+        self.last_arrival = now
+
+        if (self._play is None or sequence + nslots <= self._play - cap
+                or sequence >= self._play + 2 * cap):
+            # idle, or the sender restarted its sequence numbering
+            self._start_spurt(sequence)
+        if sequence + nslots <= self._play:
+            self.late += 1
+            return
+        end = sequence + nslots
+        self._end = max(self._end, end)
+        if end - self._play > self.max_slots:
+            # more than max_slots buffered: skip ahead to bound the delay
+            skip = end - self.target - self._play
+            for s in range(self._play, self._play + skip):
+                if self._have[s % cap]:
+                    self._have[s % cap] = False
+                    self._queued -= 1
+                    self.dropped += 1
+            self._play += skip
+            self._pos = 0
+        for k in range(nslots):
+            s = sequence + k
+            if s < self._play:
+                continue
+            idx = s % cap
+            chunk = arr[k * SLOT:(k + 1) * SLOT]
+            self._pcm[idx, :len(chunk)] = chunk
+            self._pcm[idx, len(chunk):] = 0.0
+            self._arrived[idx] = now
+            if self.policy == "skip_silence":
+                self._level[idx] = np.abs(chunk).mean() if len(chunk) else 0.0
+            if not self._have[idx]:
+                self._have[idx] = True
+                self._queued += 1
+
+    def mix_into(self, out, now=None):
+        """Add the next len(out) samples of this speaker into `out`."""
+        if self._play is None:
+            return
+        cap = len(self._have)
+        filled = 0
+        while filled < len(out):
+            if self._pos == 0 and self.policy != "drop_oldest":
+                self._shed(cap)
+            idx = self._play % cap
+            take = min(SLOT - self._pos, len(out) - filled)
+            dst = out[filled:filled + take]
+            if self._have[idx]:
+                if self._pos == 0 and self.on_play is not None and now is not None:
+                    self.on_play(now - self._arrived[idx])
+                dst += self._pcm[idx, self._pos:self._pos + take]
+            else:
+                if self._pos == 0:
+                    if self._queued == 0 and self._missing >= MAX_CONCEAL:
+                        self._play = None       # talk spurt is over
+                        return
+                    self._missing += 1
+                    self._fade *= CONCEAL_FADE
+                    if self._fade > 0.0:
+                        self.concealed += 1
+                if self._fade > 0.0:
+                    dst += self._conceal[self._pos:self._pos + take] * self._fade
+            filled   += take
+            self._pos += take
+            if self._pos == SLOT:
+                if self._have[idx]:
+                    self._conceal[:] = self._pcm[idx]
+                    self._fade    = 1.0
+                    self._missing = 0
+                    self._have[idx] = False
+                    self._queued -= 1
+                self._play += 1
+                self._pos = 0
+
+    def _discard(self, idx):
+        self._have[idx] = False
+        self._queued -= 1
+        self._play += 1
+
+    def _shed(self, cap):
+        """At a slot boundary, shorten an overlong backlog by the policy."""
+        over = self._end - self._play - self.target - OVERLOAD_SLOTS
+        if over <= 0:
+            return
+        idx = self._play % cap
+        if self.policy == "skip_silence":
+            while over > 0 and self._have[idx] and self._level[idx] < SILENCE_LEVEL:
+                self._discard(idx)
+                self.skipped += 1
+                over -= 1
+                idx = self._play % cap
+        elif self.policy == "compress":
+            nxt = (self._play + 1) % cap
+            if self._have[idx] and self._have[nxt]:
+                # merge this slot into the next one with a cross-fade
+                a, b = self._pcm[idx], self._pcm[nxt]
+                b -= a
+                b *= _FADE_IN
+                b += a
+                self._discard(idx)
+                self.compressed += 1
+
+    def depth(self):
+        """Buffered audio ahead of the play position, in slots."""
+        return self._queued
+
+
+class JitterSource:
+    """
+    Mixer source for one loop: one SpeakerBuffer per remote user session,
+    all summed into the frame the Mixer asks for.
+    """
+    def __init__(self, target_ms=40, max_ms=200, gain=1.0, on_play=None, policy="drop_oldest"):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overload policy: {policy}")
+        self.gain = gain
+        self.level = (0.0, 0.0)     # (peak, rms) before gain, set by the Mixer
+        self.priority = 0           # the loop's ducking priority, see Mixer
+        self.policy = policy
+        self.on_play = on_play      # receive-to-mix latency hook, see SpeakerBuffer
+        self.replay = None          # optional ReplayRing fed with what is played
+        self.target_slots = max(1, int(target_ms / 10))
+        self.max_slots    = max(self.target_slots + 1, int(max_ms / 10))
+        self._speakers = {}         # session -> SpeakerBuffer
+        # counts of speakers already freed, so the totals never go backwards
+        self._retired  = {'late': 0, 'dropped': 0, 'concealed': 0, 'compressed': 0, 'skipped': 0}
+        self._lock = threading.Lock()
+
+    def push(self, session, sequence, pcm, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            sp = self._speakers.get(session)
+            if sp is None:
+                self._purge(now)
+                sp = SpeakerBuffer(self.target_slots, self.max_slots, self.on_play, self.policy)
+                self._speakers[session] = sp
+            sp.push(sequence, pcm, now)
+
+    def _purge(self, now):
+        for session, sp in list(self._speakers.items()):
+            if now - sp.last_arrival > SPEAKER_IDLE:
+                self._retire(sp)
+                del self._speakers[session]
+
+    def _retire(self, sp):
+        for k in self._retired:
+            self._retired[k] += getattr(sp, k)
+
+    def read_into(self, out):
+        out[:] = 0.0
+        now = time.time()
+        with self._lock:
+            for sp in self._speakers.values():
+                sp.mix_into(out, now)
+        if self.replay is not None:
+            self.replay.write(out)
+        return len(out)
+
+    def stats(self):
+        """Totals since creation plus the current depth, for the metrics."""
+        with self._lock:
+            st = dict(self._retired)
+            st['depth'] = st['jitter'] = 0
+            for sp in self._speakers.values():
+                for k in self._retired:
+                    st[k] += getattr(sp, k)
+                st['depth'] += sp.depth()
+                st['jitter'] = max(st['jitter'], sp.jitter)
+            st['speakers'] = len(self._speakers)
+        return st
+
+    def clear(self):
+        """Forget every speaker, e.g. after moving to another channel."""
+        with self._lock:
+            for sp in self._speakers.values():
+                self._retire(sp)
+            self._speakers.clear()
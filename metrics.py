@@ -0,0 +1,204 @@
+"""
+In-process metrics for the audio pipeline.
+
+Counters, gauges and histograms are registered in one process-wide REGISTRY
+and rendered in the Prometheus text format by bot_server.py's /metrics. A
+histogram keeps cumulative buckets for Prometheus and, in addition, a ring of
+its most recent observations so /metrics.json can report exact recent
+percentiles. Observing is a few arithmetic operations and no allocation, so
+it is safe inside PortAudio callbacks.
+"""
+import bisect
+import threading
+import numpy as np
+
+# seconds; spans one audio callback (sub-ms) up to a badly late packet
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.04, 0.06,
+                   0.08, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0)
+RING_SIZE = 1024
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self, match=None):
+        """
+        Prometheus text exposition. `match` is an optional {label: value}
+        filter: series carrying one of those labels with another value are
+        left out.
+        """
+        lines = []
+        for m in list(self._metrics):
+            series = [(suffix, labels, v) for suffix, labels, v in m.samples()
+                      if _matches(labels, match)]
+            if not series:
+                continue
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for suffix, labels, v in series:
+                lines.append(f"{m.name}{suffix}{_fmt_labels(labels)} {_fmt_value(v)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self, match=None):
+        """JSON-friendly {name: {type, help, series: [...]}} with ring percentiles."""
+        out = {}
+        for m in list(self._metrics):
+            series = [s for s in m.series() if _matches(s['labels'], match)]
+            if series:
+                out[m.name] = {'type': m.kind, 'help': m.help, 'series': series}
+        return out
+
+
+REGISTRY = Registry()
+
+
+def _matches(labels, match):
+    if not match:
+        return True
+    return all(labels.get(k, v) == v for k, v in match.items())
+
+def _fmt_labels(labels):
+    if not labels:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels.items())
+    return "{" + body + "}"
+
+def _fmt_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name       = name
+        self.help       = help
+        self.labelnames = tuple(labelnames)
+        self._children  = {}
+        self._lock      = threading.Lock()
+        registry.register(self)
+
+    def labels(self, **labels):
+        """The series for these label values, created on first use."""
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._child())
+        return child
+
+    def remove(self, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._children.pop(key, None)
+
+    def _items(self):
+        with self._lock:
+            items = list(self._children.items())
+        for key, child in items:
+            yield dict(zip(self.labelnames, key)), child
+
+    def samples(self):
+        for labels, child in self._items():
+            yield "", labels, child.get()
+
+    def series(self):
+        return [{'labels': labels, 'value': child.get()} for labels, child in self._items()]
+
+
+class _Value:
+    """A number, or a function evaluated at scrape time."""
+    def __init__(self):
+        self.value = 0.0
+        self._fn   = None
+
+    def inc(self, n=1):
+        self.value += n
+
+    def set(self, v):
+        self.value = v
+
+    def set_function(self, fn):
+        self._fn = fn
+
+    def get(self):
+        if self._fn is not None:
+            try:
+                return float(self._fn())
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _child = _Value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    _child = _Value
+
+
+class _HistogramValue:
+    def __init__(self, buckets, ring):
+        self.buckets = buckets
+        self.counts  = [0] * (len(buckets) + 1)   # last slot: above every bucket
+        self.sum     = 0.0
+        self.count   = 0
+        self.ring    = np.zeros(ring, dtype=np.float64)
+        self._n      = 0                           # observations written to the ring
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum   += v
+        self.count += 1
+        self.ring[self._n % len(self.ring)] = v
+        self._n += 1
+
+    def recent(self):
+        """The ring's observations (up to RING_SIZE most recent, unordered)."""
+        return self.ring[:min(self._n, len(self.ring))].copy()
+
+    def summary(self):
+        r = self.recent()
+        if not len(r):
+            return {'count': self.count, 'sum': self.sum}
+        p50, p95, p99 = np.percentile(r, (50, 95, 99))
+        return {'count': self.count, 'sum': self.sum, 'p50': float(p50),
+                'p95': float(p95), 'p99': float(p99), 'max': float(r.max())}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS,
+                 ring=RING_SIZE, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        self.ring    = ring
+        super().__init__(name, help, labelnames, registry)
+
+    def _child(self):
+        return _HistogramValue(self.buckets, self.ring)
+
+    def samples(self):
+        for labels, h in self._items():
+            acc = 0
+            for le, n in zip(self.buckets + (float("inf"),), h.counts):
+                acc += n
+                yield "_bucket", {**labels, 'le': _fmt_value(le)}, acc
+            yield "_sum", labels, h.sum
+            yield "_count", labels, h.count
+
+    def series(self):
+        return [{'labels': labels, **h.summary()} for labels, h in self._items()]
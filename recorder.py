@@ -0,0 +1,241 @@
+"""
+Loop recorder: every Opus packet heard or sent, stored still encoded.
+
+Bots hand packets to a Recorder as they arrive; a background thread appends
+them to one segment file per loop. Nothing is decoded or re-encoded, so
+recording every loop costs a queue put per packet on the audio path.
+
+A segment is a pair of files under <root>/<loop>/:
+
+  <start_ms>-<pid>.seg   MAGIC, then records: REC header + Opus payload
+  <start_ms>-<pid>.idx   INDEX_DTYPE entries (time, byte offset into .seg),
+                         one per INDEX_STEP seconds of audio
+
+Readers memory-map the index to find where a time range starts and read
+forward from there, so seeking into hours of audio touches a few bytes.
+Segments rotate every `segment_seconds` and close after IDLE_CLOSE seconds
+without packets. The pid keeps processes recording the same loop apart.
+"""
+import heapq
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import numpy as np
+from metrics import Counter, Gauge
+
+MAGIC       = b"MCOPUS01"
+REC         = struct.Struct("<dIIH")    # time, speaker session, sequence, payload bytes
+INDEX_DTYPE = np.dtype([("time", "<f8"), ("offset", "<u8")])
+INDEX_STEP  = 1.0       # seconds between index entries
+FLUSH_EVERY = 0.5       # seconds; how stale the files may be for readers
+IDLE_CLOSE  = 30.0      # seconds without packets before a segment is closed
+MAX_QUEUE   = 50000     # packets (~1000 s of one talker); beyond that, drop
+
+RECORDED = Counter("recorder_packets_total", "Opus packets written to recordings", ())
+REC_DROPS = Counter("recorder_dropped_total",
+                    "Opus packets dropped because the recorder queue was full", ())
+REC_QUEUE = Gauge("recorder_queue_packets", "Packets waiting for the recorder thread", ())
+
+
+def loop_dir(name):
+    """Directory name for a loop: anything but letters, digits, - and _ becomes _."""
+    return re.sub(r"[^A-Za-z0-9_-]", "_", name or "Root")
+
+
+def read_records(f, end=None, speaker=None):
+    """Yield (time, session, sequence, opus) from a record stream until `end`."""
+    while True:
+        head = f.read(REC.size)
+        if len(head) < REC.size:
+            return
+        t, session, seq, n = REC.unpack(head)
+        opus = f.read(n)
+        if len(opus) < n or (end is not None and t > end):
+            return          # a record still being written, or past the range
+        if speaker is None or session == speaker:
+            yield t, session, seq, opus
+
+
+class _Segment:
+    """One open .seg/.idx pair, written only by the recorder thread."""
+    def __init__(self, dirpath, start):
+        base = os.path.join(dirpath, f"{int(start * 1000)}-{os.getpid()}")
+        self.start = start
+        self.last  = start
+        self.data  = open(base + ".seg", "wb")
+        self.index = open(base + ".idx", "wb")
+        self.data.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.next_index = start
+
+    def write(self, t, session, seq, opus):
+        if t >= self.next_index:
+            self.index.write(struct.pack("<dQ", t, self.offset))
+            self.next_index = t + INDEX_STEP
+        self.data.write(REC.pack(t, session, seq, len(opus)))
+        self.data.write(opus)
+        self.offset += REC.size + len(opus)
+        self.last = t
+
+    def flush(self):
+        self.data.flush()
+        self.index.flush()
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+class EncoderTap:
+    """
+    Stands in for an Opus encoder: every frame it encodes is also passed to
+    `on_frame`. Everything else (e.g. setting bitrate) reaches the encoder.
+    """
+    def __init__(self, encoder, on_frame):
+        self.__dict__.update(_encoder=encoder, _on_frame=on_frame)
+
+    def encode(self, pcm, frame_size):
+        data = self._encoder.encode(pcm, frame_size)
+        self._on_frame(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._encoder, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._encoder, name, value)
+
+
+class Recorder:
+    """
+    Process-wide recorder shared by every bot. record() never blocks; the
+    files are written by one background thread.
+    """
+    def __init__(self, root="recordings", segment_seconds=600):
+        self.root = root
+        self.segment_seconds = segment_seconds
+        self.dropped  = 0
+        self._queue   = queue.Queue(MAX_QUEUE)
+        self._open    = {}              # loop name -> _Segment
+        self._running = True
+        os.makedirs(root, exist_ok=True)
+        REC_DROPS.labels().set_function(lambda: self.dropped)
+        REC_QUEUE.labels().set_function(self._queue.qsize)
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, loop, session, sequence, opus, now=None):
+        """Queue one Opus packet heard on (or sent to) `loop` by `session`."""
+        try:
+            self._queue.put_nowait((now or time.time(), loop, session, sequence, bytes(opus)))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        flushed = time.time()
+        while self._running or not self._queue.empty():
+            try:
+                item = self._queue.get(timeout=FLUSH_EVERY)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                t, loop, session, seq, opus = item
+                seg = self._open.get(loop)
+                if seg is None or t - seg.start >= self.segment_seconds:
+                    if seg is not None:
+                        seg.close()
+                    dirpath = os.path.join(self.root, loop_dir(loop))
+                    os.makedirs(dirpath, exist_ok=True)
+                    seg = self._open[loop] = _Segment(dirpath, t)
+                seg.write(t, session, seq, opus)
+                RECORDED.labels().inc()
+            now = time.time()
+            if now - flushed >= FLUSH_EVERY:
+                flushed = now
+                for loop, seg in list(self._open.items()):
+                    if now - seg.last > IDLE_CLOSE:
+                        seg.close()
+                        del self._open[loop]
+                    else:
+                        seg.flush()
+        for seg in self._open.values():
+            seg.close()
+        self._open.clear()
+
+    def stop(self):
+        """Write out everything queued and close the files."""
+        self._running = False
+        self._thread.join(timeout=5)
+
+    # --- reading ---
+    def segments(self, loop):
+        """[(start, base path)] of the loop's segments, oldest first."""
+        dirpath = os.path.join(self.root, loop_dir(loop))
+        try:
+            names = os.listdir(dirpath)
+        except FileNotFoundError:
+            return []
+        out = []
+        for name in names:
+            if name.endswith(".seg"):
+                start_ms = name.split("-", 1)[0]
+                if start_ms.isdigit():
+                    out.append((int(start_ms) / 1000.0, os.path.join(dirpath, name[:-4])))
+        return sorted(out)
+
+    def _index(self, base):
+        size = os.path.getsize(base + ".idx") // INDEX_DTYPE.itemsize
+        if not size:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return np.memmap(base + ".idx", dtype=INDEX_DTYPE, mode="r", shape=(size,))
+
+    def span(self, base):
+        """(first, last) indexed time of a segment; last is within INDEX_STEP."""
+        idx = self._index(base)
+        if not len(idx):
+            return None
+        return float(idx["time"][0]), float(idx["time"][-1])
+
+    def _read_segment(self, base, start, end, speaker):
+        idx = self._index(base)
+        i = int(np.searchsorted(idx["time"], start, side="right")) - 1
+        offset = int(idx["offset"][i]) if i >= 0 else len(MAGIC)
+        with open(base + ".seg", "rb") as f:
+            f.seek(offset)
+            for rec in read_records(f, end, speaker):
+                if rec[0] >= start:
+                    yield rec
+
+    def read(self, loop, start, end, speaker=None):
+        """
+        Yield (time, session, sequence, opus) recorded on `loop` between
+        start and end (epoch seconds), in time order, optionally for one
+        speaker session only.
+        """
+        parts = []
+        for s, base in self.segments(loop):
+            if s > end:
+                break
+            span = self.span(base)
+            # nothing in a segment comes INDEX_STEP or more after its last entry
+            if span is None or span[1] + INDEX_STEP < start:
+                continue
+            parts.append(self._read_segment(base, start, end, speaker))
+        return heapq.merge(*parts, key=lambda rec: rec[0])
+
+    def catalog(self):
+        """{loop dir: [{start, end, bytes}]} for every segment on disk."""
+        out = {}
+        for name in sorted(os.listdir(self.root)):
+            if not os.path.isdir(os.path.join(self.root, name)):
+                continue
+            rows = []
+            for start, base in self.segments(name):
+                span = self.span(base)
+                rows.append({'start': start, 'end': span[1] if span else start,
+                             'bytes': os.path.getsize(base + ".seg")})
+            out[name] = rows
+        return out
@@ -0,0 +1,145 @@
+"""
+Instant replay ("say again") of a loop's recent audio.
+
+Every loop's JitterSource feeds a ReplayRing: a preallocated int16 ring of
+the last `seconds` of what was actually heard, with silence left out so the
+window holds speech rather than dead air. On request the window is copied
+out, optionally sped up with time_stretch() (WSOLA, so the pitch stays the
+same), and played once through the bot's ReplaySource in the output mix.
+Memory is fixed by the window length, whatever the traffic.
+"""
+import threading
+import numpy as np
+
+SAMPLE_RATE = 48000
+FRAME       = 960       # WSOLA analysis frame: 20 ms
+TOLERANCE   = 240       # WSOLA search range: +-5 ms
+DECIMATE    = 4         # correlate at 12 kHz; plenty to line up speech
+MAX_SPEED   = 1.5
+
+
+class ReplayRing:
+    """
+    The last `seconds` of non-silent audio of one loop. write() runs in the
+    output callback: a copy into the ring, no allocation.
+    """
+    def __init__(self, seconds=30.0, block=FRAME):
+        self._buf  = np.zeros(max(1, int(SAMPLE_RATE * seconds)), dtype=np.int16)
+        self._tmp  = np.zeros(block, dtype=np.float32)
+        self._w    = 0      # total samples written
+        self._lock = threading.Lock()
+
+    @property
+    def seconds(self):
+        """How much audio the ring holds right now."""
+        return min(self._w, len(self._buf)) / SAMPLE_RATE
+
+    def write(self, x):
+        """Append a block (float32, int16 scale) unless it is silent."""
+        n = len(x)
+        if not n or not x.any():
+            return
+        if n > len(self._tmp):
+            self._tmp = np.zeros(n, dtype=np.float32)
+        t = self._tmp[:n]
+        np.clip(x, -32768, 32767, out=t)
+        size = len(self._buf)
+        if n > size:
+            t, n = t[-size:], size
+        with self._lock:
+            pos = self._w % size
+            first = min(n, size - pos)
+            np.copyto(self._buf[pos:pos + first], t[:first], casting="unsafe")
+            np.copyto(self._buf[:n - first], t[first:], casting="unsafe")
+            self._w += n
+
+    def snapshot(self, seconds=None):
+        """The last `seconds` (default: all held) as float32, oldest first."""
+        size = len(self._buf)
+        with self._lock:
+            n = min(self._w, size)
+            if seconds is not None:
+                n = min(n, max(0, int(seconds * SAMPLE_RATE)))
+            end = self._w % size
+            idx = (end - n + np.arange(n)) % size
+            return self._buf[idx].astype(np.float32)
+
+    def clear(self):
+        with self._lock:
+            self._w = 0
+
+
+def time_stretch(x, speed):
+    """
+    `x` played `speed` times faster at the same pitch (WSOLA). Each 20 ms
+    output frame is taken from near its nominal input position, shifted by
+    up to TOLERANCE to line up with the previous frame's natural
+    continuation, and Hann-windowed with 50% overlap.
+    """
+    if speed <= 1.0 or len(x) < 2 * FRAME + 2 * TOLERANCE:
+        return x.copy()
+    hop = FRAME // 2
+    win = np.hanning(FRAME).astype(np.float32)
+    n_out = int(len(x) / speed)
+    out  = np.zeros(n_out + FRAME, dtype=np.float32)
+    norm = np.zeros(n_out + FRAME, dtype=np.float32)
+    xd   = x[::DECIMATE]
+    tol, hd = TOLERANCE // DECIMATE, hop // DECIMATE
+    last = len(x) - FRAME
+    prev = 0
+    for k, o in enumerate(range(0, n_out, hop)):
+        pos = min(int(k * hop * speed), last)
+        if k:
+            # where the previous frame would naturally continue
+            nat = min(prev + hop, last) // DECIMATE
+            lo = max(0, pos // DECIMATE - tol)
+            hi = min(len(xd) - hd, pos // DECIMATE + tol)
+            if hi > lo:
+                c = np.correlate(xd[lo:hi + hd], xd[nat:nat + hd], "valid")
+                pos = min((lo + int(np.argmax(c))) * DECIMATE, last)
+        out[o:o + FRAME]  += win * x[pos:pos + FRAME]
+        norm[o:o + FRAME] += win
+        prev = pos
+    np.maximum(norm, 1e-3, out=norm)
+    out /= norm
+    return out[:n_out]
+
+
+class ReplaySource:
+    """
+    Mixer source that plays one loaded clip once, then stays silent. The
+    buffer is allocated once for the longest possible clip.
+    """
+    def __init__(self, seconds=30.0):
+        self.gain  = 1.0
+        self.level = (0.0, 0.0)     # set by the Mixer
+        self.loop  = None           # what is being replayed
+        self._buf  = np.zeros(max(1, int(SAMPLE_RATE * seconds)), dtype=np.float32)
+        self._n    = 0
+        self._r    = 0
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self):
+        """Seconds of the clip still to play."""
+        return (self._n - self._r) / SAMPLE_RATE
+
+    def load(self, clip, gain=1.0, loop=None):
+        n = min(len(clip), len(self._buf))
+        with self._lock:
+            self._buf[:n] = clip[:n]
+            self._n, self._r = n, 0
+            self.gain, self.loop = gain, loop
+        return n / SAMPLE_RATE
+
+    def stop(self):
+        with self._lock:
+            self._r = self._n
+
+    def read_into(self, out):
+        with self._lock:
+            n = min(len(out), self._n - self._r)
+            out[:n] = self._buf[self._r:self._r + n]
+            self._r += n
+        out[n:] = 0.0
+        return n
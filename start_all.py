@@ -1,10 +1,14 @@
 import os
+import glob
+import json
 import subprocess
 import time
 import sys
 import psutil
+import requests
 
 from config_dialog import get_config_from_dialog
+from cert_manager import CertManager
 import webbrowser
 
 DIR = os.path.dirname(os.path.abspath(__file__))
@@ -16,43 +20,283 @@ SERVER = config['server']
 PORT = config['port']
 BOT_BASE = config['bot_base']
 
-bots = [
-    [sys.executable, os.path.join(DIR, "bot_server.py"), "--server", SERVER, "--port", str(PORT), "--bot-name", f"{BOT_BASE}", "--api-port", "6001"],
-    [sys.executable, os.path.join(DIR, "bot_server.py"), "--server", SERVER, "--port", str(PORT), "--bot-name", f"{BOT_BASE}1", "--api-port", "6002"],
-    [sys.executable, os.path.join(DIR, "bot_server.py"), "--server", SERVER, "--port", str(PORT), "--bot-name", f"{BOT_BASE}2", "--api-port", "6003"]
-]
+def loops_have_priority():
+    """True if any role's loop file gives a loop a ducking priority."""
+    for path in glob.glob(os.path.join(DIR, 'LOOPS', 'loops_*.txt')):
+        try:
+            with open(path) as f:
+                if any(l.get('priority') for l in json.load(f)):
+                    return True
+        except (OSError, ValueError):
+            pass
+    return False
+
+# Number of bots, and whether they share one bot_server.py process (one mic
+# stream, one mixed output stream) or each get their own interpreter.
+BOT_COUNT = int(config.get('bot_count', 3))
+SINGLE_PROCESS = bool(config.get('single_process', False))
+# Loops only duck each other inside one mixer, i.e. within one process
+if not SINGLE_PROCESS and float(config.get('duck_db', -12)) < 0 and loops_have_priority():
+    print("[STARTUP] Loop priorities only duck loops on the same bot; "
+          "set single_process to duck across all loops")
+API_PORT = 6001
+UI_PORT = 8080
+# The last LAZY_BOTS bots only connect to Mumble when first given a loop
+LAZY_BOTS = max(0, min(BOT_COUNT, int(config.get('lazy_bots', 0))))
+READY_TIMEOUT = 15.0    # seconds to wait for every bot and the web UI
+
+# Supervisor: how a bot process is judged dead or wedged
+HEALTH_INTERVAL = 1.0   # seconds between health checks
+HEALTH_TIMEOUT  = 1.0   # a /health reply slower than this is a failed check
+MAX_FAILURES    = 3     # consecutive failed checks before a restart
+AUDIO_STALL     = 5.0   # seconds without an audio callback
+CONNECT_GRACE   = 15.0  # seconds a bot may stay disconnected from Mumble
+BACKOFF_MAX     = 30.0  # restart delay doubles from 1 s up to this
+STABLE_AFTER    = 60.0  # healthy for this long resets the restart delay
+
+# Optional run_config.json keys forwarded to every bot_server.py
+BOT_OPTIONS = {
+    'jitter_ms':     "--jitter-ms",
+    'jitter_max_ms': "--jitter-max-ms",
+    'jitter_policy': "--jitter-policy",
+    'send_max_ms':   "--send-max-ms",
+    'vad_threshold_db': "--vad-threshold-db",
+    'vad_hangover_ms':  "--vad-hangover-ms",
+    'record_dir':       "--record-dir",
+    'replay_seconds':   "--replay-seconds",
+    'duck_db':          "--duck-db",
+    'capture_ms':    "--capture-ms",
+    'cert_key_type': "--cert-key-type",
+    'cert_pool':     "--cert-pool",
+}
+# Optional run_config.json switches forwarded as bare flags when true
+BOT_FLAGS = {
+    'capture_int16': "--capture-int16",
+    'vad':           "--vad",
+    'record':        "--record",
+}
+
+def bot_cmd(name, api_port, count=1, lazy=0):
+    cmd = [sys.executable, os.path.join(DIR, "bot_server.py"), "--server", SERVER, "--port", str(PORT), "--bot-name", name, "--api-port", str(api_port)]
+    if count > 1:
+        cmd += ["--bot-count", str(count)]
+    if lazy:
+        cmd += ["--lazy-bots", str(lazy)]
+    for key, flag in BOT_OPTIONS.items():
+        if key in config:
+            cmd += [flag, str(config[key])]
+    for key, flag in BOT_FLAGS.items():
+        if config.get(key):
+            cmd.append(flag)
+    return cmd
+
+def wait_ready(t0, ports=None, ui=True, timeout=READY_TIMEOUT):
+    """
+    Poll the bots' /ready (all of them unless `ports` is given) and the web
+    UI until all are up, printing each one's startup time as it becomes
+    ready. Returns the names still pending.
+    """
+    ports = range(API_PORT, API_PORT + BOT_COUNT) if ports is None else ports
+    pending = {f"{BOT_BASE}{(p - API_PORT) or ''}": f"http://127.0.0.1:{p}/ready"
+               for p in ports}
+    if ui:
+        pending["web UI"] = f"http://127.0.0.1:{UI_PORT}/api/status"
+    listening = {}
+    session = requests.Session()
+    while pending and time.time() - t0 < timeout:
+        for name, url in list(pending.items()):
+            try:
+                r = session.get(url, timeout=0.25)
+            except requests.RequestException:
+                continue
+            now = time.time() - t0
+            listening.setdefault(name, now)
+            try:
+                info = r.json()
+            except ValueError:
+                info = {}
+            if r.status_code == 200:
+                if info.get('lazy') and not info.get('connected'):
+                    state = "standby (lazy)"
+                elif info.get('connect_s') is not None:
+                    state = f"mumble {info['connect_s']:.2f}s"
+                else:
+                    state = "ready"
+                print(f"[STARTUP] {name}: listening {listening[name]:.2f}s, {state}, ready {now:.2f}s")
+                del pending[name]
+            elif info.get('error'):
+                print(f"[STARTUP] {name}: {info['error']} after {now:.2f}s")
+                del pending[name]
+        time.sleep(0.05)
+    return list(pending)
+
+class BotProcess:
+    """
+    One bot_server.py process (hosting one or more API ports), with the
+    health-check and restart bookkeeping the supervisor needs.
+    """
+    def __init__(self, cmd, ports):
+        self.cmd      = cmd
+        self.ports    = list(ports)
+        self.proc     = None
+        self.failures = 0               # consecutive failed health checks
+        self.backoff  = 1.0             # delay before the next restart
+        self.started  = 0.0
+        self.disconnected = {}          # port -> time Mumble was first seen down
+        self.unready  = set()           # ports not yet ready since the last start
+        self.ready_by = 0.0             # when to stop waiting for them
+
+    def start(self):
+        print(f"Starting bot: {self.cmd}")
+        try:
+            self.proc = subprocess.Popen(self.cmd, cwd=DIR)
+        except Exception as e:
+            print(f"Could not start bot: {self.cmd}: {e}")
+            self.proc = None
+        self.started  = time.time()
+        self.failures = 0
+        self.disconnected.clear()
+        self.unready  = set(self.ports)
+        self.ready_by = self.started + READY_TIMEOUT
+
+    def stop(self):
+        if self.proc is None or self.proc.poll() is not None:
+            return
+        print(f"Terminating bot process PID: {self.proc.pid}")
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            print(f"Bot PID {self.proc.pid} did not exit in time. Killing...")
+            self.proc.kill()
+
+    def poll_ready(self, session):
+        """
+        One non-blocking pass over the ports still starting up. Returns True
+        once all are ready, have failed, or the deadline has passed.
+        """
+        for port in list(self.unready):
+            try:
+                r = session.get(f"http://127.0.0.1:{port}/ready", timeout=0.25)
+            except requests.RequestException:
+                continue
+            try:
+                info = r.json()
+            except ValueError:
+                info = {}
+            if r.status_code == 200 or info.get('error'):
+                self.unready.discard(port)
+        if self.unready and time.time() > self.ready_by:
+            print(f"[SUPERVISOR] :{', :'.join(map(str, sorted(self.unready)))} not ready after restart")
+            self.unready.clear()
+            return True
+        return not self.unready
 
-procs = []
-for cmd in bots:
+    def check(self, session):
+        """Return why this process needs a restart, or None if it is healthy."""
+        if self.proc is None:
+            return "not running"
+        if self.proc.poll() is not None:
+            return f"exited with code {self.proc.returncode}"
+        now = time.time()
+        for port in self.ports:
+            try:
+                h = session.get(f"http://127.0.0.1:{port}/health", timeout=HEALTH_TIMEOUT).json()
+            except (requests.RequestException, ValueError):
+                self.failures += 1
+                if self.failures >= MAX_FAILURES:
+                    return f"API on :{port} unresponsive"
+                return None
+            ages = [a for a in (h.get('mic_age'), h.get('out_age')) if a is not None]
+            if ages and max(ages) > AUDIO_STALL:
+                return f"audio stalled for {max(ages):.1f}s on :{port}"
+            if h.get('connected') or h.get('ready'):
+                self.disconnected.pop(port, None)
+            elif now - self.disconnected.setdefault(port, now) > CONNECT_GRACE:
+                return f"Mumble disconnected for {CONNECT_GRACE:.0f}s on :{port}"
+        self.failures = 0
+        if now - self.started > STABLE_AFTER:
+            self.backoff = 1.0
+        return None
+
+def reapply(ports):
+    """Ask the web UI to re-send the loop assignments of restarted bots."""
     try:
-        print(f"Starting bot: {cmd}")
-        p = subprocess.Popen(cmd, cwd=DIR)
-    except Exception as e:
-        print(f"Could not start bot: {cmd}: {e}")
-        continue
-    procs.append(p)
+        requests.post(f"http://127.0.0.1:{UI_PORT}/api/reapply",
+                      json={'ports': ports}, timeout=10)
+    except requests.RequestException as e:
+        print(f"[SUPERVISOR] Could not re-apply assignments to {ports}: {e}")
 
-time.sleep(2)
+def supervise(workers, ui_proc):
+    """Health-check every bot process until the web UI exits; restart failures."""
+    session = requests.Session()
+    restart_at = {}                     # BotProcess -> time its restart is due
+    starting   = set()                  # restarted, waiting to be ready
+    while ui_proc.poll() is None:
+        for w in workers:
+            if w in restart_at:
+                if time.time() < restart_at[w]:
+                    continue
+                del restart_at[w]
+                w.start()
+                starting.add(w)
+                continue
+            if w in starting and w.proc is not None and w.proc.poll() is None:
+                # polled a little each pass, so other bots stay supervised
+                if not w.poll_ready(session):
+                    continue
+                starting.discard(w)
+                reapply(w.ports)
+                continue
+            starting.discard(w)
+            reason = w.check(session)
+            if reason:
+                print(f"[SUPERVISOR] Restarting bot on {w.ports} in {w.backoff:.0f}s: {reason}")
+                w.stop()
+                restart_at[w] = time.time() + w.backoff
+                w.backoff = min(BACKOFF_MAX, w.backoff * 2)
+        time.sleep(HEALTH_INTERVAL)
+
+if SINGLE_PROCESS:
+    workers = [BotProcess(bot_cmd(BOT_BASE, API_PORT, BOT_COUNT, LAZY_BOTS),
+                          range(API_PORT, API_PORT + BOT_COUNT))]
+else:
+    workers = [BotProcess(bot_cmd(f"{BOT_BASE}{i or ''}", API_PORT + i,
+                                  lazy=int(i >= BOT_COUNT - LAZY_BOTS)), [API_PORT + i])
+               for i in range(BOT_COUNT)]
+
+# Bots without an identity take one from the shared cert pool; seed it now
+# so that no bot generates a key on its startup path
+certs = CertManager(key_type=config.get('cert_key_type', 'rsa'),
+                    pool_size=int(config.get('cert_pool', 2)))
+new_names = certs.missing([f"{BOT_BASE}{i or ''}" for i in range(BOT_COUNT)])
+if new_names:
+    print(f"[STARTUP] Generating identities for {', '.join(new_names)}")
+    certs.fill_pool(len(new_names) + certs.pool_size)
+
+# Start every bot and the web UI at once, then wait on their readiness
+t0 = time.time()
+for w in workers:
+    w.start()
 
 # start web UI server
-ui_proc = subprocess.Popen([sys.executable, os.path.join(DIR, 'web_ui_server.py')], cwd=DIR)
-time.sleep(1)
-#  webbrowser.open('http://127.0.0.1:8080')
+ui_proc = subprocess.Popen([sys.executable, os.path.join(DIR, 'web_ui_server.py'), '--port', str(UI_PORT)], cwd=DIR)
+
+late = wait_ready(t0)
+if late:
+    print(f"[STARTUP] Not ready after {READY_TIMEOUT:.0f}s: {', '.join(late)}")
+else:
+    print(f"[STARTUP] Console ready in {time.time() - t0:.2f}s")
+#  webbrowser.open(f'http://127.0.0.1:{UI_PORT}')
 
 try:
-    ui_proc.wait()
+    supervise(workers, ui_proc)
 except KeyboardInterrupt:
     pass
 
-for p in procs:
+for w in workers:
     try:
-        print(f"Terminating bot process PID: {p.pid}")
-        p.terminate()
-        try:
-            p.wait(timeout=3)
-        except subprocess.TimeoutExpired:
-            print(f"Bot PID {p.pid} did not exit in time. Killing...")
-            p.kill()
+        w.stop()
     except Exception as e:
         print(f"Error terminating bot process: {e}")
 
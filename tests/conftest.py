@@ -0,0 +1,15 @@
+"""
+Tests run the real modules offline: bot_server gets the fake Mumble server
+and null audio devices from bench/, as in bench/run_bench.py.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bench")]
+
+import null_sounddevice
+import fake_pymumble
+
+sys.modules["sounddevice"] = null_sounddevice
+fake_pymumble.install(None)
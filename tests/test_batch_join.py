@@ -0,0 +1,97 @@
+import contextlib
+import io
+import tempfile
+import threading
+
+import pytest
+import fake_pymumble
+import bot_server
+from audio_engine import AudioEngine
+from cert_manager import CertManager
+
+_certs = None
+
+
+def certs():
+    global _certs
+    if _certs is None:
+        _certs = CertManager(tempfile.mkdtemp(prefix="mc-test-"), key_type="ec", pool_size=0)
+    return _certs
+
+
+@pytest.fixture
+def bot():
+    """A bot talking on LOOP0 of a fake server with LOOP0 and LOOP1."""
+    fake_pymumble.SERVER = fake_pymumble.FakeServer(["LOOP0", "LOOP1"], speakers=0)
+    engine = AudioEngine()
+    with contextlib.redirect_stdout(io.StringIO()):
+        b = bot_server.LoopBot("test", engine, "fake", 64738, certs=certs())
+        b.connect()
+        b.apply([{'op': 'join', 'loop': 'LOOP0'}, {'op': 'talk'}])
+    assert b.streaming
+    yield b
+    engine.mixer.remove_source(b.source)
+    b.client.stop()
+
+
+def test_join_unknown_loop_aborts_talk(bot):
+    with pytest.raises(ValueError):
+        bot.apply([{'op': 'join', 'loop': 'NOPE'}, {'op': 'talk'}])
+    assert not bot.streaming
+
+
+def test_unconfirmed_join_keeps_mic_closed(bot, monkeypatch):
+    monkeypatch.setattr(fake_pymumble.Channel, "move_in", lambda self, session=None: None)
+    with pytest.raises(ValueError):
+        bot.apply([{'op': 'join', 'loop': 'LOOP1'}, {'op': 'talk'}])
+    assert not bot.streaming
+
+
+def test_client_outlives_the_connect_thread():
+    fake_pymumble.SERVER = fake_pymumble.FakeServer(["LOOP0"], speakers=0)
+    engine = AudioEngine()
+    with contextlib.redirect_stdout(io.StringIO()):
+        b = bot_server.LoopBot("test", engine, "fake", 64738, certs=certs())
+        t = threading.Thread(target=b.connect)
+        t.start()
+        t.join()
+    assert b.is_connected()
+    engine.mixer.remove_source(b.source)
+    b.client.stop()
+
+
+def test_rejoin_after_standby_outlives_the_request_thread(bot):
+    bot.standby()
+    t = threading.Thread(target=bot.apply, args=([{'op': 'join', 'loop': 'LOOP1'}],))
+    t.start()
+    t.join()
+    assert bot.is_connected() and bot.loop == "LOOP1"
+
+
+def test_talk_route_refuses_an_unconfirmed_join(bot, monkeypatch):
+    monkeypatch.setattr(fake_pymumble.Channel, "move_in", lambda self, session=None: None)
+    api = bot_server.create_app(bot).test_client()
+    assert api.post('/join', json={'loop': 'LOOP1'}).status_code == 200
+    assert api.post('/talk', json={}).status_code == 400
+    assert not bot.streaming
+
+
+def test_listen_to_unknown_loop_is_refused(bot):
+    with pytest.raises(ValueError):
+        bot.listen('NOPE')
+    assert 'NOPE' not in bot.listens
+    api = bot_server.create_app(bot).test_client()
+    assert api.post('/listen', json={'loop': 'NOPE'}).status_code == 400
+    assert api.post('/listen', json={'loop': 'LOOP1'}).status_code == 200
+    assert 'LOOP1' in bot.listens
+
+
+def test_only_assigned_loops_are_recorded(bot):
+    loop0, loop1 = bot._channel_ids["LOOP0"], bot._channel_ids["LOOP1"]
+    assert bot._records(loop0) and not bot._records(loop1)
+    bot.listen("LOOP1")
+    assert bot._records(loop1)
+    bot.park("LOOP0")
+    assert not bot._records(loop0)
+    bot.leave()
+    assert not bot._records(bot._channel_ids["Root"]) and not bot._records(loop0)
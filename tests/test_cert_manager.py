@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+from cert_manager import CertManager
+
+
+def manager(pool_size=2):
+    return CertManager(tempfile.mkdtemp(prefix="mc-test-"), key_type="ec", pool_size=pool_size)
+
+
+def test_seeded_pool_serves_new_bots_without_generating():
+    certs = manager()
+    names = ["bot", "bot1"]
+    certs.fill_pool(len(certs.missing(names)) + certs.pool_size)
+    assert len(certs._pool_entries()) == 4
+    for n in names:
+        certs.get(n)
+    assert certs.missing(names) == []
+    assert len(certs._pool_entries()) == 2
+
+
+def test_refill_skips_while_another_process_holds_the_lock():
+    certs = manager()
+    open(os.path.join(certs.pool_dir, ".refill.lock"), "w").close()
+    certs.fill_pool()
+    assert certs._pool_entries() == []
+
+
+def test_stale_refill_lock_is_taken_over():
+    certs = manager()
+    lock = os.path.join(certs.pool_dir, ".refill.lock")
+    open(lock, "w").close()
+    os.utime(lock, (0, 0))
+    certs.fill_pool()
+    assert len(certs._pool_entries()) == 2
+    assert not os.path.exists(lock)
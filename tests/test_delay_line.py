@@ -0,0 +1,38 @@
+import numpy as np
+from delay_line import DelayLine, SAMPLE_RATE
+
+BLOCK = 960
+TONE  = 97.0        # Hz; not a divisor of the block rate, so splices land mid-wave
+AMP   = 10000
+LIMIT = 2 * AMP * 2 * np.pi * TONE / SAMPLE_RATE   # twice the tone's largest step
+
+
+def run(line, blocks, start):
+    t = np.arange(start, start + blocks * BLOCK)
+    x = (AMP * np.sin(2 * np.pi * TONE * t / SAMPLE_RATE)).astype(np.int16)
+    out = [np.frombuffer(line.process(x[i:i + BLOCK].tobytes()), dtype=np.int16)
+           for i in range(0, len(x), BLOCK)]
+    return np.concatenate(out), start + len(x)
+
+
+def max_step(y):
+    return int(np.abs(np.diff(y.astype(np.int64))).max())
+
+
+def lengthen_after(blocks, new_seconds):
+    line = DelayLine(0.01)
+    a, pos = run(line, blocks, 0)
+    line.set_delay(new_seconds)
+    b, pos = run(line, 200, pos)
+    return np.concatenate((a, b))
+
+
+def test_lengthen_before_ring_wraps():
+    # the ring holds 0.01 s + 1 s: it has not wrapped after 20 blocks
+    y = lengthen_after(20, 0.02)
+    assert max_step(y) < LIMIT
+
+
+def test_lengthen_after_ring_wraps():
+    y = lengthen_after(120, 2.0)
+    assert max_step(y) < LIMIT
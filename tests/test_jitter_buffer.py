@@ -0,0 +1,82 @@
+import numpy as np
+from jitter_buffer import SpeakerBuffer, SLOT, SLOT_SECONDS, MAX_CONCEAL
+
+PACKET = 2 * SLOT       # 20 ms packets advance the sequence by 2
+
+
+def packet(value):
+    return np.full(PACKET, value, dtype=np.int16).tobytes()
+
+
+def play(sb, slots, now=0.0):
+    out = np.zeros(slots * SLOT, dtype=np.float32)
+    for k in range(slots):
+        sb.mix_into(out[k * SLOT:(k + 1) * SLOT], now)
+    return out.reshape(slots, SLOT)[:, 0]      # first sample of each slot
+
+
+def test_playout_starts_target_slots_behind_the_first_packet():
+    sb = SpeakerBuffer(target_slots=4, max_slots=20)
+    for i in range(4):
+        sb.push(100 + 2 * i, packet(i + 1), now=i * 2 * SLOT_SECONDS)
+    assert list(play(sb, 12)) == [0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4]
+
+
+def test_packet_behind_the_play_position_counts_as_late():
+    sb = SpeakerBuffer(target_slots=2, max_slots=20)
+    sb.push(10, packet(1), now=0.0)
+    sb.push(12, packet(2), now=0.02)
+    play(sb, 6)
+    sb.push(8, packet(9), now=0.05)
+    assert sb.late == 1
+
+
+def test_lost_packet_is_concealed_from_the_last_slot():
+    sb = SpeakerBuffer(target_slots=2, max_slots=20)
+    sb.push(10, packet(1000), now=0.0)
+    sb.push(14, packet(3000), now=0.04)       # 12 never arrives
+    firsts = play(sb, 8)
+    assert sb.concealed == 2
+    assert 0 < firsts[4] < 1000 and firsts[5] < firsts[4]    # faded copies of slot 11
+    assert firsts[6] == 3000
+
+
+def test_spurt_ends_after_silence_and_restarts_on_the_next_packet():
+    sb = SpeakerBuffer(target_slots=2, max_slots=20)
+    sb.push(10, packet(1), now=0.0)
+    play(sb, 4 + MAX_CONCEAL + 1)
+    assert sb._play is None
+    sb.push(500, packet(2), now=5.0)
+    assert sb._play == 500 - sb.target
+    assert list(play(sb, 4)) == [0, 0, 2, 2]
+
+
+def backlog(policy, values):
+    """A buffer handed len(values) packets at once, well over its target."""
+    sb = SpeakerBuffer(target_slots=2, max_slots=60, policy=policy)
+    for i, v in enumerate(values):
+        sb.push(10 + 2 * i, packet(v), now=0.0)
+    return sb
+
+
+def test_drop_oldest_keeps_a_backlog_below_the_ceiling():
+    sb = backlog("drop_oldest", [1000] * 10)
+    play(sb, 30)
+    assert sb.compressed == sb.skipped == sb.dropped == 0
+
+
+def test_compress_merges_slots_until_back_near_target():
+    sb = backlog("compress", [1000] * 10)
+    firsts = play(sb, 30)
+    assert sb.compressed > 0 and sb.skipped == 0
+    # 20 slots of audio play out in fewer than 20 slots, with no gap inside
+    heard = np.flatnonzero(firsts == 1000)
+    assert len(heard) == 20 - sb.compressed
+    assert np.all(np.diff(heard) == 1)
+
+
+def test_skip_silence_drops_only_quiet_slots():
+    sb = backlog("skip_silence", [1000, 0, 0, 0, 0, 0, 0, 1000, 1000, 1000])
+    firsts = play(sb, 30)
+    assert sb.skipped > 0 and sb.compressed == 0
+    assert np.count_nonzero(firsts == 1000) == 8      # every loud slot still plays
@@ -0,0 +1,59 @@
+import numpy as np
+from audio_engine import Mixer, MixerSource, FRAME
+
+DUCK = 10 ** (-12 / 20)
+TONE = (np.sin(np.arange(FRAME) * 0.05) * 8000).astype(np.int16).tobytes()
+DC   = np.full(FRAME, 4000, dtype=np.int16).tobytes()
+QUIET = bytes(2 * FRAME)
+
+
+def mixer():
+    """hi (priority 2) is metered but muted, so the output is lo alone."""
+    m = Mixer(duck_db=-12.0)
+    hi, lo = MixerSource(gain=0.0), MixerSource()
+    hi.priority, lo.priority = 2, 0
+    m.add_source(hi)
+    m.add_source(lo)
+    return m, hi, lo
+
+
+def render(m, feeds):
+    for src, pcm in feeds:
+        src.push(pcm)
+    out = np.zeros(FRAME, dtype=np.int16)
+    m.render(out)
+    return out.astype(np.float64)
+
+
+def test_active_higher_priority_ducks_lower():
+    m, hi, lo = mixer()
+    assert abs(render(m, [(lo, DC)])[-1] - 4000) <= 1
+    render(m, [(hi, TONE), (lo, DC)])
+    assert np.isclose(render(m, [(hi, TONE), (lo, DC)]), 4000 * DUCK, atol=1).all()
+
+
+def test_source_without_priority_is_never_ducked():
+    m, hi, lo = mixer()
+    lo.priority = None
+    render(m, [(hi, TONE), (lo, DC)])
+    assert abs(render(m, [(hi, TONE), (lo, DC)])[-1] - 4000) <= 1
+
+
+def test_duck_ramps_down_within_one_block():
+    m, hi, lo = mixer()
+    render(m, [(lo, DC)])
+    out = render(m, [(hi, TONE), (lo, DC)])
+    assert np.all(np.diff(out) <= 0)                 # no step, only a slope
+    assert out[0] > 3990 and abs(out[-1] - 4000 * DUCK) <= 1
+
+
+def test_release_is_gradual_after_the_higher_loop_goes_quiet():
+    m, hi, lo = mixer()
+    render(m, [(hi, TONE), (lo, DC)])
+    levels = [render(m, [(hi, QUIET), (lo, DC)]) for _ in range(150)]
+    ends = np.array([b[-1] for b in levels])
+    assert ends[0] <= 4000 * DUCK + 1                # held while the envelope decays
+    assert ends[-1] >= 3990                          # and back in the end
+    assert np.all(np.diff(ends) >= 0)
+    assert np.max(np.diff(ends)) < 4000 * (1 - DUCK) / 2     # over several blocks
+    assert all(np.all(np.diff(b) >= 0) for b in levels)      # ramped inside each
@@ -0,0 +1,38 @@
+import tempfile
+
+import recorder
+from recorder import Recorder, INDEX_STEP
+
+
+def recorded(packets, segment_seconds=600):
+    """A stopped Recorder holding `packets` of (time, loop, session, opus)."""
+    rec = Recorder(tempfile.mkdtemp(prefix="mc-test-"), segment_seconds)
+    for seq, (t, loop, session, opus) in enumerate(packets):
+        rec.record(loop, session, seq, opus, now=t)
+    rec.stop()
+    return rec
+
+
+def test_span_comes_from_the_memory_mapped_index():
+    rec = recorded([(1000.0 + 0.02 * i, "LOOP", 1, b"x") for i in range(500)])
+    (start, base), = rec.segments("LOOP")
+    first, last = rec.span(base)
+    assert start == first == 1000.0
+    assert 1010.0 - INDEX_STEP <= last <= 1010.0
+
+
+def test_read_seeks_to_the_range_in_order():
+    pkts = [(1000.0 + 0.02 * i, "LOOP", 1 + i % 2, bytes([i % 256])) for i in range(3000)]
+    rec = recorded(pkts, segment_seconds=20)           # three segments
+    assert len(rec.segments("LOOP")) == 3
+    got = list(rec.read("LOOP", 1019.5, 1041.0))
+    want = [p for p in pkts if 1019.5 <= p[0] <= 1041.0]
+    assert [r[0] for r in got] == [p[0] for p in want]
+    assert [r[3] for r in got] == [p[3] for p in want]
+    assert all(r[1] == 2 for r in rec.read("LOOP", 1000, 1100, speaker=2))
+
+
+def test_loops_are_kept_apart():
+    rec = recorded([(1000.0, "A LOOP", 1, b"a"), (1000.5, "B/LOOP", 1, b"b")])
+    assert [r[3] for r in rec.read("A LOOP", 0, 2000)] == [b"a"]
+    assert set(rec.catalog()) == {recorder.loop_dir("A LOOP"), recorder.loop_dir("B/LOOP")}
@@ -0,0 +1,153 @@
+import copy
+import time
+
+import pytest
+
+import web_ui_server as ui
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Three idle bots, no hub, the FLIGHT loops, and bots.run recorded."""
+    calls = []
+    monkeypatch.setattr(ui, "role", "FLIGHT")
+    monkeypatch.setattr(ui, "LOOPS", ui.load_loops("FLIGHT"))
+    monkeypatch.setattr(ui, "loop_states", {l['name']: (0, None) for l in ui.LOOPS})
+    monkeypatch.setattr(ui, "bot_pool", {
+        f"BOT{i}": {'name': f"BOT{i}", 'port': 6000 + i, 'assigned': None,
+                    'last_used': time.time(), 'parked': None, 'busy': False}
+        for i in (1, 2, 3)})
+    monkeypatch.setattr(ui, "LISTEN_HUB", None)
+    monkeypatch.setattr(ui, "bot_reports", {})
+    monkeypatch.setattr(ui, "loop_usage", {})
+    monkeypatch.setattr(ui.bots, "run",
+                        lambda plan: (calls.append(plan), {p: True for p in plan})[1])
+    return calls
+
+
+def hold(loop, bot, state, own=True):
+    ui.loop_states[loop] = (state, bot)
+    if own:
+        ui.bot_pool[bot]['assigned'] = loop
+
+
+# --- ROLE SWITCH ---
+
+def test_role_switch_keeps_shared_loops(pool):
+    hold("FLIGHT LOOP", "BOT1", 2)
+    hold("BME LOOP", "BOT2", 1)
+    ui.role = "CPOO"
+    assert ui.refresh_state_from_role() == {}
+    assert ui.loop_states["FLIGHT LOOP"] == (2, "BOT1")
+    assert ui.loop_states["BME LOOP"] == (1, "BOT2")
+    assert ui.bot_pool["BOT1"]['assigned'] == "FLIGHT LOOP"
+
+
+def test_role_switch_releases_and_mutes_what_is_no_longer_allowed(pool):
+    hold("SPACE-GROUND LOOP", "BOT1", 1)            # not listenable as CPOO
+    hold("SCIENCE LOOP", "BOT2", 2)                 # listen-only as CPOO
+    hold("OPS1 LOOP", "BOT2", 1, own=False)         # through a listener
+    ui.role = "CPOO"
+    plan = ui.refresh_state_from_role()
+    assert plan == {6001: [('leave', {})], 6002: [('mute', {})]}
+    assert ui.bot_pool["BOT1"]['assigned'] is None
+    assert ui.loop_states["SPACE-GROUND LOOP"] == (0, None)
+    assert ui.loop_states["SCIENCE LOOP"] == (1, "BOT2")
+    assert ui.loop_states["OPS1 LOOP"] == (1, "BOT2")
+
+
+def test_role_switch_unlistens_a_dropped_listener_loop(pool):
+    hold("FLIGHT LOOP", "BOT1", 1)
+    hold("SPACE-GROUND LOOP", "BOT1", 1, own=False)
+    ui.role = "CPOO"
+    assert ui.refresh_state_from_role() == {6001: [('unlisten', {'loop': "SPACE-GROUND LOOP"})]}
+    assert ui.loop_states["SPACE-GROUND LOOP"] == (0, None)
+    assert ui.bot_pool["BOT1"]['assigned'] == "FLIGHT LOOP"
+
+
+def test_role_switch_resends_a_changed_priority(pool):
+    hold("BME LOOP", "BOT1", 1)
+    hold("EVA LOOP", "BOT1", 1, own=False)
+    ui.LOOPS = copy.deepcopy(ui.LOOPS)
+    for l in ui.LOOPS:
+        if l['name'] in ("BME LOOP", "EVA LOOP"):
+            l['priority'] = 3
+    plan = ui.refresh_state_from_role()
+    assert plan == {6001: [('join', {'loop': "BME LOOP", 'priority': 0}),
+                           ('listen', {'loop': "EVA LOOP", 'priority': 0})]}
+
+
+# --- SCHEDULER ---
+
+def test_prewarm_parks_a_spare_in_the_likeliest_loop(pool, monkeypatch):
+    monkeypatch.setattr(ui, "WARM_SPARES", 1)
+    ui.note_use("EVA LOOP")
+    ui.prewarm()
+    (plan,) = pool
+    (port, ops), = plan.items()
+    assert ops == [('park', {'loop': "EVA LOOP"})]
+    parked = [d for d in ui.bot_pool.values() if d['parked']]
+    assert [(d['port'], d['parked'], d['busy']) for d in parked] == [(port, "EVA LOOP", False)]
+    ui.prewarm()
+    assert len(pool) == 1                           # already in place
+
+
+def test_prewarm_skips_open_loops_and_recalls_stale_spares(pool, monkeypatch):
+    monkeypatch.setattr(ui, "WARM_SPARES", 1)
+    ui.note_use("EVA LOOP")
+    hold("EVA LOOP", "BOT1", 1)
+    ui.bot_pool["BOT2"]['parked'] = "PR LOOP"
+    ui.bot_pool["BOT3"]['parked'] = "FLIGHT LOOP"
+    ui.prewarm()
+    assert pool == [{6002: [('leave', {})]}]        # FLIGHT LOOP leads the order
+    assert ui.bot_pool["BOT2"]['parked'] is None
+    assert ui.bot_pool["BOT3"]['parked'] == "FLIGHT LOOP"
+
+
+def test_prewarm_bots_are_busy_until_the_move_ends(pool, monkeypatch):
+    monkeypatch.setattr(ui, "WARM_SPARES", 2)
+    seen = []
+    monkeypatch.setattr(ui.bots, "run", lambda plan: (
+        seen.append((set(plan), {ui.bot_pool[n]['port'] for n in ui.idle_bots()})),
+        {p: True for p in plan})[1])
+    ui.prewarm()
+    (moving, idle), = seen
+    assert len(moving) == 2 and not moving & idle
+    assert not any(d['busy'] for d in ui.bot_pool.values())
+
+
+def test_prewarm_forgets_a_failed_park(pool, monkeypatch):
+    monkeypatch.setattr(ui, "WARM_SPARES", 1)
+    monkeypatch.setattr(ui.bots, "run", lambda plan: {p: False for p in plan})
+    ui.prewarm()
+    assert all(d['parked'] is None and not d['busy'] for d in ui.bot_pool.values())
+
+
+def test_shrink_is_off_by_default(pool, monkeypatch):
+    monkeypatch.setattr(ui, "WARM_SPARES", 0)
+    monkeypatch.setattr(ui, "SHRINK_AFTER", 0)
+    for d in ui.bot_pool.values():
+        d['last_used'] -= 3600
+    ui.prewarm()
+    assert pool == []
+
+
+def test_shrink_hangs_up_only_idle_bots_beyond_the_spares(pool, monkeypatch):
+    monkeypatch.setattr(ui, "WARM_SPARES", 1)
+    monkeypatch.setattr(ui, "SHRINK_AFTER", 60)
+    ui.note_use("EVA LOOP")
+    hold("FLIGHT LOOP", "BOT1", 2)
+    ui.bot_pool["BOT1"]['last_used'] -= 3600
+    ui.bot_pool["BOT2"]['last_used'] -= 3600
+    ui.bot_pool["BOT3"]['last_used'] -= 3600
+    ui.bot_reports["BOT3"] = {'status': "Standby"}
+    ui.prewarm()
+    # BOT2 is the spare (a standby bot is picked last); BOT3 is already down
+    assert pool == [{6002: [('park', {'loop': "EVA LOOP"})]}]
+    ui.bot_reports["BOT3"] = None
+    ui.bot_pool["BOT3"]['last_used'] = time.time()
+    ui.prewarm()
+    assert len(pool) == 1                           # BOT3 was used too recently
+    ui.bot_pool["BOT3"]['last_used'] -= 3600
+    ui.prewarm()
+    assert pool[1:] == [{6003: [('standby', {})]}]
@@ -0,0 +1,70 @@
+"""
+Voice activity detection for the talk path.
+
+A VoiceGate classifies each captured block as voice or not from its energy,
+compared against an adaptive noise floor, and its zero-crossing rate, which
+tells broadband hiss from voiced speech at similar levels. A hangover keeps
+the gate open through the short pauses inside a sentence. All work happens
+in preallocated buffers, so it is cheap enough to run in the audio callback.
+"""
+import math
+import numpy as np
+
+SAMPLE_RATE = 48000
+FULL_SCALE  = 32768.0 ** 2      # mean square of a full-scale int16 signal
+FLOOR_FALL  = 0.1               # per block: how fast the floor follows quieter audio
+FLOOR_RISE  = 1.01              # per block: floor creep while louder (~2 dB/s at 20 ms)
+LOUD_MARGIN = 100.0             # 20 dB above the gate level, ignore the ZCR veto
+
+
+class VoiceGate:
+    """
+    Energy + zero-crossing voice detector with hangover. process() returns
+    whether the block should be sent.
+    """
+    def __init__(self, threshold_db=-50.0, margin_db=9.0, hangover_ms=300, zcr_max=0.35):
+        self.threshold = FULL_SCALE * 10 ** (threshold_db / 10)   # absolute minimum
+        self.margin    = 10 ** (margin_db / 10)                   # required SNR over the floor
+        self.hangover  = hangover_ms / 1000.0
+        self.zcr_max   = zcr_max
+        self.floor     = self.threshold     # noise floor estimate (mean square)
+        self.active    = False
+        self.level_db  = -math.inf          # last block's level in dBFS
+        self._hold     = 0.0                # hangover seconds left
+        self._f32 = self._sign = self._cross = np.zeros(0)
+
+    def _alloc(self, n):
+        self._f32   = np.zeros(n, dtype=np.float32)
+        self._sign  = np.zeros(n, dtype=bool)
+        self._cross = np.zeros(n, dtype=bool)
+
+    def process(self, pcm):
+        """Classify one block of int16 PCM bytes; True while voice is present."""
+        x = np.frombuffer(pcm, dtype=np.int16)
+        n = len(x)
+        if n < 2:
+            return self.active
+        if n > len(self._f32):
+            self._alloc(n)
+        f = self._f32[:n]
+        np.copyto(f, x, casting="unsafe")
+        ms = float(np.dot(f, f)) / n
+        np.signbit(x, out=self._sign[:n])
+        np.not_equal(self._sign[1:n], self._sign[:n-1], out=self._cross[:n-1])
+        zcr = int(np.count_nonzero(self._cross[:n-1])) / (n - 1)
+
+        if ms < self.floor:
+            self.floor += (ms - self.floor) * FLOOR_FALL
+        else:
+            self.floor *= FLOOR_RISE
+        self.floor = max(self.floor, 1.0)
+        gate = max(self.threshold, self.floor * self.margin)
+        voice = ms > gate and (zcr < self.zcr_max or ms > gate * LOUD_MARGIN)
+
+        if voice:
+            self._hold = self.hangover
+        else:
+            self._hold -= n / SAMPLE_RATE
+        self.active = voice or self._hold > 0
+        self.level_db = 10 * math.log10(ms / FULL_SCALE) if ms > 0 else -math.inf
+        return self.active
@@ -1,5 +1,7 @@
-from flask import Flask, render_template_string, jsonify, request, url_for
-import json, os, requests, time, sys
+from flask import Flask, Response, jsonify, request, url_for
+import json, os, requests, time, sys, threading, gzip, hashlib
+from events import EventHub, read_sse
+from bot_client import BotClient
 
 # ------------------------------ CONFIG ----------------------------------
 from config_dialog import read_config, write_config
@@ -11,48 +13,397 @@ ROLES = ['FLIGHT','CAPCOM','FAO','BME','CPOO','SCIENCE','EVA']
 # Build HTML option tags for roles once
 options = "".join(f"<option value='{r}'>{r}</option>" for r in ROLES)
 
-# Load loops for the selected role
+# Loop files of every role, parsed once and again only when a file changes,
+# so a role switch reads nothing from disk
+_loop_files = {}    # role -> (mtime, loops)
+
 def load_loops(r):
-    path = os.path.join('LOOPS', f'loops_{r.upper()}.txt')
+    """
+    The role's loop list. The same list object is returned until the file's
+    mtime changes; if the file cannot be read, the last good copy is kept.
+    """
+    r = r.upper()
+    path = os.path.join('LOOPS', f'loops_{r}.txt')
+    cached = _loop_files.get(r)
     try:
+        mtime = os.stat(path).st_mtime_ns
+        if cached and cached[0] == mtime:
+            return cached[1]
         with open(path, 'r') as f:
-            return json.load(f)
+            loops = json.load(f)
     except Exception as e:
         print('Loop load error', e)
-        return []
+        return cached[1] if cached else []
+    _loop_files[r] = (mtime, loops)
+    return loops
 
+for r in ROLES:
+    load_loops(r)
 LOOPS = load_loops(role)
 
 # ------------------------------ BOT POOL ---------------------------------
-BOTS = [
-    {"name": "BOT1", "port": 6001},
-    {"name": "BOT2", "port": 6002},
-    {"name": "BOT3", "port": 6003},
-]
+# One entry per bot started by start_all.py, on consecutive API ports
+BOT_COUNT = int(config.get("bot_count", 3))
+BOTS = [{"name": f"BOT{i+1}", "port": 6001 + i} for i in range(BOT_COUNT)]
+
+bot_pool   = {b['name']: {**b, 'assigned': None, 'last_used': time.time(), 'parked': None,
+                            'busy': False} for b in BOTS}
+
+# With listen_bot set, the last bot hears every listen-only loop through
+# Mumble channel listeners on its one connection, so the other bots are only
+# needed for talk loops. A loop moves to a bot of its own when talked on.
+LISTEN_HUB = BOTS[-1]['name'] if config.get("listen_bot") and len(BOTS) > 1 else None
 
-bot_pool   = {b['name']: {**b, 'assigned': None, 'last_used': 0} for b in BOTS}
+REPLAY_SPEED = float(config.get("replay_speed", 1.25))     # "say again" playback rate
 loop_states = {l['name']: (0, None) for l in LOOPS}
 
+def listened_loops(name):
+    """Loops a bot hears through channel listeners rather than by joining."""
+    return [ln for ln, (_, b) in loop_states.items()
+            if b == name and ln != bot_pool[name]['assigned']]
+
 def refresh_state_from_role():
+    """
+    Switch LOOPS to the current role's list without dropping what both lists
+    share: loops still allowed keep their bot and state, a talk loop that
+    may no longer be talked on is muted, and only loops that are gone or no
+    longer listenable are released. Returns the bot operations that does;
+    the caller holds _command_lock and runs them.
+    """
     global LOOPS, loop_states
-    LOOPS = load_loops(role)
-    loop_states = {l['name']: (0, None) for l in LOOPS}
+    new = load_loops(role)
+    allowed = {l['name']: l for l in new if l.get('can_listen')}
+    plan, kept, now = {}, {}, time.time()
+    for ln, (st, b) in loop_states.items():
+        if not st or not b:
+            continue
+        port = bot_pool[b]['port']
+        own = bot_pool[b]['assigned'] == ln
+        cfg = allowed.get(ln)
+        if cfg is None:
+            if own:
+                plan.setdefault(port, []).append(('leave', {}))
+                bot_pool[b]['assigned'] = None
+                bot_pool[b]['last_used'] = now
+            else:
+                plan.setdefault(port, []).append(('unlisten', {'loop': ln}))
+            continue
+        if st == 2 and not cfg.get('can_talk'):
+            plan.setdefault(port, []).append(('mute', {}))
+            st = 1
+        p = cfg.get('priority', 0)
+        if p != loop_priority(ln):
+            plan.setdefault(port, []).append(
+                ('join' if own else 'listen', {'loop': ln, 'priority': p}))
+        kept[ln] = (st, b)
+    LOOPS = new
+    loop_states = {l['name']: kept.get(l['name'], (0, None)) for l in LOOPS}
+    return plan
 
-def find_idle_bot():
-    idle = [n for n, d in bot_pool.items() if d['assigned'] is None]
+bots = BotClient()                  # pooled, parallel command dispatch
+_command_lock = threading.Lock()    # one loop transition at a time
+
+# ------------------------------ SCHEDULER --------------------------------
+# Idle bots do not wait in Root: WARM_SPARES of them are parked in the loops
+# most likely to be opened next (recent use, then the role's loop order), so
+# opening one of those needs no channel move. With SHRINK_AFTER set, idle
+# bots beyond the spares hang up after that many seconds and reconnect when
+# spares run short; off by default, since a reconnect costs a full Mumble
+# connect. When every bot is busy, opening a loop takes the bot of the least
+# important listen-only loop, which moves to the listener hub if there is one.
+WARM_SPARES     = int(config.get("warm_spares", 1))
+SHRINK_AFTER    = float(config.get("shrink_after_s", 0))     # 0: never hang up
+USAGE_HALF_LIFE = 600.0     # seconds for a loop's usage score to halve
+SCHEDULE_EVERY  = 2.0
+loop_usage  = {}            # loop -> (decayed open count, time of last update)
+sched_stats = {'warm_hits': 0, 'cold_starts': 0, 'preemptions': 0}
+_sched_wake = threading.Event()
+
+def note_use(loop, now=None):
+    now = now or time.time()
+    score, t = loop_usage.get(loop, (0.0, now))
+    loop_usage[loop] = (score * 0.5 ** ((now - t) / USAGE_HALF_LIFE) + 1.0, now)
+
+def loop_score(loop, now):
+    """How likely the loop is to be opened next; higher is likelier."""
+    score, t = loop_usage.get(loop, (0.0, now))
+    order = next((i for i, l in enumerate(LOOPS) if l['name'] == loop), len(LOOPS))
+    return score * 0.5 ** ((now - t) / USAGE_HALF_LIFE) + 0.5 * (1 - order / max(1, len(LOOPS)))
+
+def loop_priority(loop):
+    cfg = next((l for l in LOOPS if l['name'] == loop), {})
+    return cfg.get('priority', 0)
+
+def is_standby(name):
+    return (bot_reports.get(name) or {}).get('status') == "Standby"
+
+def idle_bots():
+    """Unassigned bots, except the hub and any prewarm() is still moving."""
+    return [n for n, d in bot_pool.items()
+            if d['assigned'] is None and not d['busy'] and n != LISTEN_HUB]
+
+def find_idle_bot(loop=None):
+    """An idle bot for `loop`: one parked there, else a connected free one."""
+    idle = idle_bots()
     if not idle:
         return None
-    idle.sort(key=lambda n: bot_pool[n]['last_used'])
+    for n in idle:
+        if loop is not None and bot_pool[n]['parked'] == loop:
+            return n
+    idle.sort(key=lambda n: (is_standby(n), bot_pool[n]['parked'] is not None,
+                             bot_pool[n]['last_used']))
     return idle[0]
 
+def preempt(exclude):
+    """
+    Free the bot of the least important listen-only loop (by priority, then
+    likelihood of use) and return it, or None if every bot is talking.
+    """
+    now = time.time()
+    cands = [ln for ln, (st, b) in loop_states.items()
+             if st == 1 and b and b != LISTEN_HUB and ln != exclude]
+    if not cands:
+        return None
+    victim = min(cands, key=lambda ln: (loop_priority(ln), loop_score(ln, now)))
+    _, b = loop_states[victim]
+    if LISTEN_HUB:
+        bots.run({bot_pool[LISTEN_HUB]['port']: [
+            ('listen', {'loop': victim, 'priority': loop_priority(victim)})]})
+        loop_states[victim] = (1, LISTEN_HUB)
+    else:
+        loop_states[victim] = (0, None)
+    bot_pool[b]['assigned'] = None
+    sched_stats['preemptions'] += 1
+    print(f"[SCHEDULER] {victim} gave up {b}")
+    return b
+
+def prewarm():
+    """Park spares in the likeliest loops; hang up idle bots nobody needs."""
+    now = time.time()
+    # plan under the command lock, then run outside it (a park may have to
+    # reconnect a bot): the bots involved are marked busy meanwhile, so user
+    # commands neither wait for them nor pick them
+    with _command_lock:
+        idle = idle_bots()
+        active = {ln for ln, (st, _) in loop_states.items() if st}
+        want = sorted((l['name'] for l in LOOPS
+                       if l.get('can_listen') and l['name'] not in active),
+                      key=lambda ln: -loop_score(ln, now))[:WARM_SPARES]
+        placed = {bot_pool[n]['parked'] for n in idle}
+        free = sorted((n for n in idle if bot_pool[n]['parked'] not in want),
+                      key=lambda n: (is_standby(n), bot_pool[n]['last_used']))
+        plan = {}
+        for ln in want:
+            if ln not in placed and free:
+                n = free.pop(0)
+                plan[bot_pool[n]['port']] = [('park', {'loop': ln})]
+                bot_pool[n]['parked'] = ln
+        for n in free:
+            d = bot_pool[n]
+            if d['parked'] is not None:
+                plan[d['port']] = [('leave', {})]
+                d['parked'] = None
+            elif SHRINK_AFTER and not is_standby(n) and now - d['last_used'] > SHRINK_AFTER:
+                plan[d['port']] = [('standby', {})]
+        moving = [d for d in bot_pool.values() if d['port'] in plan]
+        for d in moving:
+            d['busy'] = True
+    if not plan:
+        return
+    results = {}
+    try:
+        results = bots.run(plan)
+    finally:
+        with _command_lock:
+            for d in moving:
+                d['busy'] = False
+                if not results.get(d['port']):
+                    d['parked'] = None
+
+def reload_loops():
+    """Apply edits to the current role's loop file, like a role switch."""
+    if load_loops(role) is LOOPS:
+        return
+    print(f"[CONFIG] loops_{role.upper()}.txt changed")
+    with _command_lock:
+        plan = refresh_state_from_role()
+        if plan:
+            bots.run(plan)
+    publish_status()
+
+def schedule_loop():
+    while True:
+        _sched_wake.wait(SCHEDULE_EVERY)
+        _sched_wake.clear()
+        try:
+            reload_loops()
+            prewarm()
+        except Exception as e:
+            print(f"[SCHEDULER] {e}")
+
+# ------------------------------ STATUS PUSH ------------------------------
+# Each bot pushes its status over /events; we keep the latest report per bot,
+# aggregate them with loop_states, and push only the differences to browsers.
+bot_reports  = {}           # bot name -> last report (None while unreachable)
+ui_events    = EventHub()   # browsers subscribed to /api/events
+watch_bots   = True         # False in --config-only mode (no bots running)
+_watchers    = False
+_status_lock = threading.Lock()
+_last_status = {}
+
+def build_status():
+    counts = {l['name']: 0 for l in LOOPS}
+    talkers = {l['name']: [] for l in LOOPS}    # loop -> names talking now
+    states = {name: st for name, (st, _) in loop_states.items()}
+    for rep in list(bot_reports.values()):
+        if rep:
+            counts.update(rep.get('user_counts', {}))
+            for loop, users in rep.get('speakers', {}).items():
+                if loop in talkers:
+                    talkers[loop] = sorted(set(talkers[loop]) | {
+                        u['name'] for u in users if u['talking']})
+    assignments = {
+        ln: (bot_pool[b]['port'] if b else None)
+        for ln, (_, b) in loop_states.items()
+    }
+    # str keys: the same shape survives the JSON round trip to the browser
+    up = {str(b['port']): bot_reports.get(b['name']) is not None for b in BOTS}
+    return {'user_counts': counts, 'states': states, 'assignments': assignments,
+            'bots': up, 'talkers': talkers}
+
+def publish_status():
+    """Push whatever changed in the aggregated status to every browser."""
+    global _last_status
+    with _status_lock:
+        cur = build_status()
+        diff = {}
+        for section, values in cur.items():
+            old = _last_status.get(section, {})
+            changed = {k: v for k, v in values.items() if k not in old or old[k] != v}
+            if changed:
+                diff[section] = changed
+        _last_status = cur
+    if diff:
+        ui_events.publish(diff)
+
+def watch_bot(bot):
+    """Follow one bot's /events stream, reconnecting whenever it drops."""
+    url = f"http://127.0.0.1:{bot['port']}/events"
+    while True:
+        try:
+            with requests.get(url, stream=True, timeout=(1, 30)) as r:
+                for _, rep in read_sse(r.iter_lines(decode_unicode=True)):
+                    bot_reports[bot['name']] = rep
+                    publish_status()
+        except Exception:
+            pass
+        if bot_reports.get(bot['name']) is not None:
+            bot_reports[bot['name']] = None
+            publish_status()
+        time.sleep(1)
+
+# ------------------------------ LEVEL METERS -----------------------------
+# Each bot streams level frames on /levels: mic, received and sent (peak and
+# rms each), a count of listened loops and their received levels. We keep the
+# latest frame per bot and serve browsers one combined frame per tick:
+# [loop count, mic peak, mic rms] followed by [received peak, received rms,
+# sent peak, sent rms] for every loop in LOOPS order, from the bot assigned
+# to it (zeros when none).
+LEVEL_HZ    = 25
+LEVEL_FRAME = 7             # fixed part of a bot's frame
+bot_levels  = {}            # bot name -> latest frame from its /levels
+
+def watch_levels(bot):
+    url = f"http://127.0.0.1:{bot['port']}/levels"
+    while True:
+        try:
+            with requests.get(url, stream=True, timeout=(1, 5)) as r:
+                while True:
+                    head = r.raw.read(LEVEL_FRAME)
+                    if len(head) < LEVEL_FRAME:
+                        break
+                    tail = r.raw.read(2 * head[6]) if head[6] else b''
+                    bot_levels[bot['name']] = head + tail
+        except Exception:
+            pass
+        bot_levels.pop(bot['name'], None)
+        time.sleep(1)
+
+def levels_frame():
+    loops = LOOPS[:255]
+    mic = next((f[:2] for f in list(bot_levels.values())), b'\0\0')
+    out = bytearray([len(loops)]) + mic
+    for l in loops:
+        _, b = loop_states.get(l['name'], (0, None))
+        f = bot_levels.get(b) if b else None
+        if f and bot_pool[b]['assigned'] != l['name']:
+            # heard through a listener: the bot lists those in name order
+            heard = (bot_reports.get(b) or {}).get('listening', [])
+            i = heard.index(l['name']) if l['name'] in heard else None
+            f = None if i is None else f[7 + 2 * i:9 + 2 * i] + b'\0\0'
+            out += f if f and len(f) == 4 else b'\0\0\0\0'
+        else:
+            out += f[2:6] if f else b'\0\0\0\0'
+    return bytes(out)
+
+# ------------------------------ METRICS ----------------------------------
+def aggregate_metrics(snapshots):
+    """
+    Merge the /metrics.json replies of all bots. Bots sharing one process
+    report the same engine series, so those are kept once per pid. The
+    summary gives one number per metric: the total for counters, the
+    largest value for gauges and the worst recent percentiles for histograms.
+    """
+    merged, seen = {}, set()
+    for snap in snapshots:
+        pid = snap.get('pid')
+        for name, m in snap.get('metrics', {}).items():
+            entry = merged.setdefault(name, {'type': m['type'], 'help': m['help'], 'series': []})
+            for series in m['series']:
+                labels = series['labels']
+                if 'bot' not in labels:
+                    labels = {**labels, 'pid': pid}
+                key = (name, tuple(sorted(labels.items())))
+                if key not in seen:
+                    seen.add(key)
+                    entry['series'].append({**series, 'labels': labels})
+    summary = {}
+    for name, m in merged.items():
+        ser = m['series']
+        if m['type'] == 'counter':
+            summary[name] = sum(x['value'] for x in ser)
+        elif m['type'] == 'gauge':
+            vals = [x['value'] for x in ser if x['value'] == x['value']]   # skip NaN
+            summary[name] = max(vals) if vals else None
+        else:
+            summary[name] = {'count': sum(x['count'] for x in ser)}
+            for q in ('p50', 'p95', 'p99', 'max'):
+                vals = [x[q] for x in ser if q in x]
+                if vals:
+                    summary[name][q] = max(vals)
+    return merged, summary
+
 # ------------------------------ FLASK APP --------------------------------
 app = Flask(__name__)
+# static URLs carry ?v=<mtime> (see static_version), so browsers may keep them
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 365 * 24 * 3600
 
 # Track whether audio delay mode is enabled. When True, bot commands that mute
 # or leave will use delayed variants to allow any buffered audio to finish
 # playing out before the state change takes effect.
 delay_enabled = False
 
+@app.before_request
+def start_watchers():
+    # started lazily so only the serving process (not the reloader) watches
+    global _watchers
+    if watch_bots and not _watchers:
+        _watchers = True
+        for b in BOTS:
+            threading.Thread(target=watch_bot, args=(b,), daemon=True).start()
+            threading.Thread(target=watch_levels, args=(b,), daemon=True).start()
+        threading.Thread(target=schedule_loop, daemon=True).start()
+
 # ------------------------------ TEMPLATES --------------------------------
 MAIN_HTML = r"""
 <!DOCTYPE html>
@@ -72,10 +423,17 @@ MAIN_HTML = r"""
  #grid{display:grid;grid-template-columns:repeat(4,1fr);grid-auto-rows:220px;gap:18px;padding:18px}
  .card{position:relative;background:var(--panel);border-radius:12px;box-shadow:0 0 6px #000a;overflow:hidden}
  .listen{background:var(--listen)} .talk{background:var(--talk)}
+ .down{opacity:.5;outline:2px dashed var(--danger);outline-offset:-2px}
+ .who{position:absolute;top:calc(50% + 1.2em);left:0;right:0;text-align:center;font-size:.8rem;color:#ffd76a;white-space:nowrap;overflow:hidden;text-overflow:ellipsis;padding:0 6px;pointer-events:none}
+ .speaking{box-shadow:0 0 0 2px #ffd76a,0 0 6px #000a}
  .priv{position:absolute;top:8px;left:10px;font-size:1rem}
  .cnt{position:absolute;top:8px;right:10px;font-size:.9rem}
 .name{position:absolute;top:50%;left:50%;transform:translate(-50%,-50%);text-align:center;font-weight:600;padding:0 4px;user-select:none;pointer-events:none}
  .vol{position:absolute;bottom:10px;left:10px;width:55%}
+ .meter{position:absolute;left:10px;right:10px;bottom:38px;height:8px;display:flex;flex-direction:column;gap:2px}
+ .meter i{display:block;height:3px;width:0;background:#8fd18f;border-radius:2px;transition:width 40ms linear}
+ .meter i.tx{background:#ffd76a}
+ .rep{position:absolute;bottom:6px;right:66px;padding:4px 8px;border:none;border-radius:4px;background:#3a3a3a;color:var(--txt)}
  .off{position:absolute;bottom:6px;right:10px;padding:4px 10px;background:var(--danger);border:none;border-radius:4px;color:#fff;font-weight:600}
  #logo{position:fixed;bottom:10px;right:10px;height:60px;opacity:.6}
 </style></head>
@@ -94,14 +452,16 @@ MAIN_HTML = r"""
  const primary = BOTS[0].port;
  let delay=false;
  // ------------- build grid -------------
- function grid(){const g=document.getElementById('grid');g.innerHTML='';LOOPS.forEach((l,i)=>{const c=document.createElement('div');c.dataset.loop=l.name;c.dataset.port='';c.className='card';c.innerHTML=`<span class='priv'>${l.can_listen?'🎧':''}${l.can_talk?'🎤':''}</span><span class='cnt'>👥0</span><div class='name'>${l.name}</div><input type='range' min='0' max='1' step='0.01' value='0.5' class='vol'><button class='off'>OFF</button>`;c.onclick=e=>{if(e.target===c)act('toggle',l.name)};c.querySelector('.off').onclick=e=>{e.stopPropagation();act('off',l.name)};c.querySelector('.vol').oninput=e=>{e.stopPropagation();const p=c.dataset.port||BOTS[i% BOTS.length].port;fetch(`http://127.0.0.1:${p}/set_volume`,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({volume:e.target.value})})};g.append(c);})}
+ function grid(){const g=document.getElementById('grid');g.innerHTML='';LOOPS.forEach((l,i)=>{const c=document.createElement('div');c.dataset.loop=l.name;c.dataset.port='';c.className='card';c.innerHTML=`<span class='priv'>${l.can_listen?'🎧':''}${l.can_talk?'🎤':''}</span><span class='cnt'>👥0</span><div class='name'>${l.name}</div><div class='who'></div><div class='meter'><i class='rx'></i><i class='tx'></i></div><input type='range' min='0' max='1' step='0.01' value='0.5' class='vol'><button class='rep' title='Say again'>↺</button><button class='off'>OFF</button>`;c.onclick=e=>{if(e.target===c)act('toggle',l.name)};c.querySelector('.off').onclick=e=>{e.stopPropagation();act('off',l.name)};c.querySelector('.rep').onclick=e=>{e.stopPropagation();act('replay',l.name)};c.querySelector('.vol').oninput=e=>{e.stopPropagation();const p=c.dataset.port||BOTS[i% BOTS.length].port;fetch(`http://127.0.0.1:${p}/set_volume`,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({volume:e.target.value,loop:l.name})})};g.append(c);})}
  // ------------- device list -------------
  async function devices(){try{const d=await navigator.mediaDevices.enumerateDevices();const iSel=inDev,oSel=outDev;d.filter(x=>x.kind==='audioinput').forEach((d,i)=>iSel.add(new Option(d.label||`Mic ${i}`,d.deviceId)));d.filter(x=>x.kind==='audiooutput').forEach((d,i)=>oSel.add(new Option(d.label||`Spkr ${i}`,d.deviceId)));iSel.onchange=()=>chg('in',iSel.value);oSel.onchange=()=>chg('out',oSel.value);}catch(e){}}
  function chg(t,id){fetch(`http://127.0.0.1:${primary}/device_${t}`,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({device:id})})}
- // ------------- waveform -------------
- async function wave(){try{const stream=await navigator.mediaDevices.getUserMedia({audio:true});const ctx=new(window.AudioContext||window.webkitAudioContext)();const src=ctx.createMediaStreamSource(stream);const analyser=ctx.createAnalyser();analyser.fftSize=256;src.connect(analyser);const data=new Uint8Array(analyser.fftSize);const cvs=document.getElementById('wave');const c=cvs.getContext('2d');const H=cvs.height;const W=cvs.width;(function draw(){requestAnimationFrame(draw);analyser.getByteTimeDomainData(data);c.clearRect(0,0,W,H);c.beginPath();data.forEach((v,i)=>{const x=i*W/data.length;const y=(1-(v-128)/128)*H/2;i?c.lineTo(x,y):c.moveTo(x,y)});c.strokeStyle='#ffffff';c.lineWidth=2;c.stroke();})();}catch(e){console.error(e);}}
+ // ------------- level meters (server-side, /api/levels) -------------
+ const MIC=new Uint8Array(150);
+ function drawLevels(f){const cvs=document.getElementById('wave'),c=cvs.getContext('2d'),W=cvs.width,H=cvs.height;MIC.copyWithin(0,1);MIC[MIC.length-1]=f[1];c.clearRect(0,0,W,H);c.beginPath();MIC.forEach((v,i)=>{const x=i*W/MIC.length,h=v/255*H/2;c.moveTo(x,H/2-h);c.lineTo(x,H/2+h)});c.strokeStyle='#ffffff';c.lineWidth=1;c.stroke();LOOPS.forEach((l,i)=>{const c=document.querySelector(`[data-loop="${l.name}"]`);if(!c||i>=f[0])return;const o=3+4*i,m=c.querySelectorAll('.meter i');m[0].style.width=(f[o]/2.55)+'%';m[1].style.width=(f[o+2]/2.55)+'%'})}
+ async function levels(){for(;;){try{const rd=(await fetch('/api/levels')).body.getReader();let buf=new Uint8Array(0);for(;;){const {value,done}=await rd.read();if(done)break;const b=new Uint8Array(buf.length+value.length);b.set(buf);b.set(value,buf.length);buf=b;while(buf.length&&buf.length>=3+4*buf[0]){const n=3+4*buf[0];drawLevels(buf.subarray(0,n));buf=buf.slice(n)}}}catch(e){}await new Promise(r=>setTimeout(r,1000))}}
  // ------------- actions -------------
- async function act(a,l){const r=await fetch('/api/command',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({action:a,loop:l})});try{const j=await r.json();if('port'in j){const c=document.querySelector(`[data-loop="${l}"]`);if(c)c.dataset.port=j.port||'';}}catch(e){}refresh()}
+ async function act(a,l){const r=await fetch('/api/command',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({action:a,loop:l})});try{const j=await r.json();if('port'in j){const c=document.querySelector(`[data-loop="${l}"]`);if(c)c.dataset.port=j.port||'';}}catch(e){}}
  const dBtn=document.getElementById('delay');
  dBtn.onclick = async () => {
      delay = !delay;
@@ -112,10 +472,14 @@ MAIN_HTML = r"""
          body:JSON.stringify({action:'delay', enabled: delay})
      });
  };
- // ------------- poll -------------
- async function refresh(){const r=await (await fetch('/api/status')).json();LOOPS.forEach(l=>{const c=document.querySelector(`[data-loop="${l.name}"]`);if(!c)return;c.dataset.port=r.assignments[l.name]||'';c.querySelector('.cnt').textContent=`👥${r.user_counts[l.name]||0}`;c.classList.remove('listen','talk');if(r.states[l.name]==1)c.classList.add('listen');if(r.states[l.name]==2)c.classList.add('talk')})}
+ // ------------- status push -------------
+ let S={user_counts:{},states:{},assignments:{},bots:{},talkers:{}};
+ function render(){LOOPS.forEach(l=>{const c=document.querySelector(`[data-loop="${l.name}"]`);if(!c)return;c.dataset.port=S.assignments[l.name]||'';c.querySelector('.cnt').textContent=`👥${S.user_counts[l.name]||0}`;c.classList.remove('listen','talk');if(S.states[l.name]==1)c.classList.add('listen');if(S.states[l.name]==2)c.classList.add('talk');c.classList.toggle('down',!!c.dataset.port&&S.bots[c.dataset.port]===false);const w=S.talkers[l.name]||[];c.querySelector('.who').textContent=w.join(', ');c.classList.toggle('speaking',w.length>0)})}
+ function apply(d,full){if(full)S=d;else for(const k in d)Object.assign(S[k]=S[k]||{},d[k]);render()}
+ async function refresh(){apply(await (await fetch('/api/status')).json(),true)}
+ function subscribe(){const es=new EventSource('/api/events');es.addEventListener('snapshot',e=>apply(JSON.parse(e.data),true));es.onmessage=e=>apply(JSON.parse(e.data),false)}
  // ------------- init -------------
- devices();wave();grid();refresh();setInterval(refresh,1000);
+ devices();grid();refresh();subscribe();levels();
 </script></body></html>
 """
 
@@ -157,14 +521,76 @@ CONFIG_HTML = f"""
 </script></body></html>
 """
 
+# ------------------------------ PAGE CACHE -------------------------------
+# MAIN_HTML is compiled once. The rendered page depends only on the loop set,
+# the bots and the static files, so it is rendered once per combination and
+# then served from memory, gzipped, with an ETag: a console reloading the
+# page gets a 304 without rendering anything.
+MAIN_TEMPLATE  = app.jinja_env.from_string(MAIN_HTML)
+COMPRESSIBLE   = {'text/html', 'text/css', 'text/plain', 'application/json',
+                  'application/javascript', 'image/svg+xml'}
+GZIP_MIN_BYTES = 1024
+_pages = {}                 # etag -> (html, gzipped html)
+
+@app.url_defaults
+def static_version(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        try:
+            values['v'] = int(os.stat(os.path.join(app.static_folder, values['filename'])).st_mtime)
+        except OSError:
+            pass
+
+def cached_page(template, **context):
+    """(etag, html, gzipped html) for template rendered with context."""
+    static = max((e.stat().st_mtime for e in os.scandir(app.static_folder)), default=0)
+    key = json.dumps([context, static], sort_keys=True, default=str)
+    etag = hashlib.sha1(key.encode()).hexdigest()[:20]
+    if etag not in _pages:
+        html = template.render(url_for=url_for, **context).encode()
+        _pages[etag] = (html, gzip.compress(html))
+    return (etag, *_pages[etag])
+
+def page_response(etag, html, gz):
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    elif gz is not None and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        resp = Response(gz, mimetype='text/html')
+        resp.headers['Content-Encoding'] = 'gzip'
+    else:
+        resp = Response(html, mimetype='text/html')
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'no-cache'     # always revalidate
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+@app.after_request
+def compress(resp):
+    """gzip ordinary text replies; streams (SSE, levels) pass untouched."""
+    if (resp.direct_passthrough or resp.is_streamed or resp.status_code != 200
+            or 'Content-Encoding' in resp.headers
+            or resp.mimetype not in COMPRESSIBLE
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return resp
+    body = resp.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return resp
+    resp.set_data(gzip.compress(body))
+    resp.headers['Content-Encoding'] = 'gzip'
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+CONFIG_PAGE = CONFIG_HTML.encode()
+CONFIG_ETAG = hashlib.sha1(CONFIG_PAGE).hexdigest()[:20]
+CONFIG_GZ   = gzip.compress(CONFIG_PAGE)
+
 # ------------------------------ ROUTES -----------------------------------
 @app.route('/')
 def main_page():
-    return render_template_string(MAIN_HTML, loops=LOOPS, bots=BOTS)
+    return page_response(*cached_page(MAIN_TEMPLATE, loops=LOOPS, bots=BOTS))
 
 @app.route('/config')
 def cfg_page():
-    return render_template_string(CONFIG_HTML)
+    return page_response(CONFIG_ETAG, CONFIG_PAGE, CONFIG_GZ)
 
 @app.route('/api/get_config')
 def api_get_config():
@@ -176,71 +602,108 @@ def api_save_config():
     write_config(**cfg)
         # Update globals so the UI reflects the new role immediately
     global config, role
-    config = cfg
-    role   = cfg.get("role", role)
-    requests.post("http://127.0.0.1:6001/leave")
-    requests.post("http://127.0.0.1:6002/leave")
-    requests.post("http://127.0.0.1:6003/leave")
-    bot_pool["BOT1"]['assigned'] = None
-    bot_pool["BOT1"]['last_used'] = time.time()
-    bot_pool["BOT2"]['assigned'] = None
-    bot_pool["BOT2"]['last_used'] = time.time()
-    bot_pool["BOT3"]['assigned'] = None
-    bot_pool["BOT3"]['last_used'] = time.time()
-    refresh_state_from_role()
+    config = read_config() or cfg
+    with _command_lock:
+        role = cfg.get("role", role)
+        plan = refresh_state_from_role()
+        if plan:
+            bots.run(plan)
+    publish_status()
+    _sched_wake.set()       # re-park spares for the new role's loops
     return '', 204
 
 @app.route('/api/status')
 def status_api():
-    counts = {l['name']: 0 for l in LOOPS}
-    states = {name: st for name, (st, _) in loop_states.items()}
-    for bot in BOTS:
-        try:
-            res = requests.get(
-                f"http://127.0.0.1:{bot['port']}/status", timeout=0.5
-            ).json()
-            counts.update(res.get('user_counts', {}))
-            for ln, st in res.get('states', {}).items():
-                states[ln] = st
-        except Exception:
-            pass
-    assignments = {
-        ln: (bot_pool[b]['port'] if b else None)
-        for ln, (_, b) in loop_states.items()
-    }
-    return jsonify(user_counts=counts, states=states, assignments=assignments)
+    return jsonify(build_status())
+
+@app.route('/api/levels')
+def levels_api():
+    """Binary meter stream for the browser; see levels_frame()."""
+    def frames():
+        while True:
+            yield levels_frame()
+            time.sleep(1.0 / LEVEL_HZ)
+    return Response(frames(), mimetype='application/octet-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/metrics')
+def metrics_api():
+    """Pipeline metrics from every bot, merged; see aggregate_metrics()."""
+    replies = bots.get_all([b['port'] for b in BOTS], 'metrics.json')
+    merged, summary = aggregate_metrics(r for r in replies.values() if r)
+    return jsonify(summary=summary, metrics=merged, scheduler=sched_stats,
+                   unreachable=[p for p, r in replies.items() if not r])
+
+@app.route('/api/events')
+def events_api():
+    """Server-Sent Events: a full snapshot, then status diffs as they happen."""
+    return Response(ui_events.stream(build_status),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/reapply', methods=['POST'])
+def reapply_api():
+    """
+    Re-send the current loop assignments to restarted bots. Called by the
+    start_all.py supervisor with {"ports": [...]} once they are ready again.
+    """
+    ports = set((request.get_json(silent=True) or {}).get('ports', []))
+    with _command_lock:
+        plan = {}
+        for b in bot_pool.values():
+            if b['port'] not in ports:
+                continue
+            b['parked'] = None      # a restarted bot is in Root; re-parked later
+            ops = [('delay', {'enabled': delay_enabled})]
+            if b['assigned']:
+                st, _ = loop_states.get(b['assigned'], (0, None))
+                ops += [('join', {'loop': b['assigned'],
+                                  'priority': loop_priority(b['assigned'])}),
+                        ('talk' if st == 2 else 'mute', {})]
+            ops += [('listen', {'loop': ln, 'priority': loop_priority(ln)})
+                    for ln in listened_loops(b['name'])]
+            plan[b['port']] = ops
+        results = bots.run(plan)
+    for port, ok in results.items():
+        print(f"[REAPPLY] :{port} {'restored' if ok else 'failed'}")
+    return jsonify(results={str(p): ok for p, ok in results.items()})
 
 @app.route('/api/command', methods=['POST'])
 def command_api():
-    data = request.get_json(force=True)
+    with _command_lock:
+        resp = run_command(request.get_json(force=True))
+    publish_status()
+    _sched_wake.set()       # replace a spare that was just used
+    return resp
+
+def run_command(data):
     act = data.get('action')
     loop = data.get('loop')
     if act == 'delay':
         global delay_enabled
         delay_enabled = bool(data.get('enabled'))
-        for b in bot_pool.values():
-            path = 'delay_on' if delay_enabled else 'delay_off'
-            try:
-                # send an empty JSON body so bot_server doesn't crash when
-                # accessing request.json
-                requests.post(
-                    f"http://127.0.0.1:{b['port']}/{path}", json={}
-                )
-            except Exception:
-                pass
+        path = 'delay_on' if delay_enabled else 'delay_off'
+        bots.run({b['port']: [(path, {})] for b in bot_pool.values()})
         return '', 204
 
     old_state, old_bot = loop_states.get(loop, (0, None))
+    if act == 'replay':
+        # say again: the bot hearing the loop plays back what it just heard
+        if not old_bot:
+            return jsonify(seconds=0)
+        p = bot_pool[old_bot]['port']
+        reply = bots.post(p, 'replay', {'loop': loop, 'speed': REPLAY_SPEED})
+        return jsonify(seconds=(reply or {}).get('seconds', 0))
+
     if act == 'off':
-        if old_bot:
+        if old_bot and old_bot == LISTEN_HUB:
+            bots.run({bot_pool[old_bot]['port']: [('unlisten', {'loop': loop})]})
+        elif old_bot:
             p = bot_pool[old_bot]['port']
             if delay_enabled:
-                requests.post(
-                    f"http://127.0.0.1:{p}/leave_after_delay", json={}
-                )
+                bots.run({p: [('leave_after_delay', {})]})
             else:
-                requests.post(f"http://127.0.0.1:{p}/leave")
-                requests.post(f"http://127.0.0.1:{p}/mute")
+                bots.run({p: [('leave', {}), ('mute', {})]})
             bot_pool[old_bot]['assigned'] = None
             bot_pool[old_bot]['last_used'] = time.time()
         loop_states[loop] = (0, None)
@@ -251,43 +714,67 @@ def command_api():
     if not cfg.get('can_listen'):
         return '', 204
 
-    assigned = old_bot or find_idle_bot()
+    if old_state == 0:
+        note_use(loop)
+    if new_state == 1 and LISTEN_HUB and old_bot in (None, LISTEN_HUB):
+        port = bot_pool[LISTEN_HUB]['port']
+        if not bots.run({port: [('listen', {'loop': loop,
+                                            'priority': loop_priority(loop)})]}).get(port):
+            return jsonify(port=None)
+        loop_states[loop] = (1, LISTEN_HUB)
+        return jsonify(port=port)
+
+    # talking needs a bot joined to the loop, not the listener hub
+    assigned = (old_bot if old_bot != LISTEN_HUB else None) or find_idle_bot(loop)
+    if not assigned:
+        assigned = preempt(loop)
     if not assigned:
         return jsonify(port=None)
+    if bot_pool[assigned]['assigned'] is None:
+        warm = bot_pool[assigned]['parked'] == loop
+        sched_stats['warm_hits' if warm else 'cold_starts'] += 1
+    bot_pool[assigned]['parked'] = None
     port = bot_pool[assigned]['port']
+    mute = 'mute_after_delay' if delay_enabled else 'mute'
 
     if new_state == 1:
-        requests.post(f"http://127.0.0.1:{port}/join", json={'loop': loop})
-        if delay_enabled and old_state == 2:
-            requests.post(f"http://127.0.0.1:{port}/mute_after_delay", json={})
-        else:
-            requests.post(f"http://127.0.0.1:{port}/mute")
+        bots.run({port: [
+            ('join', {'loop': loop, 'priority': loop_priority(loop)}),
+            (mute if old_state == 2 else 'mute', {}),
+        ]})
     elif new_state == 2:
+        # Mute every other talk loop while this bot joins, all in parallel;
+        # only then open the mic, so two loops are never live at once.
+        plan = {port: [('join', {'loop': loop, 'priority': loop_priority(loop)})]}
+        if old_bot and old_bot == LISTEN_HUB:
+            plan[bot_pool[old_bot]['port']] = [('unlisten', {'loop': loop})]
         for other, (st, ob) in loop_states.items():
             if st == 2 and ob:
-                op = bot_pool[ob]['port']
-                if delay_enabled:
-                    requests.post(f"http://127.0.0.1:{op}/mute_after_delay", json={})
-                else:
-                    requests.post(f"http://127.0.0.1:{op}/mute")
+                plan.setdefault(bot_pool[ob]['port'], []).append((mute, {}))
                 loop_states[other] = (1, ob)
-        requests.post(f"http://127.0.0.1:{port}/join", json={'loop': loop})
-        requests.post(f"http://127.0.0.1:{port}/talk")
+        if not (bots.run(plan).get(port) and bots.run({port: [('talk', {})]}).get(port)):
+            new_state = 1       # the bot refused to talk; it is listening, muted
 
     bot_pool[assigned]['assigned'] = loop
     bot_pool[assigned]['last_used'] = time.time()
     loop_states[loop] = (new_state, assigned)
     return jsonify(port=port)
 
-
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--port', type=int, default=8080)
     parser.add_argument('--config-only', action='store_true')
+    parser.add_argument('--debug', action='store_true',
+                        help='Flask debug server with the reloader, for development')
     args = parser.parse_args()
     if args.config_only:
+        watch_bots = False
         print(f"Running in config-only mode – open http://127.0.0.1:{args.port}/config to set up.")
+    if args.debug:
         app.run(port=args.port, debug=True)
     else:
-        app.run(port=args.port, debug=True)
+        # one thread per connection: every open console holds two long-lived
+        # streams (/api/events, /api/levels), which would pin a fixed pool
+        from werkzeug.serving import make_server
+        make_server('127.0.0.1', args.port, app, threaded=True).serve_forever()